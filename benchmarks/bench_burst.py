@@ -0,0 +1,111 @@
+"""
+Sends bursts of identical concurrent requests (operators opening the dashboard at the same moment) to one process
+and counts the container listings that actually reach the fake daemon, with the single-flight metrics.
+
+    python -m benchmarks.bench_burst [--concurrency 20] [--bursts 5] [--containers 200] [--latency-ms 5]
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from typing import Dict, List
+
+from benchmarks.environment import USERNAME, BenchmarkEnvironment
+from benchmarks.fake_daemon import FakeDockerDaemon
+
+PATHS = ["/docker/managed_containers", "/docker/standalone_containers", "/api/inventory/containers"]
+
+
+def burst(client_factory, path: str, concurrency: int) -> List[float]:
+    barrier = threading.Barrier(concurrency)
+    durations = []
+
+    def operator():
+        client = client_factory()
+        barrier.wait()
+        start = time.perf_counter()
+        response = client.get(path)
+        durations.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {path} returned {response.status_code}")
+
+    threads = [threading.Thread(target=operator) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return durations
+
+
+def run(concurrency: int, bursts: int, containers: int, latency: float) -> List[Dict]:
+    environment = BenchmarkEnvironment().activate()
+    from django.contrib.auth.models import User
+    from django.test import Client
+
+    from control_center.apps.delegate.single_flight import single_flight_group
+
+    user = User.objects.get(username=USERNAME)
+
+    def client_factory():
+        client = Client()
+        client.force_login(user)
+        return client
+
+    results = []
+    with FakeDockerDaemon(environment.socket_path, latency=latency, containers=containers) as daemon:
+        client_factory().get(PATHS[0])
+        for path in PATHS:
+            daemon.reset_calls()
+            before = single_flight_group.metrics()
+            durations = []
+            for _ in range(bursts):
+                durations += burst(client_factory, path, concurrency)
+            calls = daemon.reset_calls()
+            after = single_flight_group.metrics()
+            coalesced = sum(
+                metrics["coalesced"] - before.get(name, {}).get("coalesced", 0) for name, metrics in after.items()
+            )
+            results.append(
+                {
+                    "path": path,
+                    "requests": concurrency * bursts,
+                    "listings": calls["GET /containers/json"],
+                    "api_calls": sum(calls.values()),
+                    "coalesced": coalesced,
+                    "mean_ms": sum(durations) / len(durations) * 1000,
+                }
+            )
+    os.remove(environment.socket_path)
+    return results
+
+
+def report(results: List[Dict]):
+    header = f"{'path':<32}{'requests':>10}{'listings':>10}{'api calls':>11}{'coalesced':>11}{'mean ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result['path']:<32}{result['requests']:>10}{result['listings']:>10}{result['api_calls']:>11}"
+            f"{result['coalesced']:>11}{result['mean_ms']:>10.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=20, help="simultaneous requests per burst")
+    parser.add_argument("--bursts", type=int, default=5, help="bursts per page")
+    parser.add_argument("--containers", type=int, default=200, help="containers held by the fake daemon")
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="latency injected in every daemon call")
+    parser.add_argument("--json", help="also write the results to this file")
+    arguments = parser.parse_args()
+    results = run(arguments.concurrency, arguments.bursts, arguments.containers, arguments.latency_ms / 1000)
+    report(results)
+    if arguments.json:
+        with open(arguments.json, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
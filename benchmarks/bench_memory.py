@@ -0,0 +1,74 @@
+"""
+Measures the memory held by the container records of one full listing (what every page and API request builds)
+and the time the garbage collector spends on them, against a fake daemon holding 5000 containers.
+
+    python -m benchmarks.bench_memory [--containers 5000]
+"""
+
+import argparse
+import gc
+import json
+import os
+import time
+import tracemalloc
+from typing import Dict
+
+from benchmarks.environment import BenchmarkEnvironment
+from benchmarks.fake_daemon import FakeDockerDaemon
+
+
+def run(containers: int, services: int) -> Dict:
+    environment = BenchmarkEnvironment(services=services).activate()
+    from control_center.apps.delegate import docker
+
+    with FakeDockerDaemon(environment.socket_path, containers=containers, images=services + 1, services=services):
+        docker.compose_config()
+        # warm-up: imports, connection pool and caches are not part of the measure
+        docker.all_containers()
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        records = docker.all_containers()
+        listing_seconds = time.perf_counter() - start
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        start = time.perf_counter()
+        gc.collect()
+        gc_seconds = time.perf_counter() - start
+    os.remove(environment.socket_path)
+    return {
+        "containers": len(records),
+        "listing_ms": listing_seconds * 1000,
+        "retained_bytes": retained,
+        "retained_bytes_per_container": retained / len(records),
+        "peak_bytes": peak,
+        "gc_ms": gc_seconds * 1000,
+        "gc_tracked_objects": len(gc.get_objects()),
+    }
+
+
+def report(result: Dict):
+    print(f"containers                    {result['containers']:>12}")
+    print(f"listing                       {result['listing_ms']:>12.1f} ms")
+    print(f"retained after the listing    {result['retained_bytes'] / 1024 / 1024:>12.2f} MiB")
+    print(f"retained per container        {result['retained_bytes_per_container']:>12.0f} bytes")
+    print(f"peak during the listing       {result['peak_bytes'] / 1024 / 1024:>12.2f} MiB")
+    print(f"full garbage collection       {result['gc_ms']:>12.1f} ms")
+    print(f"objects tracked by the gc     {result['gc_tracked_objects']:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--containers", type=int, default=5000, help="containers held by the fake daemon")
+    parser.add_argument("--services", type=int, default=10, help="services in the managed compose project")
+    parser.add_argument("--json", help="also write the results to this file")
+    arguments = parser.parse_args()
+    result = run(arguments.containers, arguments.services)
+    report(result)
+    if arguments.json:
+        with open(arguments.json, "w") as output:
+            json.dump(result, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
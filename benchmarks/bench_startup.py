@@ -0,0 +1,49 @@
+"""
+Measures the startup of a worker process: importing control_center.wsgi creates the application and runs the
+startup preparation (django setup, url configuration, docker login, compose configuration and permission sync).
+
+    python -m benchmarks.bench_startup [--runs 5] [--services 10] [--compose-delay 0.2]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from benchmarks.environment import REPOSITORY_DIR, BenchmarkEnvironment
+from benchmarks.fake_daemon import FakeDockerDaemon
+
+STARTUP_SCRIPT = (
+    "import json, control_center.wsgi; from control_center.startup import startup_report; "
+    "print(json.dumps(startup_report))"
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--services", type=int, default=10)
+    parser.add_argument("--compose-delay", type=float, default=0.0, help="delay of every stub docker compose command")
+    arguments = parser.parse_args()
+    environment = BenchmarkEnvironment(services=arguments.services).activate()
+    env = {**os.environ, **environment.environment_variables(), "FAKE_COMPOSE_DELAY": str(arguments.compose_delay)}
+    steps, wall_times = defaultdict(list), []
+    with FakeDockerDaemon(environment.socket_path, containers=10, services=arguments.services):
+        for _ in range(arguments.runs):
+            start = time.perf_counter()
+            output = subprocess.check_output([sys.executable, "-c", STARTUP_SCRIPT], cwd=REPOSITORY_DIR, env=env)
+            wall_times.append(time.perf_counter() - start)
+            for step, duration in json.loads(output.splitlines()[-1]).items():
+                steps[step].append(duration)
+    print(f"{'step':<24}{'mean s':>10}")
+    print("-" * 34)
+    for step, durations in steps.items():
+        print(f"{step:<24}{sum(durations) / len(durations):>10.3f}")
+    print(f"{'process wall time':<24}{sum(wall_times) / len(wall_times):>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Measures the derived state of the managed project at high replica counts: building the project from an
+already listed set of containers, evaluating what the templates ask for (can_be_*, status, allowed actions)
+and rendering the project table.
+
+    python -m benchmarks.bench_state [--replicas 10 100 1000] [--services 4] [--iterations 20]
+"""
+
+import argparse
+import json
+import os
+import time
+from typing import Dict, List
+
+from benchmarks.bench_views import percentile
+from benchmarks.environment import PROJECT_NAME, USERNAME, BenchmarkEnvironment
+from benchmarks.fake_daemon import FakeDockerDaemon
+
+SERVICE_METHODS = [
+    "can_be_upped",
+    "can_be_stopped",
+    "can_be_started",
+    "can_be_restarted",
+    "can_be_removed",
+    "can_be_updated",
+    "can_be_rolled_back",
+    "config_image_display",
+    "status",
+    "allowed_actions",
+]
+PROJECT_METHODS = ["can_be_upped", "can_be_downed", "can_be_restarted", "can_be_removed", "status", "allowed_actions"]
+
+
+def derive(config, containers):
+    from control_center.apps.delegate.objects import ComposeProject
+
+    project = ComposeProject(project_name=PROJECT_NAME, project_config=config, containers=containers)
+    for method in PROJECT_METHODS:
+        getattr(project, method)()
+    for service in project.services:
+        for method in SERVICE_METHODS:
+            getattr(service, method)()
+    return project
+
+
+def timed(function, iterations: int) -> Dict:
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return {
+        "mean_ms": sum(durations) / iterations * 1000,
+        "p50_ms": percentile(durations, 50) * 1000,
+        "p95_ms": percentile(durations, 95) * 1000,
+    }
+
+
+def run(replica_counts: List[int], services: int, iterations: int) -> List[Dict]:
+    environment = BenchmarkEnvironment(services=services).activate()
+    from django.contrib.auth.context_processors import PermWrapper
+    from django.contrib.auth.models import User
+    from django.template.loader import render_to_string
+
+    from control_center.apps.delegate import docker, hosts
+
+    perms = PermWrapper(User.objects.get(username=USERNAME))
+    results = []
+    for replicas in replica_counts:
+        # every container belongs to the managed project
+        daemon = FakeDockerDaemon(
+            environment.socket_path,
+            containers=replicas * services,
+            services=services,
+            managed_share=1.0,
+            other_share=0.0,
+        )
+        with daemon:
+            config = docker.compose_config()
+            containers = docker.containers_for_project(project_name=PROJECT_NAME)
+            daemon.reset_calls()
+            derived = timed(lambda: derive(config, containers), iterations)
+            project = derive(config, containers)
+            rendered = timed(
+                lambda: render_to_string(
+                    "compose_ui/snippets/projects_table.html", {"project_list": [project], "perms": perms}
+                ),
+                iterations,
+            )
+            if sum(daemon.reset_calls().values()):
+                raise RuntimeError("deriving the project state should not call the docker daemon")
+            if len(containers) != replicas * services:
+                raise RuntimeError(f"{len(containers)} containers listed instead of {replicas * services}")
+        os.remove(environment.socket_path)
+        # the pooled connections are still open on the daemon of this count
+        hosts.reset()
+        results.append({"step": "derive", "replicas": replicas, "services": services, **derived})
+        results.append({"step": "render", "replicas": replicas, "services": services, **rendered})
+    return results
+
+
+def report(results: List[Dict]):
+    header = f"{'step':<10}{'replicas':>10}{'services':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result['step']:<10}{result['replicas']:>10}{result['services']:>10}{result['mean_ms']:>10.2f}"
+            f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--replicas", type=int, nargs="+", default=[10, 100, 1000], help="containers per service")
+    parser.add_argument("--services", type=int, default=4, help="services in the managed compose project")
+    parser.add_argument("--iterations", type=int, default=20, help="repetitions per step and replica count")
+    parser.add_argument("--json", help="also write the results to this file")
+    arguments = parser.parse_args()
+    results = run(arguments.replicas, arguments.services, arguments.iterations)
+    report(results)
+    if arguments.json:
+        with open(arguments.json, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Measures the latency and the number of docker daemon / docker CLI calls of the main pages and API endpoints
+against a fake daemon holding 10, 100 and 1000 containers.
+
+    python -m benchmarks.bench_views [--sizes 10 100 1000] [--iterations 5] [--latency-ms 0] [--json results.json]
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+from typing import Dict, List
+
+from benchmarks.environment import PROJECT_NAME, USERNAME, BenchmarkEnvironment
+from benchmarks.fake_daemon import FakeDockerDaemon, container_id
+
+SERVICE = "service000"
+TARGETS = [
+    ("managed_containers", "/docker/managed_containers"),
+    ("other_project_containers", "/docker/other_project_containers"),
+    ("standalone_containers", "/docker/standalone_containers"),
+    ("service_fragment", f"/docker/project/{PROJECT_NAME}/service/{SERVICE}/fragment"),
+    ("container_fragment", f"/docker/container/{container_id(0)}/fragment"),
+    ("service_logs", f"/docker/project/{PROJECT_NAME}/service/{SERVICE}/logs?lines=100"),
+    ("container_logs", f"/docker/container/{container_id(0)}/logs?lines=100"),
+    ("api compose_config", "/api/compose_config/"),
+    ("api service_logs", f"/api/project/{PROJECT_NAME}/service/{SERVICE}/logs?lines=100"),
+    ("api container_logs", f"/api/container/{container_id(0)}/logs?lines=100"),
+    ("api service_logo", f"/api/project/{PROJECT_NAME}/service/{SERVICE}/logo"),
+    ("api inventory projects", "/api/inventory/projects"),
+    ("api inventory services", "/api/inventory/services"),
+    ("api inventory containers", "/api/inventory/containers?limit=1000"),
+]
+
+
+def percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(percent / 100 * len(ordered)) - 1))]
+
+
+def measure(client, daemon: FakeDockerDaemon, environment: BenchmarkEnvironment, path: str, iterations: int) -> Dict:
+    # warm-up request, loads the compose config on first use
+    client.get(path)
+    daemon.reset_calls()
+    environment.compose_calls()
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        response = client.get(path)
+        durations.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {path} returned {response.status_code}")
+    calls = daemon.reset_calls()
+    return {
+        "mean_ms": sum(durations) / iterations * 1000,
+        "p50_ms": percentile(durations, 50) * 1000,
+        "p95_ms": percentile(durations, 95) * 1000,
+        "api_calls": sum(calls.values()) / iterations,
+        "compose_calls": environment.compose_calls() / iterations,
+        "calls_by_endpoint": {call: count / iterations for call, count in calls.most_common()},
+    }
+
+
+def run(sizes: List[int], iterations: int, latency: float, images: int, services: int) -> List[Dict]:
+    environment = BenchmarkEnvironment(services=services).activate()
+    from django.contrib.auth.models import User
+    from django.test import Client
+
+    from control_center.apps.delegate import hosts
+
+    client = Client()
+    client.force_login(User.objects.get(username=USERNAME))
+    results = []
+    for size in sizes:
+        daemon = FakeDockerDaemon(
+            environment.socket_path, latency=latency, containers=size, images=images or size, services=services
+        )
+        with daemon:
+            size_results = []
+            for name, path in TARGETS:
+                result = measure(client, daemon, environment, path, iterations)
+                size_results.append({"target": name, "containers": size, **result})
+            if not sum(result["api_calls"] for result in size_results):
+                raise RuntimeError(f"the daemon with {size} containers wasn't called, a previous one was measured")
+            results.extend(size_results)
+        os.remove(environment.socket_path)
+        # the pooled connections are still open on the daemon of this size
+        hosts.reset()
+    return results
+
+
+def report(results: List[Dict]):
+    header = (
+        f"{'target':<28}{'containers':>11}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'api calls':>11}{'compose':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result['target']:<28}{result['containers']:>11}{result['mean_ms']:>10.1f}{result['p50_ms']:>10.1f}"
+            f"{result['p95_ms']:>10.1f}{result['api_calls']:>11.1f}{result['compose_calls']:>9.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="container counts")
+    parser.add_argument("--iterations", type=int, default=5, help="requests per target and size")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="latency injected in every daemon call")
+    parser.add_argument("--images", type=int, default=0, help="image count (defaults to the container count)")
+    parser.add_argument("--services", type=int, default=10, help="services in the managed compose project")
+    parser.add_argument("--json", help="also write the results to this file")
+    arguments = parser.parse_args()
+    results = run(
+        arguments.sizes, arguments.iterations, arguments.latency_ms / 1000, arguments.images, arguments.services
+    )
+    report(results)
+    if arguments.json:
+        with open(arguments.json, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Builds a throw-away control center installation for the benchmarks:
+a config package with settings, a generated compose project, a sqlite database
+with a superuser and environment variables pointing docker at the fake daemon and stub CLI.
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import List
+
+import yaml
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+REPOSITORY_DIR = BENCHMARKS_DIR.parent
+PROJECT_NAME = "bench"
+USERNAME = "benchmark"
+PASSWORD = "benchmark-password"
+
+SETTINGS_TEMPLATE = """
+import os
+
+SECRET_KEY = "benchmark-secret-key"
+DEBUG = False
+ALLOWED_HOSTS = ["*"]
+DATABASES = {{"default": {{"ENGINE": "django.db.backends.sqlite3", "NAME": {database!r}}}}}
+STATIC_ROOT = {static_root!r}
+LOGGING = {{
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {{"console": {{"class": "logging.StreamHandler"}}}},
+    "loggers": {{"control_center": {{"level": "WARNING", "handlers": ["console"]}}}},
+}}
+EXTRA_DOCKER_COMPOSE_COMMAND = None
+{extra}
+"""
+
+# 1x1 transparent png
+LOGO = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000105fe02fea70000000049454e44ae426082"
+)
+
+
+class BenchmarkEnvironment(object):
+    def __init__(self, services: int = 10, extra_settings: str = "", root: str = None):
+        self.services = services
+        self.root = Path(root or tempfile.mkdtemp(prefix="dcc-bench-"))
+        self.config_dir = self.root / "config"
+        self.project_dir = self.root / "compose" / PROJECT_NAME
+        self.compose_file = self.project_dir / "docker-compose.yml"
+        self.socket_path = str(self.root / "docker.sock")
+        self.call_log = str(self.root / "compose_calls.log")
+        self.extra_settings = extra_settings
+
+    @property
+    def service_names(self) -> List[str]:
+        return [f"service{index:03d}" for index in range(self.services)]
+
+    def write_files(self):
+        self.config_dir.mkdir(parents=True, exist_ok=True)
+        self.project_dir.mkdir(parents=True, exist_ok=True)
+        (self.root / "static").mkdir(exist_ok=True)
+        (self.config_dir / "__init__.py").write_text("")
+        (self.config_dir / "settings.py").write_text(
+            SETTINGS_TEMPLATE.format(
+                database=str(self.root / "control_center.sqlite3"),
+                static_root=str(self.root / "static"),
+                extra=self.extra_settings,
+            )
+        )
+        services = {name: {"image": f"{PROJECT_NAME}/{name}:latest"} for name in self.service_names}
+        self.compose_file.write_text(yaml.safe_dump({"services": services}))
+        (self.project_dir / "logo.png").write_bytes(LOGO)
+        (self.project_dir / "docker-compose.ini").write_text(
+            "".join(f"[{name}]\nlogo = logo.png\n\n" for name in self.service_names)
+        )
+
+    def environment_variables(self) -> dict:
+        return {
+            "DJANGO_SETTINGS_MODULE": "control_center.base_settings",
+            "DOCKER_COMPOSE_YML_PATH": str(self.compose_file),
+            "DOCKER_HOST": "unix://" + self.socket_path,
+            "PATH": str(BENCHMARKS_DIR / "bin") + os.pathsep + os.environ.get("PATH", ""),
+            "PYTHONPATH": os.pathsep.join([str(self.root), str(REPOSITORY_DIR)]),
+            "FAKE_COMPOSE_PYTHON": sys.executable,
+            "FAKE_COMPOSE_CALL_LOG": self.call_log,
+        }
+
+    def activate(self):
+        """Configures the current process and sets up django with a migrated database and a superuser."""
+        self.write_files()
+        os.environ.update(self.environment_variables())
+        for path in (str(REPOSITORY_DIR), str(self.root)):
+            if path not in sys.path:
+                sys.path.insert(0, path)
+        import django
+        from django.core.management import call_command
+
+        django.setup()
+        call_command("migrate", verbosity=0)
+        from django.contrib.auth.models import User
+
+        if not User.objects.filter(username=USERNAME).exists():
+            User.objects.create_superuser(USERNAME, "benchmark@localhost", PASSWORD, first_name="Benchmark")
+        return self
+
+    def compose_calls(self) -> int:
+        """Returns the number of stub docker CLI invocations since the last call and resets the count."""
+        if not os.path.exists(self.call_log):
+            return 0
+        with open(self.call_log) as log:
+            count = sum(1 for _ in log)
+        os.remove(self.call_log)
+        return count
@@ -0,0 +1,82 @@
+"""
+Stand-in for the `docker` command line used by the benchmarks.
+
+Only the sub-commands the control center runs are implemented (`docker login` and
+`docker compose config|logs|pull|up|...`). Every invocation is appended to the file
+named by FAKE_COMPOSE_CALL_LOG so the harness can count subprocess calls.
+
+Slow commands can be simulated with FAKE_COMPOSE_DELAY (seconds, applied to every compose command)
+and FAKE_COMPOSE_DELAYS (per command, for example "up=2,pull=1.5,restart=0.5").
+"""
+
+import hashlib
+import os
+import sys
+import time
+from typing import List
+
+import yaml
+
+LOG_TIMESTAMP = "2024-01-01T00:00:00.000000000Z"
+
+
+def service_hash(project_name: str, service_name: str) -> str:
+    # shared with the fake daemon so that generated containers are in sync with the compose file
+    return hashlib.sha256(f"{project_name}/{service_name}".encode()).hexdigest()
+
+
+def record_call(args: List[str]):
+    call_log = os.getenv("FAKE_COMPOSE_CALL_LOG")
+    if call_log:
+        with open(call_log, "a") as log:
+            log.write(" ".join(args) + "\n")
+
+
+def command_delay(command: str) -> float:
+    delays = dict(item.split("=") for item in os.getenv("FAKE_COMPOSE_DELAYS", "").split(",") if item.count("=") == 1)
+    return float(delays.get(command, os.getenv("FAKE_COMPOSE_DELAY", 0)))
+
+
+def compose(args: List[str]) -> int:
+    compose_file, project_name = None, None
+    while args and args[0].startswith("--"):
+        option = args.pop(0)
+        if option == "--file":
+            compose_file = args.pop(0)
+        elif option == "--project-name":
+            project_name = args.pop(0)
+    if not args:
+        return 1
+    command, args = args[0], args[1:]
+    time.sleep(command_delay(command))
+    if command == "config":
+        with open(compose_file) as stream:
+            content = stream.read()
+        if "--hash=*" in args:
+            services = (yaml.safe_load(content) or {}).get("services", {})
+            sys.stdout.write("".join(f"{name} {service_hash(project_name, name)}\n" for name in services))
+        else:
+            if yaml.safe_load(content) is None:
+                sys.stdout.write("empty compose file\n")
+                return 1
+            sys.stdout.write(content)
+    elif command == "logs":
+        tail = next((int(arg.split("=")[1]) for arg in args if arg.startswith("--tail=")), 100)
+        service_name = args[-1]
+        sys.stdout.write(f"Attaching to {project_name}-{service_name}-1\n")
+        sys.stdout.writelines(
+            f"{project_name}-{service_name}-1  | {LOG_TIMESTAMP} log line {line}\n" for line in range(tail)
+        )
+    return 0
+
+
+def main(argv: List[str]) -> int:
+    record_call(argv)
+    if argv and argv[0] == "compose":
+        return compose(list(argv[1:]))
+    # "docker login" and anything else succeed silently
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
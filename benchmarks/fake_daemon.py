@@ -0,0 +1,597 @@
+"""
+A fake Docker Engine API listening on a unix socket.
+
+It implements the subset of endpoints docker-py uses for the control center, serves a generated
+set of containers and images, can inject a fixed latency in every call and counts the calls it
+receives so benchmarks can report how many daemon round-trips a page costs.
+
+It can also run on its own, for benchmarks driving separate server processes:
+
+    python -m benchmarks.fake_daemon --socket /tmp/docker.sock --containers 100 [--latency-ms 1]
+
+The call counts are printed as json on stdout when the process is interrupted or terminated.
+"""
+
+import argparse
+import json
+import os
+import re
+import signal
+import socketserver
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.fake_compose import LOG_TIMESTAMP, service_hash
+
+API_VERSION = "1.45"
+NEVER_STARTED = "0001-01-01T00:00:00Z"
+OTHER_PROJECTS = 5
+
+
+def image_id(index: int) -> str:
+    return "sha256:" + f"{index:064x}"
+
+
+def container_id(index: int) -> str:
+    return f"{index + 1:064x}"
+
+
+class FakeDockerState(object):
+    def __init__(
+        self,
+        containers: int = 10,
+        images: int = 10,
+        project_name: str = "bench",
+        services: int = 10,
+        managed_share: float = 0.5,
+        other_share: float = 0.25,
+    ):
+        self.lock = threading.RLock()
+        # container events (streamed by GET /events), waiters are notified when one is added
+        self.events: List[dict] = []
+        self.events_added = threading.Condition(self.lock)
+        self.project_name = project_name
+        self.service_names = [f"service{index:03d}" for index in range(services)]
+        self.images: Dict[str, dict] = {}
+        self.containers: Dict[str, dict] = {}
+        self.volumes: Dict[str, dict] = {}
+        self._generate_images(images)
+        self._generate_containers(containers, managed_share, other_share)
+        self._generate_volumes()
+
+    def _generate_images(self, count: int):
+        tags = [f"{self.project_name}/{name}:latest" for name in self.service_names] + ["busybox:latest"]
+        for index in range(max(count, len(tags))):
+            tagged = index < len(tags)
+            self.images[image_id(index)] = {
+                "Id": image_id(index),
+                "RepoTags": [tags[index]] if tagged else [],
+                "RepoDigests": [],
+                "Created": 1704067200,
+                "Size": 50_000_000 + index * 1024,
+                "Labels": {},
+                "Containers": -1,
+                "_dangling": not tagged,
+            }
+
+    def _generate_containers(self, count: int, managed_share: float, other_share: float):
+        managed = int(count * managed_share)
+        other = int(count * other_share)
+        replicas = Counter()
+        for index in range(count):
+            labels = {}
+            if index < managed:
+                service_index = index % len(self.service_names)
+                service_name = self.service_names[service_index]
+                project_name = self.project_name
+                labels["com.docker.compose.config-hash"] = service_hash(project_name, service_name)
+                image = image_id(service_index)
+            elif index < managed + other:
+                project_name = f"other{index % OTHER_PROJECTS}"
+                service_name = f"worker{index % 3}"
+                labels["com.docker.compose.config-hash"] = service_hash(project_name, service_name)
+                image = image_id(len(self.service_names))
+            else:
+                project_name, service_name = None, None
+                image = image_id(len(self.service_names))
+            if project_name:
+                replicas[(project_name, service_name)] += 1
+                number = replicas[(project_name, service_name)]
+                labels["com.docker.compose.project"] = project_name
+                labels["com.docker.compose.service"] = service_name
+                labels["com.docker.compose.container-number"] = str(number)
+                name = f"{project_name}-{service_name}-{number}"
+            else:
+                name = f"standalone-{index}"
+            running = index % 7 != 0
+            self.add_container(container_id(index), name, image, labels, running)
+
+    def _generate_volumes(self):
+        # one data volume per service of the project
+        for service_name in self.service_names:
+            name = f"{self.project_name}_{service_name}_data"
+            self.volumes[name] = {
+                "Name": name,
+                "Driver": "local",
+                "Mountpoint": f"/var/lib/docker/volumes/{name}/_data",
+                "CreatedAt": "2024-01-01T00:00:00Z",
+                "Labels": {"com.docker.compose.project": self.project_name, "com.docker.compose.volume": "data"},
+                "Scope": "local",
+                "UsageData": {"Size": 10_000_000, "RefCount": 1},
+            }
+
+    def add_container(self, identifier: str, name: str, image: str, labels: Dict, running: bool):
+        self.containers[identifier] = {
+            "Id": identifier,
+            "Name": "/" + name,
+            "Created": "2024-01-01T00:00:00.000000000Z",
+            "Image": image,
+            "State": {
+                "Status": "running" if running else "exited",
+                "Running": running,
+                "ExitCode": 0,
+                "StartedAt": LOG_TIMESTAMP,
+                "FinishedAt": NEVER_STARTED,
+            },
+            "Config": {
+                "Image": (self.images[image]["RepoTags"] or [image])[0],
+                "Labels": labels,
+                "Tty": False,
+                "Env": [],
+            },
+            "HostConfig": {"NetworkMode": "default"},
+            "Mounts": [],
+            "NetworkSettings": {"Networks": {}},
+            "SizeRw": 4096,
+        }
+
+    def add_event(self, container: dict, action: str):
+        now = time.time()
+        self.events.append(
+            {
+                "Type": "container",
+                "Action": action,
+                "id": container["Id"],
+                "Actor": {"ID": container["Id"], "Attributes": {"name": container["Name"].lstrip("/")}},
+                "time": int(now),
+                "timeNano": int(now * 1e9),
+            }
+        )
+        self.events_added.notify_all()
+
+    def summary(self, container: dict) -> dict:
+        return {
+            "Id": container["Id"],
+            "Names": [container["Name"]],
+            "Image": container["Config"]["Image"],
+            "ImageID": container["Image"],
+            "Command": "",
+            "Created": 1704067200,
+            "Labels": container["Config"]["Labels"],
+            "State": container["State"]["Status"],
+            "Status": "Up 2 hours" if container["State"]["Running"] else "Exited (0) 2 hours ago",
+            "Ports": [],
+            "Mounts": [],
+        }
+
+    def find_container(self, identifier: str) -> Optional[dict]:
+        if identifier in self.containers:
+            return self.containers[identifier]
+        for container in self.containers.values():
+            if container["Id"].startswith(identifier) or container["Name"] == "/" + identifier:
+                return container
+        return None
+
+    def find_image(self, identifier: str) -> Optional[dict]:
+        for image in self.images.values():
+            if image["Id"] in (identifier, "sha256:" + identifier) or identifier in image["RepoTags"]:
+                return image
+        return None
+
+
+def labels_match(labels: Dict, label_filters: List[str]) -> bool:
+    for label_filter in label_filters:
+        key, _, value = label_filter.partition("=")
+        if key not in labels or (value and labels[key] != value):
+            return False
+    return True
+
+
+def created_before(created: int, filters: Dict) -> bool:
+    # only unix timestamps, the control center converts durations and dates itself
+    return "until" not in filters or created < int(filters["until"][0])
+
+
+def container_matches(state: FakeDockerState, container: dict, filters: Dict) -> bool:
+    if not created_before(state.summary(container)["Created"], filters):
+        return False
+    if not labels_match(container["Config"]["Labels"], filters.get("label", [])):
+        return False
+    if "status" in filters and container["State"]["Status"] not in filters["status"]:
+        return False
+    if "name" in filters and not any(name in container["Name"] for name in filters["name"]):
+        return False
+    if "id" in filters and not any(container["Id"].startswith(prefix) for prefix in filters["id"]):
+        return False
+    return True
+
+
+def image_matches(image: dict, filters: Dict) -> bool:
+    if "dangling" in filters and image["_dangling"] != (filters["dangling"][0] in ("true", "1")):
+        return False
+    return created_before(image["Created"], filters) and labels_match(image["Labels"], filters.get("label", []))
+
+
+def public(item: dict) -> dict:
+    return {key: value for key, value in item.items() if not key.startswith("_")}
+
+
+def log_frames(lines: int) -> bytes:
+    payload = b"".join(f"{LOG_TIMESTAMP} log line {line}\n".encode() for line in range(lines))
+    return bytes([1, 0, 0, 0]) + len(payload).to_bytes(4, "big") + payload if payload else b""
+
+
+class FakeDockerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeDockerServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def address_string(self):
+        return "fake-docker"
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_DELETE(self):
+        self.dispatch("DELETE")
+
+    def do_HEAD(self):
+        self.dispatch("HEAD")
+
+    def dispatch(self, method: str):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        url = urlparse(self.path)
+        path = re.sub(r"^/v[0-9.]+", "", url.path)
+        # repeated parameters (type=...&type=...) are kept as lists
+        query = {key: values[-1] if len(values) == 1 else values for key, values in parse_qs(url.query).items()}
+        daemon = self.server.daemon
+        if method == "GET" and path == "/events":
+            daemon.record("GET /events")
+            return self.stream_events(query)
+        if daemon.latency:
+            time.sleep(daemon.latency)
+        for route_method, pattern, name, handler in ROUTES:
+            match = pattern.fullmatch(path)
+            if route_method == method and match:
+                daemon.record(f"{method} {name}")
+                if f"{method} {name}" in daemon.route_latency:
+                    time.sleep(daemon.route_latency[f"{method} {name}"])
+                with daemon.state.lock:
+                    status, body = handler(daemon.state, query, *match.groups())
+                return self.respond(status, body)
+        daemon.record(f"{method} {path}")
+        self.respond(404, {"message": f"page not found: {method} {path}"})
+
+    def stream_events(self, query):
+        # the events since the "since" timestamp, then the new ones until the client goes away
+        state = self.server.daemon.state
+        since = int(query.get("since", time.time()))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Api-Version", API_VERSION)
+        self.end_headers()
+        with state.lock:
+            position = next(
+                (index for index, event in enumerate(state.events) if event["time"] >= since), len(state.events)
+            )
+        try:
+            while True:
+                with state.lock:
+                    state.events_added.wait_for(lambda: len(state.events) > position, timeout=1)
+                    events, position = state.events[position:], len(state.events)
+                for event in events:
+                    content = json.dumps(event).encode() + b"\n"
+                    self.wfile.write(f"{len(content):x}\r\n".encode() + content + b"\r\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def respond(self, status: int, body):
+        if isinstance(body, bytes):
+            content, content_type = body, "application/vnd.docker.raw-stream"
+        elif body is None:
+            content, content_type = b"", "text/plain"
+        else:
+            content, content_type = json.dumps(body).encode(), "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.send_header("Api-Version", API_VERSION)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(content)
+
+
+def filters_from(query: Dict) -> Dict:
+    return json.loads(query.get("filters", "{}"))
+
+
+def not_found(kind: str, identifier: str) -> Tuple[int, dict]:
+    return 404, {"message": f"No such {kind}: {identifier}"}
+
+
+def version(state, query):
+    return 200, {"ApiVersion": API_VERSION, "MinAPIVersion": "1.24", "Version": "26.1.0", "Os": "linux"}
+
+
+def ping(state, query):
+    return 200, None
+
+
+def list_containers(state: FakeDockerState, query):
+    filters = filters_from(query)
+    everything = query.get("all") in ("1", "true", "True")
+    size = query.get("size") in ("1", "true", "True")
+    return 200, [
+        {**state.summary(container), **({"SizeRw": container["SizeRw"]} if size else {})}
+        for container in state.containers.values()
+        if (everything or container["State"]["Running"]) and container_matches(state, container, filters)
+    ]
+
+
+def inspect_container(state: FakeDockerState, query, identifier):
+    container = state.find_container(identifier)
+    return (200, container) if container else not_found("container", identifier)
+
+
+def container_logs(state: FakeDockerState, query, identifier):
+    if not state.find_container(identifier):
+        return not_found("container", identifier)
+    tail = query.get("tail", "all")
+    return 200, log_frames(100_000 if tail == "all" else int(tail))
+
+
+def container_action(state: FakeDockerState, query, identifier, action):
+    container = state.find_container(identifier)
+    if not container:
+        return not_found("container", identifier)
+    if action == "rename":
+        container["Name"] = "/" + query["name"]
+    elif action in ("start", "restart"):
+        container["State"].update({"Status": "running", "Running": True, "StartedAt": LOG_TIMESTAMP})
+    elif action == "stop":
+        container["State"].update({"Status": "exited", "Running": False})
+    state.add_event(container, "die" if action == "stop" else action)
+    return 204, None
+
+
+def remove_container(state: FakeDockerState, query, identifier):
+    container = state.find_container(identifier)
+    if not container:
+        return not_found("container", identifier)
+    if container["State"]["Running"] and query.get("force") not in ("1", "true", "True"):
+        return 409, {"message": f"cannot remove running container {identifier}"}
+    del state.containers[container["Id"]]
+    state.add_event(container, "destroy")
+    return 204, None
+
+
+def prune_containers(state: FakeDockerState, query):
+    filters = filters_from(query)
+    removed = [
+        container
+        for container in state.containers.values()
+        if not container["State"]["Running"] and container_matches(state, container, filters)
+    ]
+    for container in removed:
+        del state.containers[container["Id"]]
+        state.add_event(container, "destroy")
+    return 200, {
+        "ContainersDeleted": [container["Id"] for container in removed],
+        "SpaceReclaimed": sum(container["SizeRw"] for container in removed),
+    }
+
+
+def list_images(state: FakeDockerState, query):
+    filters = filters_from(query)
+    return 200, [public(image) for image in state.images.values() if image_matches(image, filters)]
+
+
+def inspect_image(state: FakeDockerState, query, identifier):
+    image = state.find_image(identifier)
+    return (200, public(image)) if image else not_found("image", identifier)
+
+
+def remove_image(state: FakeDockerState, query, identifier):
+    image = state.find_image(identifier)
+    if not image:
+        return not_found("image", identifier)
+    del state.images[image["Id"]]
+    return 200, [{"Deleted": image["Id"]}]
+
+
+def prune_images(state: FakeDockerState, query):
+    filters = filters_from(query)
+    used = {container["Image"] for container in state.containers.values()}
+    removed = [
+        image
+        for image in state.images.values()
+        if image["Id"] not in used and image_matches(image, filters) and (image["_dangling"] or "dangling" in filters)
+    ]
+    for image in removed:
+        del state.images[image["Id"]]
+    return 200, {
+        "ImagesDeleted": [{"Deleted": image["Id"]} for image in removed],
+        "SpaceReclaimed": sum(image["Size"] for image in removed),
+    }
+
+
+def list_networks(state, query):
+    return 200, []
+
+
+def list_volumes(state: FakeDockerState, query):
+    filters = filters_from(query)
+    volumes = [
+        {key: value for key, value in volume.items() if key != "UsageData"}
+        for volume in state.volumes.values()
+        if labels_match(volume["Labels"], filters.get("label", []))
+        and ("dangling" not in filters or (volume["UsageData"]["RefCount"] == 0) == (filters["dangling"][0] == "true"))
+    ]
+    return 200, {"Volumes": volumes, "Warnings": None}
+
+
+def system_df(state: FakeDockerState, query):
+    types = query.get("type", ["container", "image", "volume", "build-cache"])
+    types = [types] if isinstance(types, str) else types
+    used = Counter(container["Image"] for container in state.containers.values())
+    usage = {}
+    if "image" in types:
+        images = [
+            {**public(image), "SharedSize": 0, "Containers": used[image["Id"]]} for image in state.images.values()
+        ]
+        usage.update({"LayersSize": sum(image["Size"] for image in images), "Images": images})
+    if "container" in types:
+        usage["Containers"] = [
+            {**state.summary(container), "SizeRw": container["SizeRw"], "SizeRootFs": 0}
+            for container in state.containers.values()
+        ]
+    if "volume" in types:
+        usage["Volumes"] = list(state.volumes.values())
+    if "build-cache" in types:
+        usage["BuildCache"] = []
+    return 200, usage
+
+
+def prune_networks(state, query):
+    return 200, {"NetworksDeleted": []}
+
+
+def prune_volumes(state, query):
+    return 200, {"VolumesDeleted": [], "SpaceReclaimed": 0}
+
+
+ROUTES: List[Tuple[str, "re.Pattern", str, Callable]] = [
+    (method, re.compile(pattern), re.sub(r"\([^)]*\)", "*", pattern), handler)
+    for method, pattern, handler in [
+        ("GET", r"/version", version),
+        ("GET", r"/_ping", ping),
+        ("HEAD", r"/_ping", ping),
+        ("GET", r"/containers/json", list_containers),
+        ("POST", r"/containers/prune", prune_containers),
+        ("GET", r"/containers/([^/]+)/json", inspect_container),
+        ("GET", r"/containers/([^/]+)/logs", container_logs),
+        ("POST", r"/containers/([^/]+)/(start|stop|restart|rename)", container_action),
+        ("DELETE", r"/containers/([^/]+)", remove_container),
+        ("GET", r"/images/json", list_images),
+        ("POST", r"/images/prune", prune_images),
+        ("GET", r"/images/([^/]+)/json", inspect_image),
+        ("DELETE", r"/images/([^/]+)", remove_image),
+        ("GET", r"/system/df", system_df),
+        ("GET", r"/networks", list_networks),
+        ("POST", r"/networks/prune", prune_networks),
+        ("GET", r"/volumes", list_volumes),
+        ("POST", r"/volumes/prune", prune_volumes),
+    ]
+]
+
+
+class FakeDockerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, daemon: "FakeDockerDaemon"):
+        self.daemon = daemon
+        super().__init__(socket_path, FakeDockerHandler)
+
+
+class FakeDockerDaemon(object):
+    """
+    Runs the fake daemon in a background thread.
+    Use `base_url` as DOCKER_HOST and `calls` to read the per-endpoint call counts.
+    """
+
+    def __init__(self, socket_path: str, latency: float = 0.0, route_latency: Dict[str, float] = None, **state_options):
+        self.socket_path = socket_path
+        self.latency = latency
+        # additional latency of some calls, for example {"GET /system/df": 5}
+        self.route_latency = route_latency or {}
+        self.state = FakeDockerState(**state_options)
+        self.calls: Counter = Counter()
+        self._calls_lock = threading.Lock()
+        self._server: Optional[FakeDockerServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return "unix://" + self.socket_path
+
+    def record(self, call: str):
+        with self._calls_lock:
+            self.calls[call] += 1
+
+    def reset_calls(self) -> Counter:
+        with self._calls_lock:
+            calls, self.calls = self.calls, Counter()
+        return calls
+
+    def start(self) -> "FakeDockerDaemon":
+        self._server = FakeDockerServer(self.socket_path, self)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-docker", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Docker Engine API on a unix socket")
+    parser.add_argument("--socket", required=True, help="unix socket path")
+    parser.add_argument("--containers", type=int, default=10)
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--services", type=int, default=10)
+    parser.add_argument("--project-name", default="bench")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    arguments = parser.parse_args()
+    if os.path.exists(arguments.socket):
+        os.remove(arguments.socket)
+    daemon = FakeDockerDaemon(
+        arguments.socket,
+        latency=arguments.latency_ms / 1000,
+        containers=arguments.containers,
+        images=arguments.images,
+        services=arguments.services,
+        project_name=arguments.project_name,
+    )
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stopped.set())
+    signal.signal(signal.SIGINT, lambda *args: stopped.set())
+    with daemon:
+        stopped.wait()
+    os.remove(arguments.socket)
+    print(json.dumps(dict(daemon.calls)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
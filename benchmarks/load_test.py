@@ -0,0 +1,325 @@
+"""
+Runs a concurrent-operator load scenario against the real WSGI application served by gunicorn.
+
+The docker daemon is replaced by benchmarks.fake_daemon (run as a separate process) and `docker compose`
+by the stub CLI, whose command delays simulate long actions. Each operator is a thread with its own session
+sending a weighted mix of page loads, logs, API reads and service actions.
+
+For every gunicorn configuration (a configuration file combined with worker/thread counts) it reports
+throughput, latency percentiles, the share of actions rejected as "system busy", errors and worker saturation
+(measured with gunicorn pre/post request hooks).
+
+    python -m benchmarks.load_test --operators 20 --duration 30 --workers 1 2 4 --threads 1 4 \\
+        --compose-delays up=2,pull=1,restart=1
+"""
+
+import argparse
+import http.client
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from benchmarks.bench_views import percentile
+from benchmarks.environment import PROJECT_NAME, REPOSITORY_DIR, USERNAME, BenchmarkEnvironment
+from benchmarks.fake_daemon import container_id
+
+BUSY_MARKER = b"already working on another command"
+
+REQUESTS = {
+    "managed_containers": "/docker/managed_containers",
+    "other_project_containers": "/docker/other_project_containers",
+    "standalone_containers": "/docker/standalone_containers",
+    "service_logs": f"/docker/project/{PROJECT_NAME}/service/{{service}}/logs?lines=100",
+    "container_logs": f"/docker/container/{container_id(0)}/logs?lines=100",
+    "api_compose_config": "/api/compose_config/",
+    "restart": f"/docker/project/{PROJECT_NAME}/service/{{service}}/restart",
+    "up": f"/docker/project/{PROJECT_NAME}/service/{{service}}/up",
+    "stop": f"/docker/project/{PROJECT_NAME}/service/{{service}}/stop",
+}
+ACTIONS = {"restart", "up", "stop"}
+DEFAULT_MIX = (
+    "managed_containers=6,standalone_containers=2,other_project_containers=1,service_logs=1,"
+    "api_compose_config=2,restart=1,up=1"
+)
+
+HOOKS_TEMPLATE = """
+import os
+import time
+
+_base = {{}}
+exec(compile(open({base_config!r}).read(), {base_config!r}, "exec"), _base)
+globals().update({{key: value for key, value in _base.items() if not key.startswith("__")}})
+
+bind = "127.0.0.1:{port}"
+loglevel = "warning"
+{overrides}
+
+def pre_request(worker, req):
+    req.benchmark_started = time.time()
+    if "pre_request" in _base:
+        _base["pre_request"](worker, req)
+
+
+def post_request(worker, req, environ, resp):
+    with open({timings!r}, "a") as timings:
+        timings.write(f"{{os.getpid()}} {{req.benchmark_started}} {{time.time()}}\\n")
+    if "post_request" in _base:
+        _base["post_request"](worker, req, environ, resp)
+"""
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        name, weight = item.split("=")
+        if name not in REQUESTS:
+            raise SystemExit(f"unknown request '{name}', choose from {', '.join(REQUESTS)}")
+        weights[name] = float(weight)
+    return weights
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(check, timeout: float, what: str):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if check():
+            return
+        time.sleep(0.1)
+    raise RuntimeError(f"timed out waiting for {what}")
+
+
+def port_open(port: int) -> bool:
+    try:
+        socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+        return True
+    except OSError:
+        return False
+
+
+class Operator(threading.Thread):
+    def __init__(
+        self,
+        port: int,
+        session_cookie: str,
+        weights: Dict[str, float],
+        services: List[str],
+        stop_at: float,
+        think_time: float,
+        timeout: float,
+    ):
+        super().__init__(daemon=True)
+        self.port = port
+        self.cookie = f"sessionid={session_cookie}"
+        self.names = list(weights)
+        self.weights = list(weights.values())
+        self.services = services
+        self.stop_at = stop_at
+        self.think_time = think_time
+        self.timeout = timeout
+        self.samples: List[Dict] = []
+
+    def run(self):
+        generator = random.Random(self.name)
+        while time.time() < self.stop_at:
+            name = generator.choices(self.names, self.weights)[0]
+            path = REQUESTS[name].format(service=generator.choice(self.services))
+            self.samples.append(self.request(name, path))
+            if self.think_time:
+                time.sleep(generator.uniform(0, 2 * self.think_time))
+
+    def request(self, name: str, path: str) -> Dict:
+        start = time.perf_counter()
+        sample = {"name": name, "action": name in ACTIONS, "busy": False, "error": None}
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=self.timeout)
+            connection.request("GET", path, headers={"Cookie": self.cookie, "Referer": "/docker/managed_containers"})
+            response = connection.getresponse()
+            body = response.read()
+            connection.close()
+            sample["status"] = response.status
+            sample["busy"] = BUSY_MARKER in body
+            if response.status >= 400:
+                sample["error"] = str(response.status)
+        except (OSError, http.client.HTTPException) as error:
+            sample["status"] = None
+            sample["error"] = type(error).__name__
+        sample["duration"] = time.perf_counter() - start
+        return sample
+
+
+def worker_saturation(timings_file: str, capacity: int, start: float, end: float) -> Dict:
+    events = []
+    if os.path.exists(timings_file):
+        with open(timings_file) as timings:
+            for line in timings:
+                _, request_start, request_end = line.split()
+                events.append((max(float(request_start), start), 1))
+                events.append((min(float(request_end), end), -1))
+    events.sort()
+    in_flight, busy_time, saturated_time, previous = 0, 0.0, 0.0, start
+    for moment, change in events:
+        moment = min(max(moment, start), end)
+        busy_time += min(in_flight, capacity) * (moment - previous)
+        if in_flight >= capacity:
+            saturated_time += moment - previous
+        in_flight += change
+        previous = moment
+    duration = end - start
+    return {"utilization": busy_time / (capacity * duration), "saturated": saturated_time / duration}
+
+
+def run_scenario(environment: BenchmarkEnvironment, arguments, base_config: str, workers: int, threads: int) -> Dict:
+    from django.contrib.auth.models import User
+    from django.test import Client
+
+    workdir = Path(tempfile.mkdtemp(prefix="dcc-load-", dir=environment.root))
+    port = free_port()
+    timings = str(workdir / "timings.log")
+    overrides = [f"workers = {workers}", f"threads = {threads}"]
+    if arguments.worker_class:
+        overrides.append(f"worker_class = {arguments.worker_class!r}")
+    config_file = workdir / "gunicorn_config.py"
+    config_file.write_text(
+        HOOKS_TEMPLATE.format(base_config=base_config, port=port, overrides="\n".join(overrides), timings=timings)
+    )
+    env = {**os.environ, **environment.environment_variables()}
+    env["FAKE_COMPOSE_DELAYS"] = arguments.compose_delays
+    daemon = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_daemon", "--socket", environment.socket_path]
+        + ["--containers", str(arguments.containers), "--services", str(arguments.services)]
+        + ["--latency-ms", str(arguments.latency_ms)],
+        cwd=REPOSITORY_DIR,
+        env=env,
+        stdout=subprocess.PIPE,
+    )
+    server = None
+    try:
+        wait_for(lambda: os.path.exists(environment.socket_path), 10, "fake docker daemon")
+        server = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", f"--config={config_file}", "control_center.wsgi:application"],
+            cwd=workdir,
+            env=env,
+        )
+        wait_for(lambda: port_open(port), 30, "gunicorn")
+        user = User.objects.get(username=USERNAME)
+        sessions = []
+        for _ in range(arguments.operators):
+            client = Client()
+            client.force_login(user)
+            sessions.append(client.cookies["sessionid"].value)
+        # warm-up: every worker loads the compose configuration on its first request
+        for _ in range(workers * 2):
+            Operator(port, sessions[0], {}, [], 0, 0, arguments.request_timeout).request(
+                "warm-up", REQUESTS["managed_containers"]
+            )
+        if os.path.exists(timings):
+            os.remove(timings)
+        start = time.time()
+        stop_at = start + arguments.duration
+        operators = [
+            Operator(
+                port,
+                session,
+                parse_mix(arguments.mix),
+                environment.service_names,
+                stop_at,
+                arguments.think_time,
+                arguments.request_timeout,
+            )
+            for session in sessions
+        ]
+        for operator in operators:
+            operator.start()
+        for operator in operators:
+            operator.join()
+        end = time.time()
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+        daemon.terminate()
+        daemon_output = daemon.communicate()[0]
+    samples = [sample for operator in operators for sample in operator.samples]
+    durations = [sample["duration"] for sample in samples if not sample["error"]] or [0.0]
+    actions = [sample for sample in samples if sample["action"]]
+    daemon_calls = sum(json.loads(daemon_output or b"{}").values())
+    return {
+        "config": os.path.basename(base_config),
+        "workers": workers,
+        "threads": threads,
+        "requests": len(samples),
+        "throughput": len(samples) / (end - start),
+        "p50_ms": percentile(durations, 50) * 1000,
+        "p95_ms": percentile(durations, 95) * 1000,
+        "p99_ms": percentile(durations, 99) * 1000,
+        "busy_rate": sum(sample["busy"] for sample in actions) / len(actions) if actions else 0.0,
+        "errors": sum(1 for sample in samples if sample["error"]),
+        "daemon_calls_per_request": daemon_calls / len(samples) if samples else 0.0,
+        **worker_saturation(timings, workers * threads, start, end),
+    }
+
+
+def report(results: List[Dict]):
+    header = (
+        f"{'config':<28}{'workers':>8}{'threads':>8}{'requests':>9}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}"
+        f"{'p99 ms':>9}{'busy %':>8}{'errors':>7}{'util %':>8}{'sat %':>7}"
+    )
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result['config']:<28}{result['workers']:>8}{result['threads']:>8}{result['requests']:>9}"
+            f"{result['throughput']:>8.1f}{result['p50_ms']:>9.0f}{result['p95_ms']:>9.0f}{result['p99_ms']:>9.0f}"
+            f"{result['busy_rate'] * 100:>8.1f}{result['errors']:>7}{result['utilization'] * 100:>8.1f}"
+            f"{result['saturated'] * 100:>7.1f}"
+        )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument(
+        "--configs",
+        nargs="+",
+        default=[str(REPOSITORY_DIR / "gunicorn_configuration.py")],
+        help="gunicorn configuration files",
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1])
+    parser.add_argument("--worker-class", help="gunicorn worker class (defaults to the configuration's)")
+    parser.add_argument("--operators", type=int, default=10, help="concurrent operators")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load per scenario")
+    parser.add_argument("--think-time", type=float, default=0.5, help="mean pause between requests of an operator")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted request mix, name=weight,...")
+    parser.add_argument("--containers", type=int, default=100)
+    parser.add_argument("--services", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=1.0, help="latency of every fake daemon call")
+    parser.add_argument("--compose-delays", default="up=2,pull=1,restart=1,stop=1", help="stub docker compose delays")
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--json", help="also write the results to this file")
+    arguments = parser.parse_args(argv)
+    environment = BenchmarkEnvironment(services=arguments.services).activate()
+    results = []
+    for base_config, workers, threads in itertools.product(arguments.configs, arguments.workers, arguments.threads):
+        results.append(run_scenario(environment, arguments, os.path.abspath(base_config), workers, threads))
+    report(results)
+    if arguments.json:
+        with open(arguments.json, "w") as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,14 @@
 from django.conf import settings
 
-from django.contrib.admin import AdminSite
+from django.contrib.admin import AdminSite, ModelAdmin
 from django.contrib.auth.admin import UserAdmin, GroupAdmin
 from django.contrib.auth.models import User, Group
 from django.utils.translation import gettext_lazy
 from rest_framework.authtoken.admin import TokenAdmin
 from rest_framework.authtoken.models import Token
 
+from control_center.apps.delegate.models import ActionRecord, PushedHostState
+
 
 class MyAdminSite(AdminSite):
     site_header = gettext_lazy(settings.SITE_TITLE)
@@ -16,8 +18,51 @@ class MyAdminSite(AdminSite):
 
 TokenAdmin.raw_id_fields = ("user",)
 
+
+# the action history is append-only
+class ActionRecordAdmin(ModelAdmin):
+    list_display = (
+        "started_at",
+        "username",
+        "action",
+        "target",
+        "project_name",
+        "service_name",
+        "container_id",
+        "duration",
+        "exit_status",
+        "output_size",
+    )
+    list_filter = ("action", "target", "exit_status")
+    search_fields = ("username", "project_name", "service_name", "container_id")
+    date_hierarchy = "started_at"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+# pushed by the agents, a host that is no longer used (or to be pushed by another user) can be deleted
+class PushedHostStateAdmin(ModelAdmin):
+    list_display = ("host", "pushed_by", "pushed_at", "sequence", "agent_run")
+    readonly_fields = ("host", "pushed_by", "agent_run", "sequence", "containers", "pushed_at")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 admin_site = MyAdminSite()
 
 admin_site.register(User, UserAdmin)
 admin_site.register(Group, GroupAdmin)
 admin_site.register(Token, TokenAdmin)
+admin_site.register(ActionRecord, ActionRecordAdmin)
+admin_site.register(PushedHostState, PushedHostStateAdmin)
@@ -1,5 +1,8 @@
 from rest_framework import serializers
 
+from control_center.apps.delegate import hosts
+from control_center.apps.delegate.models import ActionRecord
+
 
 class ComposeProjectConfigSerializer(serializers.Serializer):
     compose_file_path = serializers.CharField(read_only=True)
@@ -23,6 +26,7 @@ class LogsSerializer(serializers.Serializer):
     service_name: str = serializers.CharField(read_only=True)
     container_name: str = serializers.CharField(read_only=True)
     container_id: str = serializers.CharField(read_only=True)
+    host: str = serializers.CharField(read_only=True)
 
     def update(self, instance, validated_data):
         pass
@@ -37,6 +41,8 @@ class LogsSerializer(serializers.Serializer):
 class ComposeFileSerializer(serializers.Serializer):
     path = serializers.CharField(read_only=True, required=False)
     file_content = serializers.CharField()
+    # hash of the content an edit is based on, a PUT with an outdated hash is rejected
+    file_hash = serializers.CharField(required=False)
     project_name: str = serializers.CharField(read_only=True, required=False)
 
     def update(self, instance, validated_data):
@@ -47,3 +53,125 @@ class ComposeFileSerializer(serializers.Serializer):
 
     class Meta:
         fields = "__all__"
+
+
+class FieldSelectionSerializer(serializers.Serializer):
+    # only renders the fields listed in the "fields" context entry (all of them when it isn't given)
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get("fields")
+        if fields:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+    def update(self, instance, validated_data):
+        pass
+
+    def create(self, validated_data):
+        pass
+
+
+class InventoryProjectSerializer(FieldSelectionSerializer):
+    project_name = serializers.CharField(read_only=True)
+    managed = serializers.BooleanField(read_only=True)
+    status = serializers.CharField(read_only=True)
+    services = serializers.IntegerField(read_only=True)
+    containers = serializers.IntegerField(read_only=True)
+    running = serializers.IntegerField(read_only=True)
+    out_of_sync = serializers.BooleanField(read_only=True, allow_null=True)
+    allowed_actions = serializers.SerializerMethodField()
+
+    def get_allowed_actions(self, project: dict):
+        user = self.context["user"]
+        return [action for action in project["allowed_actions"] if user.has_perm(f"{project['project_name']}.{action}")]
+
+
+class InventoryServiceSerializer(FieldSelectionSerializer):
+    project_name = serializers.CharField(read_only=True)
+    service_name = serializers.CharField(read_only=True)
+    orphan = serializers.SerializerMethodField()
+    image = serializers.CharField(source="config_image_display", read_only=True)
+    status = serializers.CharField(read_only=True)
+    containers = serializers.SerializerMethodField()
+    running = serializers.SerializerMethodField()
+    out_of_sync = serializers.SerializerMethodField()
+    allowed_actions = serializers.SerializerMethodField()
+
+    @staticmethod
+    def get_orphan(service) -> bool:
+        return service.config is None
+
+    @staticmethod
+    def get_containers(service) -> int:
+        return len(service.containers)
+
+    @staticmethod
+    def get_running(service) -> int:
+        return len(service.running_containers())
+
+    @staticmethod
+    def get_out_of_sync(service) -> bool:
+        return any(service.out_of_sync_containers())
+
+    def get_allowed_actions(self, service):
+        user = self.context["user"]
+        return [action for action in service.allowed_actions() if user.has_perm(f"{service.service_name}.{action}")]
+
+
+class InventoryContainerSerializer(FieldSelectionSerializer):
+    id = serializers.CharField(read_only=True)
+    short_id = serializers.CharField(read_only=True)
+    name = serializers.CharField(read_only=True)
+    project_name = serializers.CharField(source="project", read_only=True, allow_null=True)
+    service_name = serializers.CharField(source="service", read_only=True, allow_null=True)
+    host = serializers.CharField(read_only=True)
+    status = serializers.CharField(read_only=True)
+    started_at = serializers.DateTimeField(read_only=True, allow_null=True)
+    image = serializers.ListField(source="tags", child=serializers.CharField(), read_only=True, allow_null=True)
+    out_of_sync = serializers.SerializerMethodField()
+    allowed_actions = serializers.SerializerMethodField()
+
+    def get_out_of_sync(self, container):
+        # only known for the containers of the managed project
+        service = self.context["inventory"].service(container)
+        if service:
+            return bool(service.config) and container.service_hash != service.config.hash
+
+    def get_allowed_actions(self, container):
+        if not hosts.is_reachable(container.host):
+            return []
+        user = self.context["user"]
+        app_label = self.context["app_label"](container)
+        return [action for action in container.allowed_actions() if user.has_perm(f"{app_label}.container_{action}")]
+
+
+class ActionRecordSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ActionRecord
+        fields = [
+            "username",
+            "target",
+            "project_name",
+            "service_name",
+            "container_id",
+            "action",
+            "started_at",
+            "ended_at",
+            "duration",
+            "exit_status",
+            "output_size",
+        ]
+
+
+class ActionDurationSerializer(serializers.Serializer):
+    service_name = serializers.CharField(read_only=True)
+    action = serializers.CharField(read_only=True)
+    count = serializers.IntegerField(read_only=True)
+    p50 = serializers.FloatField(read_only=True)
+    p95 = serializers.FloatField(read_only=True)
+
+    def update(self, instance, validated_data):
+        pass
+
+    def create(self, validated_data):
+        pass
@@ -6,8 +6,14 @@ from control_center.apps.api import views
 urlpatterns = [
     path("token-auth/", rest_framework_views.obtain_auth_token),
     path("compose_config/", views.compose_config),
+    # read-only state of the projects, services and containers
+    path("inventory/projects", views.inventory_projects, name="inventory_projects"),
+    path("inventory/services", views.inventory_services, name="inventory_services"),
+    path("inventory/containers", views.inventory_containers, name="inventory_containers"),
+    path("drift", views.drift),
     # docker compose project commands
     path("project/<str:project_name>/up", views.project_up),
+    path("project/<str:project_name>/apply", views.project_apply),
     path("project/<str:project_name>/down", views.project_down),
     path("project/<str:project_name>/restart", views.project_restart),
     path("project/<str:project_name>/rm", views.project_remove),
@@ -27,9 +33,22 @@ urlpatterns = [
     path("container/<str:container_id>/restart", views.container_restart),
     path("container/<str:container_id>/rm", views.container_remove),
     path("container/<str:container_id>/logs", views.container_logs),
+    # same container functions for the containers of the other docker hosts
+    path("host/<str:host_name>/container/<str:container_id>/stop", views.container_stop),
+    path("host/<str:host_name>/container/<str:container_id>/start", views.container_start),
+    path("host/<str:host_name>/container/<str:container_id>/restart", views.container_restart),
+    path("host/<str:host_name>/container/<str:container_id>/rm", views.container_remove),
+    path("host/<str:host_name>/container/<str:container_id>/logs", views.container_logs),
     # docker system commands
     path("system/compose_file", views.compose_file),
     path("system/clean_old_images", views.clean_old_images),
     path("system/prune", views.prune),
     path("system/prune_all", views.prune_all),
+    path("system/disk_usage", views.disk_usage),
+    path("system/metrics", views.metrics),
+    # states pushed by the agents of other docker hosts
+    path("agent/push", views.agent_push, name="agent_push"),
+    # action history
+    path("history/actions", views.action_history),
+    path("history/durations", views.action_durations),
 ]
@@ -1,51 +1,281 @@
+import binascii
+import hashlib
+import json
+import os
+import zlib
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import partial
 from subprocess import CalledProcessError
+from typing import Callable, List, Optional, Type
 
+from django.conf import settings
 from django.contrib.auth.decorators import permission_required
-from django.core.exceptions import ValidationError
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
 from docker.errors import NotFound
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.exceptions import (
     APIException,
     NotFound as RestNotFound,
     PermissionDenied as RestPermissionDenied,
+    Throttled,
     ValidationError as RestValidationError,
 )
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-
-from control_center.apps.api.serializers import ComposeProjectConfigSerializer, ComposeFileSerializer
-from control_center.apps.delegate import docker
-from control_center.apps.delegate.objects import ComposeProjectConfig
-from control_center.libs.decorators.view_decorators import view_has_perm_from_arg
+from rest_framework.utils.urls import replace_query_param
+
+from control_center.apps.api.serializers import (
+    ActionDurationSerializer,
+    ActionRecordSerializer,
+    ComposeProjectConfigSerializer,
+    ComposeFileSerializer,
+    FieldSelectionSerializer,
+    InventoryContainerSerializer,
+    InventoryProjectSerializer,
+    InventoryServiceSerializer,
+)
+from control_center.apps.delegate import docker, history, hosts, logs, pushed_state
+from control_center.apps.delegate.models import ActionRecord
+from control_center.apps.delegate.objects import ComposeProjectConfig, Inventory, summary_status
+from control_center.apps.delegate.single_flight import single_flight_group
+from control_center.libs.decorators.view_decorators import (
+    disable_session_expiry_refresh,
+    view_has_perm_from_arg,
+    view_limit_per_user,
+)
 
 
 def unauthorized_function():
     raise RestPermissionDenied()
 
 
+def too_many_log_requests(limit):
+    raise Throttled(detail=f"at most {limit.limit} log requests can be in progress at once")
+
+
+def log_lines(request) -> int:
+    try:
+        return logs.parse_lines(request.GET.get("lines"))
+    except ValidationError as error:
+        raise RestValidationError(detail=error.message)
+
+
+# answers 304 Not Modified without building the response when the client already has this etag
+def conditional_response(request, etag: Optional[str], build_response: Callable, **cache_control) -> HttpResponse:
+    response = get_conditional_response(request, etag=quote_etag(etag)) if etag else None
+    if response is None:
+        response = build_response()
+    if etag:
+        response["ETag"] = quote_etag(etag)
+    patch_cache_control(response, **cache_control)
+    return response
+
+
 @api_view(["GET"])
 def compose_config(request):
     config: ComposeProjectConfig = docker.compose_config()
-    serializer = ComposeProjectConfigSerializer(config)
-    return Response(serializer.data)
+    return conditional_response(
+        request,
+        config.etag() if config else None,
+        lambda: Response(ComposeProjectConfigSerializer(config).data),
+        private=True,
+        no_cache=True,
+    )
+
+
+# comma separated values of a query parameter, for example ?status=running,exited
+def query_list(request, name: str) -> List[str]:
+    return [value for value in request.GET.get(name, "").split(",") if value]
+
+
+def query_matches(request, name: str, value: Optional[str]) -> bool:
+    values = query_list(request, name)
+    return not values or value in values
+
+
+# cursor pagination over a sorted list: the cursor is the (encoded) key of the last item of the previous page
+def inventory_page(request, items: list, key: Callable, serializer_class: Type[FieldSelectionSerializer], context):
+    try:
+        limit = int(request.GET.get("limit", settings.INVENTORY_PAGE_SIZE))
+    except ValueError:
+        raise RestValidationError(detail="limit must be a number")
+    limit = max(1, min(limit, settings.INVENTORY_MAX_PAGE_SIZE))
+    items = sorted(items, key=key)
+    cursor = request.GET.get("cursor")
+    if cursor:
+        try:
+            after = urlsafe_b64decode(cursor.encode()).decode()
+        except (binascii.Error, UnicodeDecodeError):
+            raise RestValidationError(detail="invalid cursor")
+        items = [item for item in items if key(item) > after]
+    page = items[:limit]
+    next_url = None
+    if len(items) > limit:
+        next_cursor = urlsafe_b64encode(key(page[-1]).encode()).decode()
+        next_url = replace_query_param(request.build_absolute_uri(), "cursor", next_cursor)
+    return {"results": serializer_class(page, many=True, context=context).data, "next": next_url}
+
+
+def inventory_response(
+    request,
+    build_items: Callable[[Inventory], list],
+    key: Callable,
+    serializer_class: Type[FieldSelectionSerializer],
+    all_hosts: bool = False,
+):
+    fields = query_list(request, "fields")
+    unknown_fields = set(fields) - set(serializer_class().fields)
+    if unknown_fields:
+        raise RestValidationError(detail=f"unknown fields: {', '.join(sorted(unknown_fields))}")
+    # the start time is the only field that needs every container to be inspected
+    inventory = docker.inventory(inspect="started_at" in (fields or serializer_class().fields), all_hosts=all_hosts)
+    context = {
+        "user": request.user,
+        "inventory": inventory,
+        "fields": fields,
+        "app_label": partial(docker.container_permission_app_label, config=inventory.config),
+    }
+    # the content depends on the state of the host, the query and the user permissions
+    etag_source = f"{inventory.etag()} {request.user.pk} {request.get_full_path()}"
+    return conditional_response(
+        request,
+        hashlib.sha256(etag_source.encode()).hexdigest()[:32],
+        lambda: Response(
+            {
+                **inventory_page(request, build_items(inventory), key, serializer_class, context),
+                "unavailable_hosts": inventory.unavailable_hosts,
+            }
+        ),
+        private=True,
+        no_cache=True,
+    )
+
+
+@disable_session_expiry_refresh
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer])
+def inventory_projects(request):
+    def build_items(inventory: Inventory) -> list:
+        projects = []
+        if inventory.project:
+            project = inventory.project
+            projects.append(
+                {
+                    "project_name": project.project_name,
+                    "managed": True,
+                    "status": project.status(),
+                    "services": len(project.services),
+                    "containers": len(project.all_containers()),
+                    "running": len(project.running_containers()),
+                    "out_of_sync": project.out_of_sync(),
+                    "allowed_actions": project.allowed_actions(),
+                }
+            )
+        if request.user.has_module_perms("other_projects"):
+            for project_name, containers in inventory.other_projects().items():
+                projects.append(
+                    {
+                        "project_name": project_name,
+                        "managed": False,
+                        "status": summary_status(containers),
+                        "services": len(set(cont.service for cont in containers)),
+                        "containers": len(containers),
+                        "running": len([cont for cont in containers if cont.status == cont.STATUS.RUNNING]),
+                        "out_of_sync": None,
+                        "allowed_actions": [],
+                    }
+                )
+        return [
+            project
+            for project in projects
+            if query_matches(request, "project", project["project_name"])
+            and query_matches(request, "status", project["status"])
+        ]
+
+    return inventory_response(request, build_items, lambda project: project["project_name"], InventoryProjectSerializer)
+
+
+@disable_session_expiry_refresh
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer])
+def inventory_services(request):
+    def build_items(inventory: Inventory) -> list:
+        if not inventory.project:
+            return []
+        return [
+            service
+            for service in inventory.project.services
+            if request.user.has_perm(f"{service.service_name}.view")
+            and query_matches(request, "project", service.project_name)
+            and query_matches(request, "service", service.service_name)
+            and query_matches(request, "status", service.status())
+        ]
+
+    return inventory_response(request, build_items, lambda service: service.service_name, InventoryServiceSerializer)
+
+
+@disable_session_expiry_refresh
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer])
+def inventory_containers(request):
+    def build_items(inventory: Inventory) -> list:
+        return [
+            container
+            for container in inventory.containers
+            if docker.user_can_view_container(request.user, container, inventory.config)
+            and query_matches(request, "project", container.project)
+            and query_matches(request, "service", container.service)
+            and query_matches(request, "status", container.status)
+            and query_matches(request, "host", container.host)
+        ]
+
+    # the containers of every docker host, sorted by host then name
+    return inventory_response(
+        request,
+        build_items,
+        lambda container: f"{container.host}/{container.name}",
+        InventoryContainerSerializer,
+        all_hosts=True,
+    )
 
 
 @api_view(["POST"])
 @view_has_perm_from_arg("project_name", "up", unauthorized_function)
 def project_up(request, project_name):
     try:
-        docker.project_up(project_name)
+        docker.project_up(project_name, user=request.user)
         return Response({f"project '{project_name}' is up"})
     except NotFound as error:
         raise RestNotFound(detail=error.explanation)
 
 
+# brings up only the services whose configuration changed, ?dry_run=true only returns the plan
+@api_view(["POST"])
+@view_has_perm_from_arg("project_name", "up", unauthorized_function)
+def project_apply(request, project_name):
+    try:
+        if request.GET.get("dry_run") in ("1", "true", "True"):
+            plans = docker.project_apply_plan(project_name)
+        else:
+            plans = docker.project_apply(project_name, user=request.user)
+        return Response({"project_name": project_name, "services": [item._asdict() for item in plans]})
+    except NotFound as error:
+        raise RestNotFound(detail=error.explanation)
+
+
 @api_view(["POST"])
 @view_has_perm_from_arg("project_name", "down", unauthorized_function)
 def project_down(request, project_name):
     try:
-        docker.project_down(project_name)
+        docker.project_down(project_name, user=request.user)
         return Response({f"project '{project_name}' is down"})
     except NotFound as error:
         raise RestNotFound(detail=error.explanation)
@@ -55,7 +285,7 @@ def project_down(request, project_name):
 @view_has_perm_from_arg("project_name", "restart", unauthorized_function)
 def project_restart(request, project_name):
     try:
-        docker.project_restart(project_name)
+        docker.project_restart(project_name, user=request.user)
         return Response({f"project '{project_name}' has been restarted"})
     except NotFound as error:
         raise RestNotFound(detail=error.explanation)
@@ -65,7 +295,7 @@ def project_restart(request, project_name):
 @view_has_perm_from_arg("project_name", "remove", unauthorized_function)
 def project_remove(request, project_name):
     try:
-        docker.project_remove(project_name)
+        docker.project_remove(project_name, user=request.user)
         return Response({f"stopped containers for project '{project_name}' have been removed"})
     except NotFound as error:
         raise RestNotFound(detail=error.explanation)
@@ -75,7 +305,7 @@ def project_remove(request, project_name):
 @view_has_perm_from_arg("service_name", "start", unauthorized_function)
 def service_start(request, project_name, service_name):
     try:
-        docker.service_start(project_name, service_name)
+        docker.service_start(project_name, service_name, user=request.user)
         return Response({f"service '{service_name}' for project '{project_name}' has been started"})
     except NotFound as error:
         raise RestNotFound(detail=error.explanation)
@@ -85,7 +315,7 @@ def service_start(request, project_name, service_name):
 @view_has_perm_from_arg("service_name", "stop", unauthorized_function)
 def service_stop(request, project_name, service_name):
     try:
-        docker.service_stop(project_name, service_name)
+        docker.service_stop(project_name, service_name, user=request.user)
         return Response({f"service '{service_name}' for project '{project_name}' has been stopped"})
     except NotFound as error:
         raise RestNotFound(detail=error.explanation)
@@ -95,7 +325,7 @@ def service_stop(request, project_name, service_name):
 @view_has_perm_from_arg("service_name", "up", unauthorized_function)
 def service_up(request, project_name, service_name):
     try:
-        docker.service_up(project_name, service_name)
+        docker.service_up(project_name, service_name, user=request.user)
         return Response({f"service '{service_name}' for project '{project_name}' is up"})
     except NotFound as error:
         raise RestNotFound(detail=error.explanation)
@@ -105,7 +335,7 @@ def service_up(request, project_name, service_name):
 @view_has_perm_from_arg("service_name", "restart", unauthorized_function)
 def service_restart(request, project_name, service_name):
     try:
-        docker.service_restart(project_name, service_name)
+        docker.service_restart(project_name, service_name, user=request.user)
         return Response({f"service '{service_name}' for project '{project_name}' has been restarted"})
     except NotFound as error:
         raise RestNotFound(detail=error.explanation)
@@ -115,7 +345,7 @@ def service_restart(request, project_name, service_name):
 @view_has_perm_from_arg("service_name", "remove", unauthorized_function)
 def service_remove(request, project_name, service_name):
     try:
-        docker.service_remove(project_name, service_name)
+        docker.service_remove(project_name, service_name, user=request.user)
         return Response(
             {f"stopped containers for service '{service_name}' of project '{project_name}' have been removed"}
         )
@@ -127,7 +357,7 @@ def service_remove(request, project_name, service_name):
 @view_has_perm_from_arg("service_name", "update", unauthorized_function)
 def service_update(request, project_name, service_name):
     try:
-        docker.service_update(project_name, service_name)
+        docker.service_update(project_name, service_name, user=request.user)
         return Response({f"service '{service_name}' for project '{project_name}' has been updated"})
     except NotFound as error:
         raise RestNotFound(detail=error.explanation)
@@ -137,7 +367,7 @@ def service_update(request, project_name, service_name):
 @view_has_perm_from_arg("service_name", "rollback", unauthorized_function)
 def service_rollback(request, project_name, service_name):
     try:
-        docker.service_rollback(project_name, service_name)
+        docker.service_rollback(project_name, service_name, user=request.user)
         return Response({f"service '{service_name}' for project '{project_name}' has been rolled back"})
     except NotFound as error:
         raise RestNotFound(detail=error.explanation)
@@ -145,27 +375,38 @@ def service_rollback(request, project_name, service_name):
 
 @api_view(["GET"])
 @view_has_perm_from_arg("service_name", "logs", unauthorized_function)
+@view_limit_per_user(logs.log_requests, too_many_log_requests)
 def service_logs(request, project_name, service_name):
-    lines = request.GET.get("lines", 100)
+    lines = log_lines(request)
     try:
-        logs = docker.service_logs(project_name, service_name, lines=lines, array=True)
-        return Response({"lines": lines, "logs": logs, "project_name": project_name, "service_name": service_name})
+        output = docker.service_logs(project_name, service_name, lines=lines, array=True)
+        return Response({"lines": lines, "logs": output, "project_name": project_name, "service_name": service_name})
     except NotFound as error:
         raise RestNotFound(detail=error.explanation)
 
 
+@disable_session_expiry_refresh
 @api_view(["GET"])
 def service_logo(request, project_name, service_name):
-    logo = docker.service_logo(project_name, service_name)
+    try:
+        logo = docker.service_logo(project_name, service_name)
+    except NotFound as error:
+        raise RestNotFound(detail=error.explanation)
     if logo is None:
         return HttpResponse()
-    return HttpResponse(logo)
+    return conditional_response(
+        request,
+        logo.etag,
+        lambda: HttpResponse(logo.content, content_type=logo.content_type),
+        private=True,
+        max_age=settings.LOGO_CACHE_MAX_AGE,
+    )
 
 
 @api_view(["POST"])
-def container_stop(request, container_id):
+def container_stop(request, container_id, host_name=None):
     try:
-        container = docker.container_stop(user=request.user, container_id=container_id)
+        container = docker.container_stop(user=request.user, container_id=container_id, host_name=host_name)
         return Response({f"container '{container.name}' has been stopped"})
     except NotFound as error:
         raise RestNotFound(detail=error.explanation)
@@ -174,9 +415,9 @@ def container_stop(request, container_id):
 
 
 @api_view(["POST"])
-def container_start(request, container_id):
+def container_start(request, container_id, host_name=None):
     try:
-        container = docker.container_start(user=request.user, container_id=container_id)
+        container = docker.container_start(user=request.user, container_id=container_id, host_name=host_name)
         return Response({f"container '{container.name}' has been started"})
     except NotFound as error:
         raise RestNotFound(detail=error.explanation)
@@ -185,9 +426,9 @@ def container_start(request, container_id):
 
 
 @api_view(["POST"])
-def container_restart(request, container_id):
+def container_restart(request, container_id, host_name=None):
     try:
-        container = docker.container_restart(user=request.user, container_id=container_id)
+        container = docker.container_restart(user=request.user, container_id=container_id, host_name=host_name)
         return Response({f"container '{container.name}' has been restarted"})
     except NotFound as error:
         raise RestNotFound(detail=error.explanation)
@@ -196,9 +437,9 @@ def container_restart(request, container_id):
 
 
 @api_view(["POST"])
-def container_remove(request, container_id):
+def container_remove(request, container_id, host_name=None):
     try:
-        container = docker.container_remove(user=request.user, container_id=container_id)
+        container = docker.container_remove(user=request.user, container_id=container_id, host_name=host_name)
         return Response({f"container '{container.name}' has been removed"})
     except NotFound as error:
         raise RestNotFound(detail=error.explanation)
@@ -207,38 +448,174 @@ def container_remove(request, container_id):
 
 
 @api_view(["GET"])
-def container_logs(request, container_id):
+@view_limit_per_user(logs.log_requests, too_many_log_requests)
+def container_logs(request, container_id, host_name=None):
+    lines = log_lines(request)
     try:
-        container = docker.container_by_id(container_id)
+        container = docker.container_by_id(container_id, host_name)
         docker.check_container_permission(user=request.user, container=container, perm="container_logs")
-        lines = int(request.GET.get("lines", 100))
-        logs = container.logs(lines=lines, array=True)
-        return Response({"lines": lines, "logs": logs, "container_name": container.name, "container_id": container_id})
+        output = container.logs(lines=lines, array=True)
+        return Response(
+            {
+                "lines": lines,
+                "logs": output,
+                "container_name": container.name,
+                "container_id": container_id,
+                "host": container.host,
+            }
+        )
     except NotFound as error:
         raise RestNotFound(detail=error.explanation)
     except CalledProcessError:
         raise APIException(detail="error getting container logs")
 
 
+def cleanup_filters(request) -> docker.CleanupFilters:
+    try:
+        return docker.CleanupFilters.parse(until=request.GET.get("until"), labels=query_list(request, "label"))
+    except ValidationError as error:
+        raise RestValidationError(detail=error.message)
+
+
+def cleanup_response(request, action: str, message: str) -> Response:
+    # ?dry_run=true reports what would be removed, ?until= and ?label= (comma separated) restrict the cleanup
+    filters = cleanup_filters(request)
+    if request.GET.get("dry_run") in ("1", "true", "True"):
+        report, message = docker.cleanup_preview(action, filters), "dry run, nothing has been removed"
+    else:
+        report = getattr(docker, action)(user=request.user, filters=filters)
+    return Response({"message": message, **report.as_dict()})
+
+
 @api_view(["POST"])
 @permission_required("docker_system.system_commands", raise_exception=True)
 def clean_old_images(request):
-    docker.clean_old_images()
-    return Response({"old images have been removed"})
+    return cleanup_response(request, "clean_old_images", "old images have been removed")
 
 
 @api_view(["POST"])
 @permission_required("docker_system.system_commands", raise_exception=True)
 def prune(request):
-    docker.prune()
-    return Response({"containers, networks and dangling images have been removed"})
+    return cleanup_response(request, "prune", "containers, networks and dangling images have been removed")
 
 
 @api_view(["POST"])
 @permission_required("docker_system.system_commands", raise_exception=True)
 def prune_all(request):
-    docker.prune_all()
-    return Response({"containers, networks, volumes and images have been removed"})
+    return cleanup_response(request, "prune_all", "containers, networks, volumes and images have been removed")
+
+
+# most recent actions first, filtered by ?project=, ?service=, ?action= (comma separated values)
+@api_view(["GET"])
+@permission_required("docker_system.system_commands", raise_exception=True)
+def action_history(request):
+    try:
+        limit = max(1, min(int(request.GET.get("limit", 100)), settings.INVENTORY_MAX_PAGE_SIZE))
+    except ValueError:
+        raise RestValidationError(detail="limit must be a number")
+    records = ActionRecord.objects.all()
+    for parameter, field in [("project", "project_name"), ("service", "service_name"), ("action", "action")]:
+        if query_list(request, parameter):
+            records = records.filter(**{field + "__in": query_list(request, parameter)})
+    return Response(ActionRecordSerializer(records[:limit], many=True).data)
+
+
+# p50/p95 durations in seconds of the service up, update and restart actions
+@api_view(["GET"])
+@permission_required("docker_system.system_commands", raise_exception=True)
+def action_durations(request):
+    service_names = query_list(request, "service") or None
+    return Response(ActionDurationSerializer(history.service_duration_percentiles(service_names), many=True).data)
+
+
+# config hash, image, orphan service and rollback container drift of every container the user can view,
+# ?kind= (comma separated) selects the kinds, ?refresh=true computes the report again
+@disable_session_expiry_refresh
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer])
+def drift(request):
+    report = docker.drift_report(refresh=request.GET.get("refresh") in ("1", "true", "True"))
+    kinds = query_list(request, "kind")
+    items = [
+        item
+        for item in report.visible_to(request.user, docker.user_can_view_app_label)
+        if not kinds or item.kind in kinds
+    ]
+    etag_source = f"{report.etag} {report.generated_at} {request.user.pk} {request.get_full_path()}"
+    return conditional_response(
+        request,
+        hashlib.sha256(etag_source.encode()).hexdigest()[:32],
+        lambda: Response(
+            {
+                "generated_at": report.generated_at,
+                "counts": report.counts(items),
+                "items": [
+                    {key: value for key, value in item._asdict().items() if key != "app_label"} for item in items
+                ],
+            }
+        ),
+        private=True,
+        no_cache=True,
+    )
+
+
+# cached disk usage (computed in the background, categories are null until then), ?refresh=true recomputes it
+@disable_session_expiry_refresh
+@api_view(["GET"])
+@permission_required("docker_system.system_commands", raise_exception=True)
+def disk_usage(request):
+    return Response(docker.disk_usage(refresh=request.GET.get("refresh") in ("1", "true", "True")).as_dict())
+
+
+# metrics of the worker process answering the request
+@disable_session_expiry_refresh
+@api_view(["GET"])
+@permission_required("docker_system.system_commands", raise_exception=True)
+def metrics(request):
+    return Response(
+        {
+            "pid": os.getpid(),
+            "single_flight": single_flight_group.metrics(),
+            "docker_hosts": {
+                docker_host.name: {"skipped": docker_host.breaker.is_open} for docker_host in hosts.hosts()
+            },
+        }
+    )
+
+
+def push_payload(request) -> dict:
+    body = request.body
+    if request.headers.get("Content-Encoding") == "gzip":
+        try:
+            # decompressed up to the limit, a small body can expand a lot
+            body = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(body, settings.AGENT_MAX_PUSH_BYTES + 1)
+        except zlib.error:
+            raise RestValidationError(detail="invalid gzip content")
+    if len(body) > settings.AGENT_MAX_PUSH_BYTES:
+        raise RestValidationError(detail=f"pushed states are limited to {settings.AGENT_MAX_PUSH_BYTES} bytes")
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise RestValidationError(detail="invalid json content")
+
+
+# state of a docker host pushed by its agent (see delegate.agent), json optionally gzip compressed,
+# 409 Conflict asks the agent to push its full state, 403 when the host is pushed by another user
+@api_view(["POST"])
+@permission_required("docker_system.push_state", raise_exception=True)
+def agent_push(request):
+    if not settings.AGENT_PUSH_ENABLED:
+        raise RestNotFound(detail="this instance doesn't accept pushed states")
+    try:
+        applied = pushed_state.apply_push(push_payload(request), request.user)
+    except ValidationError as error:
+        raise RestValidationError(detail=error.message)
+    except PermissionDenied as error:
+        raise RestPermissionDenied(detail=str(error))
+    if not applied:
+        return Response({"full_state_needed": True}, status=status.HTTP_409_CONFLICT)
+    return Response({"full_state_needed": False})
 
 
 @api_view(["GET", "PUT"])
@@ -246,11 +623,13 @@ def prune_all(request):
 def compose_file(request):
     if request.method == "GET":
         config = docker.compose_config()
+        file_content = config.original_file_content()
         serializer = ComposeFileSerializer(
             {
                 "path": config.compose_file_path,
                 "project_name": config.project_name,
-                "file_content": config.original_file_content(),
+                "file_content": file_content,
+                "file_hash": docker.compose_file_hash(file_content),
             }
         )
         return Response(serializer.data)
@@ -258,12 +637,15 @@ def compose_file(request):
         serializer = ComposeFileSerializer(data=request.data)
         if serializer.is_valid():
             file_content = serializer.validated_data["file_content"]
-            if file_content:
-                try:
-                    docker.update_compose_file_content(file_content=file_content)
-                except ValidationError as error:
-                    raise RestValidationError(detail=error.message)
-                except Exception:
-                    raise APIException()
+            expected_hash = serializer.validated_data.get("file_hash")
+            try:
+                file_hash = docker.update_compose_file_content(file_content=file_content, expected_hash=expected_hash)
+            except docker.ComposeFileConflict as error:
+                return Response({"detail": error.message}, status=status.HTTP_409_CONFLICT)
+            except ValidationError as error:
+                raise RestValidationError(detail=error.message)
+            except Exception:
+                raise APIException()
+            return Response({"file_hash": file_hash})
         else:
-            Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -1,6 +1,7 @@
 from subprocess import CalledProcessError
 from threading import Lock
 
+from asgiref.sync import iscoroutinefunction, sync_to_async
 from django.shortcuts import render
 from docker.errors import NotFound
 
@@ -11,8 +12,25 @@ global_system_lock = Lock()
 
 # checks for CalledProcessError and ThreadError and redirects appropriately
 # if lock is True, lock the function into the global system lock (only one command at a time)
+# async views (logs) are read-only and never take the lock
 def view_check_errors_redirect(error_message: str, lock: bool = False):
     def decorator(view):
+        if iscoroutinefunction(view):
+
+            async def async_wrapper(request, *args, **kwargs):
+                try:
+                    return await view(request, *args, **kwargs)
+                except NotFound as error:
+                    return await sync_to_async(render)(
+                        request, "compose_ui/errors/system_error.html", context({"error_message": error.explanation})
+                    )
+                except CalledProcessError:
+                    return await sync_to_async(render)(
+                        request, "compose_ui/errors/system_error.html", context({"error_message": error_message})
+                    )
+
+            return async_wrapper
+
         def wrapper(request, *args, **kwargs):
             try:
                 if lock:
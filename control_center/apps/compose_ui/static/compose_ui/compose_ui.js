@@ -1,3 +1,41 @@
 function loading() {
     document.getElementById("loading").style.display = "block";
-}
\ No newline at end of file
+}
+
+function loaded() {
+    document.getElementById("loading").style.display = "none";
+}
+
+// Actions on a project, service or container only refresh that part of the page:
+// the action is requested in the background and its updated fragment replaces the current one.
+// Errors and "system busy" pages are full pages and replace the whole document.
+document.addEventListener("click", function (event) {
+    var button = event.target.closest("button[formaction]:not([data-navigate])");
+    var fragment = button && button.closest("[data-fragment-url]");
+    if (!fragment || !window.fetch) {
+        return;
+    }
+    event.preventDefault();
+    loading();
+    fetch(button.formAction, {credentials: "same-origin", headers: {"X-Requested-With": "XMLHttpRequest"}})
+        .then(function (response) {
+            if (response.status === 403) {
+                // session expired or permission removed, let the full page deal with it
+                window.location.reload();
+                return;
+            }
+            return response.text().then(function (html) {
+                if (response.ok && response.headers.get("X-Fragment")) {
+                    fragment.outerHTML = html;
+                    loaded();
+                } else {
+                    document.open();
+                    document.write(html);
+                    document.close();
+                }
+            });
+        })
+        .catch(function () {
+            window.location.reload();
+        });
+});
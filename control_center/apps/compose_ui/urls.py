@@ -7,8 +7,19 @@ urlpatterns = [
     path("other_project_containers", views.other_project_containers, name="other_project_containers"),
     path("standalone_containers", views.standalone_containers, name="standalone_containers"),
     path("docker_system", views.docker_system, name="docker_system"),
+    path("history", views.action_history, name="action_history"),
+    path("drift", views.drift, name="drift"),
+    # page fragments (a single project, service or container row), also returned by the actions to AJAX callers
+    path("project/<str:project_name>/fragment", views.project_fragment, name="project_fragment"),
+    path(
+        "project/<str:project_name>/service/<str:service_name>/fragment",
+        views.service_fragment,
+        name="service_fragment",
+    ),
+    path("container/<str:container_id>/fragment", views.container_fragment, name="container_fragment"),
     # docker compose project commands
     path("project/<str:project_name>/up", views.project_up, name="project_up"),
+    path("project/<str:project_name>/apply", views.project_apply, name="project_apply"),
     path("project/<str:project_name>/down", views.project_down, name="project_down"),
     path("project/<str:project_name>/restart", views.project_restart, name="project_restart"),
     path("project/<str:project_name>/rm", views.project_rm, name="project_remove"),
@@ -27,12 +38,36 @@ urlpatterns = [
         name="service_rollback",
     ),
     path("project/<str:project_name>/service/<str:service_name>/logs", views.service_logs, name="service_logs"),
+    path(
+        "project/<str:project_name>/service/<str:service_name>/logs/stream",
+        views.service_logs_stream,
+        name="service_logs_stream",
+    ),
     # container functions
     path("container/<str:container_id>/stop", views.container_stop, name="container_stop"),
     path("container/<str:container_id>/start", views.container_start, name="container_start"),
     path("container/<str:container_id>/restart", views.container_restart, name="container_restart"),
     path("container/<str:container_id>/rm", views.container_remove, name="container_remove"),
     path("container/<str:container_id>/logs", views.container_logs, name="container_logs"),
+    path("container/<str:container_id>/logs/stream", views.container_logs_stream, name="container_logs_stream"),
+    # same container functions for the containers of the other docker hosts
+    path(
+        "host/<str:host_name>/container/<str:container_id>/fragment",
+        views.container_fragment,
+        name="container_fragment",
+    ),
+    path("host/<str:host_name>/container/<str:container_id>/stop", views.container_stop, name="container_stop"),
+    path("host/<str:host_name>/container/<str:container_id>/start", views.container_start, name="container_start"),
+    path(
+        "host/<str:host_name>/container/<str:container_id>/restart", views.container_restart, name="container_restart"
+    ),
+    path("host/<str:host_name>/container/<str:container_id>/rm", views.container_remove, name="container_remove"),
+    path("host/<str:host_name>/container/<str:container_id>/logs", views.container_logs, name="container_logs"),
+    path(
+        "host/<str:host_name>/container/<str:container_id>/logs/stream",
+        views.container_logs_stream,
+        name="container_logs_stream",
+    ),
     # docker system commands
     path("system/view_compose_file", views.view_compose_file, name="view_compose_file"),
     path("system/edit_compose_file", views.edit_compose_file, name="system_edit_compose_file"),
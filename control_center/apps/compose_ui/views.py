@@ -1,151 +1,255 @@
 from subprocess import CalledProcessError
+from typing import Callable, Optional
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.decorators import login_required, permission_required
 from django.core.exceptions import PermissionDenied, ValidationError
-from django.http import Http404, HttpResponseServerError, HttpResponseForbidden, HttpResponseRedirect
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseBadRequest,
+    HttpResponseServerError,
+    HttpResponseForbidden,
+    HttpResponseRedirect,
+    StreamingHttpResponse,
+)
 from django.shortcuts import render
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
 from docker.errors import NotFound
 
 from control_center.apps.compose_ui.context import context
 from control_center.apps.compose_ui.decorators import view_check_errors_redirect
-from control_center.apps.delegate import docker
-from control_center.libs.decorators.view_decorators import view_has_perm_from_arg
+from control_center.apps.delegate import async_docker, docker, history, logs, reconcile
+from control_center.apps.delegate.models import ActionRecord
+from control_center.libs.decorators.view_decorators import (
+    disable_session_expiry_refresh,
+    is_ajax,
+    view_has_perm_from_arg,
+    view_limit_per_user,
+)
+
+# set on fragment responses so that the page script knows it can swap them in place
+FRAGMENT_HEADER = "X-Fragment"
+
+CLEANUP_REPORT_SESSION_KEY = "cleanup_report"
+
+# template rendering runs context processors hitting the database (user, perms), so it stays synchronous
+async_render = sync_to_async(render)
 
 
 def unauthorized_function():
     return HttpResponseForbidden  # 403 Forbidden is better than 404
 
 
+def too_many_log_requests(limit):
+    message = f"You already have {limit.limit} logs loading or followed, please close one of them and try again."
+    return HttpResponse(message, status=429, content_type="text/plain")
+
+
 @login_required
-def managed_containers(request):
+async def managed_containers(request):
     ctx = context()
-    project_name = docker.compose_config().project_name if docker.compose_config() else None
+    config = await async_docker.compose_config()
+    project_name = config.project_name if config else None
     if project_name:
-        ctx = context({"project_list": [docker.compose_project_by_name(docker.compose_config().project_name)]})
-    return render(request, "compose_ui/project_containers.html", ctx)
+        ctx = context({"project_list": [await async_docker.compose_project_by_name(project_name)]})
+    return await async_render(request, "compose_ui/project_containers.html", ctx)
 
 
 @login_required
-def other_project_containers(request):
+async def other_project_containers(request):
     ctx = context()
-    project_name_to_exclude = docker.compose_config().project_name if docker.compose_config() else None
+    config = await async_docker.compose_config()
+    project_name_to_exclude = config.project_name if config else None
     if project_name_to_exclude:
+        container_list = await async_docker.containers_for_project(exclude_project_name=project_name_to_exclude)
         ctx = context(
             {
-                "container_list": docker.containers_for_project(exclude_project_name=project_name_to_exclude),
+                "container_list": container_list,
                 "other_projects": True,
+                "unavailable_hosts": container_list.unavailable_hosts,
             }
         )
-    return render(request, "compose_ui/standalone_containers.html", ctx)
+    return await async_render(request, "compose_ui/standalone_containers.html", ctx)
+
+
+@login_required
+async def standalone_containers(request):
+    container_list = await async_docker.standalone_containers()
+    ctx = context({"container_list": container_list, "unavailable_hosts": container_list.unavailable_hosts})
+    return await async_render(request, "compose_ui/standalone_containers.html", ctx)
+
+
+@login_required
+def project_fragment(request, project_name):
+    try:
+        return project_fragment_response(request, project_name)
+    except NotFound as error:
+        raise Http404(error.explanation)
 
 
 @login_required
-def standalone_containers(request):
-    ctx = context({"container_list": docker.standalone_containers()})
-    return render(request, "compose_ui/standalone_containers.html", ctx)
+@view_has_perm_from_arg("service_name", "view", unauthorized_function)
+def service_fragment(request, project_name, service_name):
+    try:
+        return service_fragment_response(request, project_name, service_name)
+    except NotFound as error:
+        raise Http404(error.explanation)
+
+
+@login_required
+def container_fragment(request, container_id, host_name=None):
+    return container_fragment_response(request, container_id, host_name)
+
+
+@login_required
+def drift(request):
+    report = docker.drift_report(refresh=bool(request.GET.get("refresh")))
+    items = report.visible_to(request.user, docker.user_can_view_app_label)
+    ctx = {"items": items, "counts": report.counts(items), "generated_at": report.generated_at}
+    return render(request, "compose_ui/drift.html", context(ctx))
 
 
 @login_required
 def docker_system(request):
+    # report of the last cleanup (see system_cleanup)
+    return system_page(request, report=request.session.pop(CLEANUP_REPORT_SESSION_KEY, None))
+
+
+def system_page(request, **items):
     config = docker.compose_config()
-    return render(request, "compose_ui/system.html", context({"compose_file": bool(config)}))
+    filters = {"until": request.GET.get("until", ""), "label": request.GET.get("label", "")}
+    # only users allowed to clean up see the disk usage, rendered from the cache
+    if request.user.has_perm("docker_system.system_commands"):
+        items["disk_usage"] = docker.disk_usage(refresh=bool(request.GET.get("refresh_disk_usage")))
+    return render(request, "compose_ui/system.html", context({"compose_file": bool(config), **filters, **items}))
 
 
 @login_required
 @view_has_perm_from_arg("project_name", "up", unauthorized_function)
 @view_check_errors_redirect("error project up", lock=True)
 def project_up(request, project_name):
-    docker.project_up(project_name=project_name)
-    return redirect_to_referer(request)
+    docker.project_up(project_name=project_name, user=request.user)
+    return action_response(request, lambda: project_fragment_response(request, project_name))
+
+
+# without ?confirm=true only shows the plan (without the system lock), with it brings up the services whose
+# configuration changed
+@login_required
+@view_has_perm_from_arg("project_name", "up", unauthorized_function)
+@view_check_errors_redirect("error applying project changes")
+def project_apply(request, project_name):
+    if request.GET.get("confirm"):
+        return project_apply_confirmed(request, project_name=project_name)
+    return project_apply_response(request, project_name, docker.project_apply_plan(project_name=project_name), False)
+
+
+@view_check_errors_redirect("error applying project changes", lock=True)
+def project_apply_confirmed(request, project_name):
+    plans = docker.project_apply(project_name=project_name, user=request.user)
+    return project_apply_response(request, project_name, plans, True)
+
+
+def project_apply_response(request, project_name, plans, applied: bool):
+    changes = [item for item in plans if item.action in (reconcile.CREATE, reconcile.RECREATE)]
+    items = {"project_name": project_name, "plans": plans, "changes": changes, "applied": applied}
+    return render(request, "compose_ui/apply.html", context(items))
 
 
 @login_required
 @view_has_perm_from_arg("project_name", "down", unauthorized_function)
 @view_check_errors_redirect("error project down", lock=True)
 def project_down(request, project_name):
-    docker.project_down(project_name=project_name)
-    return redirect_to_referer(request)
+    docker.project_down(project_name=project_name, user=request.user)
+    return action_response(request, lambda: project_fragment_response(request, project_name))
 
 
 @login_required
 @view_has_perm_from_arg("project_name", "restart", unauthorized_function)
 @view_check_errors_redirect("error restarting project", lock=True)
 def project_restart(request, project_name):
-    docker.project_restart(project_name=project_name)
-    return redirect_to_referer(request)
+    docker.project_restart(project_name=project_name, user=request.user)
+    return action_response(request, lambda: project_fragment_response(request, project_name))
 
 
 @login_required
 @view_has_perm_from_arg("project_name", "remove", unauthorized_function)
 @view_check_errors_redirect("error removing stopped containers for project", lock=True)
 def project_rm(request, project_name):
-    docker.project_remove(project_name=project_name)
-    return redirect_to_referer(request)
+    docker.project_remove(project_name=project_name, user=request.user)
+    return action_response(request, lambda: project_fragment_response(request, project_name))
 
 
 @login_required
 @view_has_perm_from_arg("service_name", "stop", unauthorized_function)
 @view_check_errors_redirect("error stopping service", lock=True)
 def service_stop(request, project_name, service_name):
-    docker.service_stop(project_name=project_name, service_name=service_name)
-    return redirect_to_referer(request)
+    docker.service_stop(project_name=project_name, service_name=service_name, user=request.user)
+    return action_response(request, lambda: service_fragment_response(request, project_name, service_name))
 
 
 @login_required
 @view_has_perm_from_arg("service_name", "start", unauthorized_function)
 @view_check_errors_redirect("error starting service", lock=True)
 def service_start(request, project_name: str, service_name: str):
-    docker.service_start(project_name=project_name, service_name=service_name)
-    return redirect_to_referer(request)
+    docker.service_start(project_name=project_name, service_name=service_name, user=request.user)
+    return action_response(request, lambda: service_fragment_response(request, project_name, service_name))
 
 
 @login_required
 @view_has_perm_from_arg("service_name", "up", unauthorized_function)
 @view_check_errors_redirect("error service up", lock=True)
 def service_up(request, project_name, service_name):
-    docker.service_up(project_name=project_name, service_name=service_name)
-    return redirect_to_referer(request)
+    docker.service_up(project_name=project_name, service_name=service_name, user=request.user)
+    return action_response(request, lambda: service_fragment_response(request, project_name, service_name))
 
 
 @login_required
 @view_has_perm_from_arg("service_name", "remove", unauthorized_function)
 @view_check_errors_redirect("error removing stopped containers for service", lock=True)
 def service_remove(request, project_name, service_name):
-    docker.service_remove(project_name=project_name, service_name=service_name)
-    return redirect_to_referer(request)
+    docker.service_remove(project_name=project_name, service_name=service_name, user=request.user)
+    return action_response(request, lambda: service_fragment_response(request, project_name, service_name))
 
 
 @login_required
 @view_has_perm_from_arg("service_name", "restart", unauthorized_function)
 @view_check_errors_redirect("error restarting service", lock=True)
 def service_restart(request, project_name, service_name):
-    docker.service_restart(project_name=project_name, service_name=service_name)
-    return redirect_to_referer(request)
+    docker.service_restart(project_name=project_name, service_name=service_name, user=request.user)
+    return action_response(request, lambda: service_fragment_response(request, project_name, service_name))
 
 
 @login_required
 @view_has_perm_from_arg("service_name", "update", unauthorized_function)
 @view_check_errors_redirect("error updating service", lock=True)
 def service_update(request, project_name, service_name):
-    docker.service_update(project_name=project_name, service_name=service_name)
-    return redirect_to_referer(request)
+    docker.service_update(project_name=project_name, service_name=service_name, user=request.user)
+    return action_response(request, lambda: service_fragment_response(request, project_name, service_name))
 
 
 @login_required
 @view_has_perm_from_arg("service_name", "rollback", unauthorized_function)
 @view_check_errors_redirect("error service rollback", lock=True)
 def service_rollback(request, project_name, service_name):
-    docker.service_rollback(project_name=project_name, service_name=service_name)
-    return redirect_to_referer(request)
+    docker.service_rollback(project_name=project_name, service_name=service_name, user=request.user)
+    return action_response(request, lambda: service_fragment_response(request, project_name, service_name))
 
 
 @login_required
 @view_has_perm_from_arg("service_name", "logs", unauthorized_function)
+@view_limit_per_user(logs.log_requests, too_many_log_requests)
 @view_check_errors_redirect("error getting service logs")
-def service_logs(request, project_name, service_name):
-    lines = request.GET.get("lines", 100)
-    logs = docker.service_logs(project_name=project_name, service_name=service_name, lines=lines)
-    return render(
+async def service_logs(request, project_name, service_name):
+    try:
+        lines = logs.parse_lines(request.GET.get("lines"))
+    except ValidationError as error:
+        return HttpResponseBadRequest(error.message)
+    output = await async_docker.service_logs(project_name=project_name, service_name=service_name, lines=lines)
+    return await async_render(
         request,
         "compose_ui/logs.html",
         context(
@@ -154,72 +258,95 @@ def service_logs(request, project_name, service_name):
                 "lines": lines,
                 "project_name": project_name,
                 "service_name": service_name,
-                "logs": logs,
+                "logs": output,
+                "stream_url": stream_url(request, "service_logs_stream", project_name, service_name),
             }
         ),
     )
 
 
+@disable_session_expiry_refresh
 @login_required
-def container_stop(request, container_id):
+@view_has_perm_from_arg("service_name", "logs", unauthorized_function)
+@view_limit_per_user(logs.log_requests, too_many_log_requests)
+async def service_logs_stream(request, project_name, service_name):
+    if not isinstance(request, ASGIRequest):
+        return streaming_unavailable()
     try:
-        docker.container_stop(user=request.user, container_id=container_id)
+        await async_docker.compose_service_config(project_name, service_name)
+        lines = logs.parse_lines(request.GET.get("lines"))
+    except NotFound as error:
+        raise Http404(error.explanation)
+    except ValidationError as error:
+        return HttpResponseBadRequest(error.message)
+    return StreamingHttpResponse(
+        async_docker.stream_service_logs(project_name, service_name, lines), content_type="text/plain"
+    )
+
+
+@login_required
+def container_stop(request, container_id, host_name=None):
+    try:
+        docker.container_stop(user=request.user, container_id=container_id, host_name=host_name)
     except NotFound as error:
         raise Http404(error.explanation)
     except CalledProcessError:
         return HttpResponseServerError("error stopping container")
     except PermissionDenied:
         return HttpResponseForbidden()
-    return redirect_to_referer(request)
+    return action_response(request, lambda: container_fragment_response(request, container_id, host_name))
 
 
 @login_required
-def container_start(request, container_id):
+def container_start(request, container_id, host_name=None):
     try:
-        docker.container_start(user=request.user, container_id=container_id)
+        docker.container_start(user=request.user, container_id=container_id, host_name=host_name)
     except NotFound as error:
         raise Http404(error.explanation)
     except CalledProcessError:
         return HttpResponseServerError("error starting container")
     except PermissionDenied:
         return HttpResponseForbidden()
-    return redirect_to_referer(request)
+    return action_response(request, lambda: container_fragment_response(request, container_id, host_name))
 
 
 @login_required
-def container_restart(request, container_id):
+def container_restart(request, container_id, host_name=None):
     try:
-        docker.container_restart(user=request.user, container_id=container_id)
+        docker.container_restart(user=request.user, container_id=container_id, host_name=host_name)
     except NotFound as error:
         raise Http404(error.explanation)
     except CalledProcessError:
         return HttpResponseServerError("error restarting container")
     except PermissionDenied:
         return HttpResponseForbidden()
-    return redirect_to_referer(request)
+    return action_response(request, lambda: container_fragment_response(request, container_id, host_name))
 
 
 @login_required
-def container_remove(request, container_id):
+def container_remove(request, container_id, host_name=None):
     try:
-        docker.container_remove(user=request.user, container_id=container_id)
+        docker.container_remove(user=request.user, container_id=container_id, host_name=host_name)
     except NotFound as error:
         raise Http404(error.explanation)
     except CalledProcessError:
         return HttpResponseServerError("error removing container")
     except PermissionDenied:
         return HttpResponseForbidden()
-    return redirect_to_referer(request)
+    return action_response(request, lambda: container_fragment_response(request, container_id, host_name))
 
 
 @login_required
-def container_logs(request, container_id):
+@view_limit_per_user(logs.log_requests, too_many_log_requests)
+async def container_logs(request, container_id, host_name=None):
     try:
-        container = docker.container_by_id(container_id)
-        docker.check_container_permission(user=request.user, container=container, perm="container_logs")
-        lines = int(request.GET.get("lines", 100))
-        logs = container.logs(lines)
-        return render(
+        container = await async_docker.container_by_id(container_id, host_name)
+        await async_docker.check_container_permission(
+            user=await request.auser(), container=container, perm="container_logs"
+        )
+        lines = logs.parse_lines(request.GET.get("lines"))
+        output = await async_docker.container_logs(container, lines)
+        return await async_render(
             request,
             "compose_ui/logs.html",
             context(
@@ -227,40 +354,79 @@ def container_logs(request, container_id):
                     "auto_refresh": False,  # never auto-refresh logs
                     "lines": lines,
                     "container_name": container.name,
-                    "logs": logs,
+                    "logs": output,
+                    "stream_url": stream_url(
+                        request, "container_logs_stream", *container_url_arguments(container_id, host_name)
+                    ),
                 }
             ),
         )
     except NotFound as error:
         raise Http404(error.explanation)
+    except ValidationError as error:
+        return HttpResponseBadRequest(error.message)
     except CalledProcessError:
         return HttpResponseServerError("error getting container logs")
     except PermissionDenied:
         return HttpResponseForbidden()
 
 
+@disable_session_expiry_refresh
+@login_required
+@view_limit_per_user(logs.log_requests, too_many_log_requests)
+async def container_logs_stream(request, container_id, host_name=None):
+    if not isinstance(request, ASGIRequest):
+        return streaming_unavailable()
+    try:
+        container = await async_docker.container_by_id(container_id, host_name)
+        await async_docker.check_container_permission(
+            user=await request.auser(), container=container, perm="container_logs"
+        )
+        lines = logs.parse_lines(request.GET.get("lines"))
+    except NotFound as error:
+        raise Http404(error.explanation)
+    except PermissionDenied:
+        return HttpResponseForbidden()
+    except ValidationError as error:
+        return HttpResponseBadRequest(error.message)
+    return StreamingHttpResponse(async_docker.stream_container_logs(container, lines), content_type="text/plain")
+
+
+@login_required()
+@permission_required("docker_system.system_commands", raise_exception=True)
+def action_history(request):
+    return render(
+        request,
+        "compose_ui/history.html",
+        context(
+            {
+                "durations": history.service_duration_percentiles(),
+                "records": ActionRecord.objects.all()[:100],
+                "stats_days": settings.ACTION_HISTORY_STATS_DAYS,
+            }
+        ),
+    )
+
+
 @login_required()
 @permission_required("docker_system.system_commands", raise_exception=True)
 @view_check_errors_redirect("error removing dangling images", lock=True)
 def clean_old_images(request):
-    docker.clean_old_images()
-    return redirect_to_referer(request)
+    return system_cleanup(request, "clean_old_images")
 
 
 @login_required()
 @permission_required("docker_system.system_commands", raise_exception=True)
 @view_check_errors_redirect("error with docker system prune", lock=True)
 def prune(request):
-    docker.prune()
-    return redirect_to_referer(request)
+    return system_cleanup(request, "prune")
 
 
 @login_required()
 @permission_required("docker_system.system_commands", raise_exception=True)
 @view_check_errors_redirect("error with docker system prune all", lock=True)
 def prune_all(request):
-    docker.prune_all()
-    return redirect_to_referer(request)
+    return system_cleanup(request, "prune_all")
 
 
 @login_required()
@@ -268,11 +434,10 @@ def prune_all(request):
 @view_check_errors_redirect("error with reading compose file", lock=True)
 def view_compose_file(request, error=None):
     compose_config = docker.compose_config()
-    return render(
-        request,
-        "compose_ui/file_editor.html",
-        context({"doc_file": compose_config.original_file_content(), "error": error}),
-    )
+    file_content = compose_config.original_file_content()
+    # the hash of the content being edited detects concurrent edits when saving
+    items = {"doc_file": file_content, "file_hash": docker.compose_file_hash(file_content), "error": error}
+    return render(request, "compose_ui/file_editor.html", context(items))
 
 
 @login_required()
@@ -281,12 +446,87 @@ def edit_compose_file(request):
     file_content: str = request.POST["file_content"]
     if file_content:
         try:
-            docker.update_compose_file_content(file_content=file_content)
+            docker.update_compose_file_content(file_content=file_content, expected_hash=request.POST.get("file_hash"))
         except ValidationError as error:
             return view_compose_file(request, error=error.message)
         else:
-            return managed_containers(request)
+            return HttpResponseRedirect(reverse("managed_containers"))
+
+
+# live log streams hold the connection open, which only the ASGI deployment can afford
+def stream_url(request, url_name: str, *args):
+    return reverse(url_name, args=args) if isinstance(request, ASGIRequest) else None
+
+
+# the containers of other hosts are addressed by host name and id
+def container_url_arguments(container_id: str, host_name: Optional[str]) -> list:
+    return [host_name, container_id] if host_name else [container_id]
+
+
+def streaming_unavailable():
+    return HttpResponse("log streaming is only available with the ASGI deployment", status=501)
+
+
+# a preview is shown right away, the report of an actual cleanup is shown by the system page after the redirect
+def system_cleanup(request, action: str) -> HttpResponse:
+    try:
+        labels = request.GET.get("label", "").split(",")
+        filters = docker.CleanupFilters.parse(until=request.GET.get("until"), labels=labels)
+    except ValidationError as error:
+        return system_page(request, error=error.message)
+    if request.GET.get("dry_run"):
+        return system_page(request, report=docker.cleanup_preview(action, filters).as_dict())
+    report = getattr(docker, action)(user=request.user, filters=filters)
+    request.session[CLEANUP_REPORT_SESSION_KEY] = report.as_dict()
+    return redirect_to_referer(request)
 
 
 def redirect_to_referer(request):
     return HttpResponseRedirect(request.META.get("HTTP_REFERER", "/"))
+
+
+# AJAX callers (see compose_ui.js) get the updated fragment of the page instead of a redirect reloading everything
+def action_response(request, fragment_response: Callable[[], HttpResponse]) -> HttpResponse:
+    response = fragment_response() if is_ajax(request) else redirect_to_referer(request)
+    patch_vary_headers(response, ["X-Requested-With"])
+    return response
+
+
+def fragment(request, template_name: str, items: dict) -> HttpResponse:
+    response = render(request, template_name, context(items))
+    response[FRAGMENT_HEADER] = "true"
+    return response
+
+
+def project_fragment_response(request, project_name: str) -> HttpResponse:
+    project = docker.compose_project_by_name(project_name=project_name)
+    return fragment(request, "compose_ui/snippets/projects_table.html", {"project_list": [project]})
+
+
+def service_fragment_response(request, project_name: str, service_name: str) -> HttpResponse:
+    # only lists the containers of this service
+    service = docker.compose_service(project_name=project_name, service_name=service_name)
+    return fragment(request, "compose_ui/snippets/service.html", {"service": service})
+
+
+def container_fragment_response(request, container_id: str, host_name: Optional[str] = None) -> HttpResponse:
+    try:
+        container = docker.container_by_id(container_id, host_name)
+    except NotFound:
+        # the container is gone (removed), the caller drops its row
+        response = HttpResponse()
+        response[FRAGMENT_HEADER] = "true"
+        return response
+    config = docker.compose_config()
+    if not docker.user_can_view_container(request.user, container, config):
+        return HttpResponseForbidden()
+    service_name = docker.container_permission_app_label(container, config)
+    service_hash = None
+    if config and container.project == config.project_name and container.is_local:
+        service_config = next(filter(lambda ser: ser.service_name == service_name, config.service_configs), None)
+        service_hash = service_config.hash if service_config else None
+    return fragment(
+        request,
+        "compose_ui/snippets/container_row.html",
+        {"container": container, "service_name": service_name, "service_hash": service_hash},
+    )
@@ -0,0 +1,190 @@
+import gzip
+import json
+import time
+from logging import getLogger
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional, Set, Tuple
+from uuid import uuid4
+
+import requests
+from django.conf import settings
+from docker.errors import DockerException, NotFound
+
+from control_center.apps.delegate import docker, hosts
+from control_center.apps.delegate.objects import Container
+
+# Agent mode (see the dcc_agent command): runs beside a docker daemon, keeps the state of its containers up to date
+# from the docker events and pushes the changes to a central control center (see pushed_state). The events of
+# AGENT_PUSH_INTERVAL seconds are pushed together (gzip compressed json), only the containers that changed are
+# inspected and sent. A push is sent every AGENT_HEARTBEAT_INTERVAL seconds when nothing happens, and the full state
+# every AGENT_RESYNC_INTERVAL seconds, after a failed push or when the events stream was interrupted.
+
+logger = getLogger("control_center")
+
+# container events that change what is shown (not exec, attach, top...)
+STATE_EVENTS = {
+    "create",
+    "start",
+    "restart",
+    "die",
+    "stop",
+    "kill",
+    "oom",
+    "pause",
+    "unpause",
+    "rename",
+    "update",
+    "destroy",
+}
+
+
+class FullStateNeeded(Exception):
+    pass
+
+
+class Agent(object):
+    def __init__(self, central_url: str, token: str, host_name: str, docker_host: Optional[hosts.DockerHost] = None):
+        self.push_url = central_url.rstrip("/") + "/api/agent/push"
+        self.token = token
+        self.host_name = host_name
+        self.docker_host = docker_host or hosts.local_host()
+        self.run_id = uuid4().hex
+        self.sequence = 0
+        # records known by the central instance
+        self.pushed: Dict[str, dict] = {}
+        # one connection to the central instance for all the pushes
+        self.session = requests.Session()
+        self._lock = Lock()
+        self._changed = Event()
+        self._stopped = Event()
+        # ids of the containers with events since the last push
+        self._dirty: Set[str] = set()
+        self._full_state_needed = True
+        self._resync_at = 0.0
+        self._events_since = int(time.time())
+        # image id: tags
+        self._tags: Dict[str, Tuple[str, ...]] = {}
+
+    def run(self, once: bool = False):
+        if not once:
+            Thread(target=self.watch_events, name="agent-events", daemon=True).start()
+        while not self._stopped.is_set():
+            self.push_changes()
+            if once:
+                return
+            self._changed.wait(timeout=settings.AGENT_HEARTBEAT_INTERVAL)
+            # the events coming in the meantime are pushed together
+            self._stopped.wait(settings.AGENT_PUSH_INTERVAL)
+
+    def stop(self):
+        self._stopped.set()
+        self._changed.set()
+
+    def watch_events(self):
+        while not self._stopped.is_set():
+            try:
+                events = self.docker_host.client.events(
+                    decode=True, filters={"type": "container"}, since=self._events_since
+                )
+                for event in events:
+                    self._events_since = event.get("time", self._events_since)
+                    # health_status: healthy, exec_start: ...
+                    if event.get("Action", "").split(":")[0] in STATE_EVENTS:
+                        with self._lock:
+                            self._dirty.add(event.get("id") or event["Actor"]["ID"])
+                        self._changed.set()
+                    if self._stopped.is_set():
+                        events.close()
+            except (DockerException, requests.RequestException) as error:
+                logger.warning(f"docker events of {self.docker_host.name} interrupted: {error}")
+            # events may have been missed
+            with self._lock:
+                self._full_state_needed = True
+            self._changed.set()
+            self._stopped.wait(settings.AGENT_PUSH_INTERVAL)
+
+    def push_changes(self):
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            full = self._full_state_needed or time.monotonic() >= self._resync_at
+            self._full_state_needed = False
+            self._changed.clear()
+        try:
+            try:
+                if full:
+                    self.push_full_state()
+                else:
+                    changed, removed = self.changes(dirty)
+                    self.push(changed, removed, full=False)
+            except FullStateNeeded:
+                self.push_full_state()
+        except (DockerException, requests.RequestException) as error:
+            logger.warning(f"state of {self.host_name} not pushed: {error}")
+            # the central instance may have applied the push or not
+            with self._lock:
+                self._full_state_needed = True
+
+    def push_full_state(self):
+        records = {
+            container.id: container.as_record() for container in docker.list_containers(docker_host=self.docker_host)
+        }
+        self.push(records, [], full=True)
+        self._resync_at = time.monotonic() + settings.AGENT_RESYNC_INTERVAL
+
+    def changes(self, container_ids: Set[str]) -> Tuple[Dict[str, dict], List[str]]:
+        changed, removed = {}, []
+        api = self.docker_host.client.api
+        for container_id in container_ids:
+            try:
+                inspect = api.inspect_container(container_id)
+            except NotFound:
+                if container_id in self.pushed:
+                    removed.append(container_id)
+                continue
+            container = Container.from_summary(
+                inspect, tags=self.image_tags(inspect["Image"]), state=inspect["State"], host=self.host_name
+            )
+            record = container.as_record()
+            if self.pushed.get(container.id) != record:
+                changed[container.id] = record
+        return changed, removed
+
+    def image_tags(self, image_id: str) -> Tuple[str, ...]:
+        if image_id not in self._tags:
+            # a new image, tags of all the images are read again in a single call
+            self._tags = {
+                image["Id"]: tuple(tag for tag in image.get("RepoTags") or [] if tag != "<none>:<none>")
+                for image in self.docker_host.client.api.images()
+            }
+        return self._tags.get(image_id, ())
+
+    def push(self, containers: Dict[str, dict], removed: List[str], full: bool):
+        self.sequence += 1
+        payload = {
+            "host": self.host_name,
+            "agent_run": self.run_id,
+            "sequence": self.sequence,
+            "full": full,
+            "containers": containers,
+            "removed": removed,
+        }
+        response = self.session.post(
+            self.push_url,
+            data=gzip.compress(json.dumps(payload, separators=(",", ":")).encode()),
+            headers={
+                "Authorization": f"Token {self.token}",
+                "Content-Type": "application/json",
+                "Content-Encoding": "gzip",
+            },
+            timeout=settings.AGENT_PUSH_TIMEOUT,
+        )
+        if response.status_code == 409:
+            raise FullStateNeeded()
+        response.raise_for_status()
+        if full:
+            self.pushed = dict(containers)
+        else:
+            self.pushed.update(containers)
+            for container_id in removed:
+                self.pushed.pop(container_id, None)
+        logger.debug(f"pushed {len(containers)} containers and {len(removed)} removals of {self.host_name}")
@@ -0,0 +1,131 @@
+import asyncio
+from logging import getLogger
+from subprocess import CalledProcessError
+from typing import AsyncIterator, List, Union
+
+from asgiref.sync import sync_to_async
+from docker.errors import NotFound
+
+from control_center.apps.delegate import docker
+from control_center.apps.delegate.logs import LOG_CHUNK_SIZE, LogLines, LogTail
+from control_center.apps.delegate.objects import (
+    ComposeServiceConfig,
+    Container,
+    compose_logs_arguments,
+    format_log_tail,
+    recompose_log_line_with_formatted_date,
+)
+
+# Async variants of the delegate functions used by the async views (ASGI deployment).
+# Docker API calls are offloaded to a thread pool (docker-py is blocking), docker compose commands run as
+# asyncio subprocesses so that a single worker can wait on many of them at once.
+
+logger = getLogger("control_center")
+
+# compose_config may synchronize permissions in the database, so it stays thread sensitive
+compose_config = sync_to_async(docker.compose_config)
+compose_project_by_name = sync_to_async(docker.compose_project_by_name, thread_sensitive=False)
+containers_for_project = sync_to_async(docker.containers_for_project, thread_sensitive=False)
+standalone_containers = sync_to_async(docker.standalone_containers, thread_sensitive=False)
+container_by_id = sync_to_async(docker.container_by_id, thread_sensitive=False)
+check_container_permission = sync_to_async(docker.check_container_permission)
+
+
+async def execute_compose_command(project_name: str, args: List[str], debug: bool = True) -> str:
+    arguments = docker.compose_command_arguments(project_name, args)
+    if debug:
+        logger.debug("command:\n" + str(arguments))
+    process = await asyncio.create_subprocess_exec(
+        *arguments, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+    )
+    output, _ = await process.communicate()
+    if process.returncode:
+        logger.exception(f"error running docker compose command: {output.decode()}")
+        raise CalledProcessError(process.returncode, arguments, output=output)
+    output = output.decode()
+    if debug:
+        logger.debug("output:\n" + output)
+    return output
+
+
+async def compose_service_config(project_name: str, service_name: str) -> ComposeServiceConfig:
+    # only the configuration is needed to get logs, there is no need to list the service containers
+    config = await compose_config()
+    try:
+        return config.get_service_config(project_name=project_name, service_name=service_name)
+    except StopIteration:
+        message = f"couldn't find service '{service_name}' in project '{project_name}'"
+        raise NotFound(message="Not Found", explanation=message)
+
+
+async def service_logs(project_name: str, service_name: str, lines: int = 100, array=False) -> Union[List[str], str]:
+    await compose_service_config(project_name, service_name)
+    return format_log_tail(await compose_logs(project_name, service_name, lines), array=array)
+
+
+async def compose_logs(project_name: str, service_name: str, lines: int) -> LogTail:
+    # the output is read in chunks, only the most recent LOGS_MAX_BYTES are kept
+    arguments = docker.compose_command_arguments(project_name, compose_logs_arguments(service_name, lines))
+    process = await asyncio.create_subprocess_exec(
+        *arguments, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT
+    )
+    # remove first line of logs (it's useless)
+    tail = LogTail(skip_first_line=True)
+    try:
+        while chunk := await process.stdout.read(LOG_CHUNK_SIZE):
+            tail.feed(chunk)
+        await process.wait()
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+    if process.returncode:
+        output = tail.text()
+        logger.error(f"error running docker compose command: {output}")
+        raise CalledProcessError(process.returncode, arguments, output=output.encode())
+    return tail
+
+
+async def container_logs(container: Container, lines: int = 100, array=False) -> Union[List[str], str]:
+    return await sync_to_async(container.logs, thread_sensitive=False)(lines, array=array)
+
+
+async def stream_service_logs(project_name: str, service_name: str, lines: int = 100) -> AsyncIterator[str]:
+    await compose_service_config(project_name, service_name)
+    process = await asyncio.create_subprocess_exec(
+        *docker.compose_command_arguments(project_name, compose_logs_arguments(service_name, lines, follow=True)),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+    )
+    # remove first line of logs (it's useless)
+    log_lines = LogLines(skip_first_line=True)
+    try:
+        # read in chunks rather than lines, a line can be longer than the buffer of the stream reader
+        while chunk := await process.stdout.read(LOG_CHUNK_SIZE):
+            if complete := log_lines.feed(chunk):
+                yield format_log_lines(complete)
+        if last := log_lines.close():
+            yield format_log_lines(last)
+    finally:
+        # the client went away or the stream ended
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+async def stream_container_logs(container: Container, lines: int = 100) -> AsyncIterator[str]:
+    stream = await sync_to_async(container.follow_logs, thread_sensitive=False)(lines)
+    read_chunk = sync_to_async(next, thread_sensitive=False)
+    log_lines = LogLines()
+    try:
+        while (chunk := await read_chunk(stream, None)) is not None:
+            if complete := log_lines.feed(chunk):
+                yield format_log_lines(complete)
+        if last := log_lines.close():
+            yield format_log_lines(last)
+    finally:
+        stream.close()
+
+
+def format_log_lines(lines: List[str]) -> str:
+    return "".join(recompose_log_line_with_formatted_date(line, "%m-%d %H:%M:%S") + "\n" for line in lines)
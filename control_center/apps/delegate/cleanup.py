@@ -0,0 +1,203 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from logging import getLogger
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils.dateparse import parse_datetime
+from docker import APIClient
+from docker.errors import APIError
+
+# Docker cleanup: the daemon prunes each category in bulk (with until= and label= filters), then the dangling images
+# still used by stopped containers, which the prune leaves behind, are removed concurrently.
+# Every category reports the number of objects and the bytes reclaimed, a dry run reports what would be removed.
+
+logger = getLogger("control_center")
+
+CATEGORIES = ["containers", "images", "networks", "volumes"]
+
+# prune only removes anonymous volumes (API >= 1.42), they carry this label
+ANONYMOUS_VOLUME_LABEL = "com.docker.volume.anonymous"
+
+_duration_pattern = re.compile(r"^(?:(\d+)h)?(?:(\d+)m)?(?:(\d+)s)?$")
+
+
+class CleanupFilters(NamedTuple):
+    # unix timestamp, only objects created before it are removed
+    until: Optional[int] = None
+    # "key" or "key=value", objects must have all of them
+    labels: Tuple[str, ...] = ()
+
+    @classmethod
+    def parse(cls, until: Optional[str] = None, labels: Sequence[str] = ()) -> "CleanupFilters":
+        # until is a duration ("24h", "1h30m"), a unix timestamp or a date ("2024-01-31" or "2024-01-31T12:00:00").
+        # it is turned into a timestamp once so that a dry run and the following cleanup select the same objects
+        return cls(until=parse_until(until) if until else None, labels=tuple(label for label in labels if label))
+
+    def daemon_filters(self, until: bool = True) -> Dict:
+        filters = {}
+        if until and self.until is not None:
+            filters["until"] = str(self.until)
+        if self.labels:
+            filters["label"] = list(self.labels)
+        return filters
+
+    def created_before_until(self, created: Optional[float]) -> bool:
+        return self.until is None or created is None or created < self.until
+
+
+def parse_until(until: str) -> int:
+    until = until.strip()
+    if until.isdigit():
+        return int(until)
+    duration = _duration_pattern.match(until)
+    if duration and any(duration.groups()):
+        hours, minutes, seconds = (int(value or 0) for value in duration.groups())
+        return int(time.time()) - (hours * 3600 + minutes * 60 + seconds)
+    try:
+        return int(datetime.fromisoformat(until).timestamp())
+    except ValueError:
+        raise ValidationError(f"invalid until filter '{until}', use a duration (24h), a timestamp or a date")
+
+
+def created_timestamp(created) -> Optional[float]:
+    # containers and images have a unix timestamp, networks and volumes a RFC 3339 date
+    if isinstance(created, (int, float)):
+        return created
+    parsed = parse_datetime(created) if created else None
+    return parsed.timestamp() if parsed else None
+
+
+class CategoryReport(NamedTuple):
+    count: int
+    # None when the daemon doesn't tell (size of volumes in a dry run)
+    bytes: Optional[int]
+
+
+class CleanupReport(object):
+    def __init__(self, dry_run: bool):
+        self.dry_run = dry_run
+        self.categories: Dict[str, CategoryReport] = {}
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(report.bytes or 0 for report in self.categories.values())
+
+    def as_dict(self) -> Dict:
+        return {
+            "dry_run": self.dry_run,
+            "categories": {category: report._asdict() for category, report in self.categories.items()},
+            "bytes": self.total_bytes,
+        }
+
+
+def run(api: APIClient, categories: Sequence[str], filters: CleanupFilters, dry_run: bool = False) -> CleanupReport:
+    report = CleanupReport(dry_run)
+    step = _preview if dry_run else _prune
+    # removing containers first releases the images, networks and volumes they use, the rest is independent
+    if "containers" in categories:
+        report.categories["containers"] = step["containers"](api, filters)
+    others = [category for category in CATEGORIES if category in categories and category != "containers"]
+    if others:
+        with ThreadPoolExecutor(max_workers=len(others), thread_name_prefix="cleanup") as executor:
+            results = list(executor.map(lambda category: step[category](api, filters), others))
+        report.categories.update(zip(others, results))
+    return report
+
+
+def _prune_containers(api: APIClient, filters: CleanupFilters) -> CategoryReport:
+    result = api.prune_containers(filters=filters.daemon_filters())
+    return CategoryReport(len(result.get("ContainersDeleted") or []), result.get("SpaceReclaimed") or 0)
+
+
+def _prune_images(api: APIClient, filters: CleanupFilters) -> CategoryReport:
+    result = api.prune_images(filters={"dangling": True, **filters.daemon_filters()})
+    deleted = sum(1 for item in result.get("ImagesDeleted") or [] if "Deleted" in item)
+    reclaimed = result.get("SpaceReclaimed") or 0
+    # dangling images used by stopped containers are not pruned, they are forcibly removed as they always were
+    leftovers = _dangling_images(api, filters)
+    removed = remove_images(api, leftovers)
+    # the size of an image counts layers it may share with others, so this is an upper bound for the leftovers
+    return CategoryReport(deleted + len(removed), reclaimed + sum(image.get("Size") or 0 for image in removed))
+
+
+def _prune_networks(api: APIClient, filters: CleanupFilters) -> CategoryReport:
+    result = api.prune_networks(filters=filters.daemon_filters())
+    return CategoryReport(len(result.get("NetworksDeleted") or []), 0)
+
+
+def _prune_volumes(api: APIClient, filters: CleanupFilters) -> CategoryReport:
+    # the daemon doesn't accept until= for volumes
+    result = api.prune_volumes(filters=filters.daemon_filters(until=False))
+    return CategoryReport(len(result.get("VolumesDeleted") or []), result.get("SpaceReclaimed") or 0)
+
+
+def remove_images(api: APIClient, images: List[Dict]) -> List[Dict]:
+    # concurrent removals on the shared client, at most IMAGE_CLEANUP_CONCURRENCY at once
+    def remove(image: Dict) -> Optional[Dict]:
+        try:
+            api.remove_image(image["Id"], force=True)
+            return image
+        except APIError as error:
+            # already removed, or still used by a running container
+            logger.debug(f"could not remove image {image['Id']}: {error.explanation}")
+            return None
+
+    if not images:
+        return []
+    with ThreadPoolExecutor(
+        max_workers=min(settings.IMAGE_CLEANUP_CONCURRENCY, len(images)), thread_name_prefix="image-cleanup"
+    ) as executor:
+        return [image for image in executor.map(remove, images) if image is not None]
+
+
+def _dangling_images(api: APIClient, filters: CleanupFilters) -> List[Dict]:
+    images = api.images(filters={"dangling": True, **filters.daemon_filters(until=False)})
+    return [image for image in images if filters.created_before_until(created_timestamp(image.get("Created")))]
+
+
+def _preview_containers(api: APIClient, filters: CleanupFilters) -> CategoryReport:
+    # size=True makes the daemon compute the writable layer sizes, this is only done for a preview
+    containers = api.containers(
+        all=True,
+        size=True,
+        filters={"status": ["created", "exited", "dead"], **filters.daemon_filters(until=False)},
+    )
+    containers = [item for item in containers if filters.created_before_until(created_timestamp(item.get("Created")))]
+    return CategoryReport(len(containers), sum(item.get("SizeRw") or 0 for item in containers))
+
+
+def _preview_images(api: APIClient, filters: CleanupFilters) -> CategoryReport:
+    images = _dangling_images(api, filters)
+    return CategoryReport(len(images), sum(image.get("Size") or 0 for image in images))
+
+
+def _preview_networks(api: APIClient, filters: CleanupFilters) -> CategoryReport:
+    networks = api.networks(filters={"dangling": True, **filters.daemon_filters(until=False)})
+    networks = [item for item in networks if filters.created_before_until(created_timestamp(item.get("Created")))]
+    return CategoryReport(len(networks), 0)
+
+
+def _preview_volumes(api: APIClient, filters: CleanupFilters) -> CategoryReport:
+    volume_filters = filters.daemon_filters(until=False)
+    volume_filters["label"] = volume_filters.get("label", []) + [ANONYMOUS_VOLUME_LABEL]
+    volumes = api.volumes(filters={"dangling": True, **volume_filters}).get("Volumes") or []
+    return CategoryReport(len(volumes), None)
+
+
+_prune = {
+    "containers": _prune_containers,
+    "images": _prune_images,
+    "networks": _prune_networks,
+    "volumes": _prune_volumes,
+}
+
+_preview = {
+    "containers": _preview_containers,
+    "images": _preview_images,
+    "networks": _preview_networks,
+    "volumes": _preview_volumes,
+}
@@ -0,0 +1,233 @@
+from collections import defaultdict
+from datetime import datetime
+from logging import getLogger
+from threading import Lock, Thread
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+from docker import APIClient
+
+# Disk usage of the docker system page. `docker system df` can take tens of seconds on hosts with many volumes, so it
+# is computed by a background thread and the page renders whatever is cached, with the time it was computed.
+# Each category is refreshed on its own (GET /system/df?type=..., API >= 1.42) once it is older than its
+# DISK_USAGE_MAX_AGE, the fast categories first, so that a slow volume scan doesn't hold back the others.
+
+logger = getLogger("control_center")
+
+PROJECT_LABEL = "com.docker.compose.project"
+
+# category: (type parameter, key of the /system/df response), in refresh order
+DISK_USAGE_CATEGORIES = {
+    "containers": ("container", "Containers"),
+    "images": ("image", "Images"),
+    "build-cache": ("build-cache", "BuildCache"),
+    "volumes": ("volume", "Volumes"),
+}
+
+
+# compact records of the /system/df response, the full response can be large
+class ImageUsage(NamedTuple):
+    id: str
+    size: int
+    shared_size: int
+    containers: int
+
+
+class ContainerUsage(NamedTuple):
+    image_id: str
+    project: Optional[str]
+    size: int
+    running: bool
+
+
+class VolumeUsage(NamedTuple):
+    project: Optional[str]
+    size: int
+    in_use: bool
+
+
+class BuildCacheUsage(NamedTuple):
+    size: int
+    reclaimable: bool
+
+
+class CategoryUsage(NamedTuple):
+    count: int
+    active: int
+    size: int
+    reclaimable: int
+
+
+class CachedCategory(NamedTuple):
+    items: Tuple
+    as_of: datetime
+    # real size of the images (shared layers counted once), only in the images response
+    layers_size: Optional[int] = None
+
+
+def parse_category(category: str, response: Dict) -> CachedCategory:
+    items = response.get(DISK_USAGE_CATEGORIES[category][1]) or []
+    now = timezone.now()
+    if category == "images":
+        records = tuple(
+            ImageUsage(
+                item["Id"], item.get("Size") or 0, max(item.get("SharedSize") or 0, 0), item.get("Containers", 0)
+            )
+            for item in items
+        )
+        return CachedCategory(records, now, response.get("LayersSize"))
+    if category == "containers":
+        records = tuple(
+            ContainerUsage(
+                item.get("ImageID", ""),
+                (item.get("Labels") or {}).get(PROJECT_LABEL),
+                item.get("SizeRw") or 0,
+                item.get("State") == "running",
+            )
+            for item in items
+        )
+    elif category == "volumes":
+        records = tuple(
+            VolumeUsage(
+                (item.get("Labels") or {}).get(PROJECT_LABEL),
+                # -1 when the daemon couldn't compute it
+                max((item.get("UsageData") or {}).get("Size", 0), 0),
+                (item.get("UsageData") or {}).get("RefCount", 0) > 0,
+            )
+            for item in items
+        )
+    else:
+        records = tuple(
+            BuildCacheUsage(item.get("Size") or 0, not item.get("InUse") and not item.get("Shared")) for item in items
+        )
+    return CachedCategory(records, now)
+
+
+def category_usage(category: str, cached: CachedCategory) -> CategoryUsage:
+    items = cached.items
+    if category == "images":
+        size = cached.layers_size if cached.layers_size is not None else sum(item.size for item in items)
+        unused = [item for item in items if item.containers == 0]
+        return CategoryUsage(
+            len(items), len(items) - len(unused), size, sum(item.size - item.shared_size for item in unused)
+        )
+    if category == "containers":
+        running = [item for item in items if item.running]
+        size = sum(item.size for item in items)
+        return CategoryUsage(len(items), len(running), size, size - sum(item.size for item in running))
+    if category == "volumes":
+        used = [item for item in items if item.in_use]
+        size = sum(item.size for item in items)
+        return CategoryUsage(len(items), len(used), size, size - sum(item.size for item in used))
+    reclaimable = [item for item in items if item.reclaimable]
+    return CategoryUsage(
+        len(items), len(items) - len(reclaimable), sum(item.size for item in items), sum(i.size for i in reclaimable)
+    )
+
+
+class DiskUsage(object):
+    def __init__(self, cached: Dict[str, CachedCategory], refreshing: bool):
+        self.refreshing = refreshing
+        self.categories: Dict[str, Optional[CategoryUsage]] = {
+            category: category_usage(category, cached[category]) if category in cached else None
+            for category in DISK_USAGE_CATEGORIES
+        }
+        self.as_of: Dict[str, Optional[datetime]] = {
+            category: cached[category].as_of if category in cached else None for category in DISK_USAGE_CATEGORIES
+        }
+        self.projects = project_usage(cached)
+
+    @property
+    def rows(self) -> List[Tuple[str, Optional[CategoryUsage], Optional[datetime]]]:
+        return [(category, usage, self.as_of[category]) for category, usage in self.categories.items()]
+
+    @property
+    def oldest(self) -> Optional[datetime]:
+        dates = [as_of for as_of in self.as_of.values() if as_of]
+        return min(dates) if dates else None
+
+    def as_dict(self) -> Dict:
+        return {
+            "refreshing": self.refreshing,
+            "categories": {
+                category: {**usage._asdict(), "as_of": self.as_of[category]} if usage else None
+                for category, usage in self.categories.items()
+            },
+            "projects": self.projects,
+        }
+
+
+# bytes used by the containers, images and volumes of each compose project
+# (an image used by several projects counts for each of them)
+def project_usage(cached: Dict[str, CachedCategory]) -> List[Dict]:
+    usage = defaultdict(lambda: {"containers": 0, "images": 0, "volumes": 0})
+    image_sizes = {item.id: item.size for item in cached["images"].items} if "images" in cached else {}
+    project_images = defaultdict(set)
+    for container in cached["containers"].items if "containers" in cached else ():
+        if container.project:
+            usage[container.project]["containers"] += container.size
+            project_images[container.project].add(container.image_id)
+    for project, images in project_images.items():
+        usage[project]["images"] = sum(image_sizes.get(image_id, 0) for image_id in images)
+    for volume in cached["volumes"].items if "volumes" in cached else ():
+        if volume.project:
+            usage[volume.project]["volumes"] += volume.size
+    return [{"project": project, **sizes, "total": sum(sizes.values())} for project, sizes in sorted(usage.items())]
+
+
+class DiskUsageCache(object):
+    def __init__(self):
+        self._lock = Lock()
+        self._cached: Dict[str, CachedCategory] = {}
+        # categories to compute again whatever their age
+        self._invalidated: Set[str] = set()
+        self._thread: Optional[Thread] = None
+
+    def get(self, api_factory: Callable[[], APIClient], refresh: bool = False) -> DiskUsage:
+        # returns the cached usage right away, stale (or all, with refresh) categories are computed in the background
+        with self._lock:
+            now = timezone.now()
+            stale = [
+                category
+                for category in DISK_USAGE_CATEGORIES
+                if refresh
+                or category in self._invalidated
+                or category not in self._cached
+                or (now - self._cached[category].as_of).total_seconds() > settings.DISK_USAGE_MAX_AGE[category]
+            ]
+            refreshing = self._thread is not None and self._thread.is_alive()
+            if stale and not refreshing:
+                self._invalidated.clear()
+                self._thread = Thread(
+                    target=self.refresh, args=(api_factory, stale), name="disk-usage-refresh", daemon=True
+                )
+                self._thread.start()
+                refreshing = True
+            return DiskUsage(dict(self._cached), refreshing)
+
+    def refresh(self, api_factory: Callable[[], APIClient], categories: Sequence[str]):
+        pending = list(categories)
+        try:
+            api = api_factory()
+            while pending:
+                category, *pending = pending
+                # the private helpers are used because APIClient.df() doesn't accept the type parameter
+                type_parameter, key = DISK_USAGE_CATEGORIES[category]
+                response = api._result(api._get(api._url("/system/df"), params={"type": type_parameter}), True)
+                # daemons older than API 1.42 ignore the type and return every category at once (others are null)
+                received = [other for other in pending if response.get(DISK_USAGE_CATEGORIES[other][1]) is not None]
+                with self._lock:
+                    for received_category in [category] + received:
+                        self._cached[received_category] = parse_category(received_category, response)
+                pending = [other for other in pending if other not in received]
+        except Exception:
+            logger.exception("error computing docker disk usage")
+
+    def invalidate(self):
+        # after a cleanup, the next page view computes everything again (the previous usage is shown meanwhile)
+        with self._lock:
+            self._invalidated.update(DISK_USAGE_CATEGORIES)
+
+
+disk_usage_cache = DiskUsageCache()
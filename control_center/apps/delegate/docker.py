@@ -1,13 +1,20 @@
 import configparser
+import fcntl
+import hashlib
+import mimetypes
 import os
+import shutil
 import subprocess
+import tempfile
+from collections import OrderedDict
 from configparser import ConfigParser
+from functools import partial
 from logging import getLogger
 from pathlib import Path
 from subprocess import CalledProcessError
-from typing import List, Dict
+from threading import Lock
+from typing import Callable, List, Dict, Optional, Tuple, Union
 
-import docker
 import yaml
 from django.conf import settings
 from django.contrib.auth.models import Permission, User
@@ -16,31 +23,51 @@ from django.core.exceptions import PermissionDenied, ValidationError
 from docker import DockerClient
 from docker.errors import NotFound
 
+from control_center.apps.delegate import cleanup, hosts, pushed_state, reconcile
+from control_center.apps.delegate.cleanup import CleanupFilters, CleanupReport
+from control_center.apps.delegate.disk_usage import DiskUsage, disk_usage_cache
+from control_center.apps.delegate.drift import DriftReport, drift_cache, drift_report as compute_drift_report
+from control_center.apps.delegate.history import add_output_size, recorded, state_generation
+from control_center.apps.delegate.logs import LOG_CHUNK_SIZE, LogTail
 from control_center.apps.delegate.objects import (
     ComposeService,
     ComposeProjectConfig,
     Container,
     ComposeProject,
     ComposeServiceConfig,
+    Inventory,
+    ServiceLogo,
+    compose_logs_arguments,
+    format_log_tail,
 )
+from control_center.apps.delegate.reconcile import ServicePlan
+from control_center.apps.delegate.single_flight import single_flight
 
 logger = getLogger("control_center")
 
-_cache: Dict = {"last_modified": 0, "config": None}
-
-if hasattr(settings, "PRIVATE_DOCKER_REPOSITORY") and settings.PRIVATE_DOCKER_REPOSITORY["available"]:
-    logger.debug(f"docker login to {settings.PRIVATE_DOCKER_REPOSITORY['url']}")
-    subprocess.check_output(
-        [
-            "docker",
-            "login",
-            "--username",
-            settings.PRIVATE_DOCKER_REPOSITORY["username"],
-            "--password",
-            settings.PRIVATE_DOCKER_REPOSITORY["password"],
-            settings.PRIVATE_DOCKER_REPOSITORY["url"],
-        ]
-    )
+_cache: Dict = {"version": None, "config": None}
+# held while the configuration is loaded and while the compose file is replaced
+_config_lock = Lock()
+
+_logo_cache: "OrderedDict[str, ServiceLogo]" = OrderedDict()
+_logo_cache_lock = Lock()
+
+
+# called once at startup (see control_center.startup), the credentials are then stored by docker itself
+def docker_login():
+    if hasattr(settings, "PRIVATE_DOCKER_REPOSITORY") and settings.PRIVATE_DOCKER_REPOSITORY["available"]:
+        logger.debug(f"docker login to {settings.PRIVATE_DOCKER_REPOSITORY['url']}")
+        subprocess.check_output(
+            [
+                "docker",
+                "login",
+                "--username",
+                settings.PRIVATE_DOCKER_REPOSITORY["username"],
+                "--password",
+                settings.PRIVATE_DOCKER_REPOSITORY["password"],
+                settings.PRIVATE_DOCKER_REPOSITORY["url"],
+            ]
+        )
 
 
 def compose_config() -> ComposeProjectConfig:
@@ -49,28 +76,48 @@ def compose_config() -> ComposeProjectConfig:
             message = f"docker-compose file [{settings.YML_PATH}] not found"
             logger.exception(message)
             raise SystemExit(Exception(message))
-        last_modified = os.path.getmtime(settings.YML_PATH)
-        if last_modified > _cache.get("last_modified", 0):
-            yml_config = validate_and_resolve_config()
-            _cache["last_modified"] = last_modified
-            try:
-                logger.debug(f"loading yml file at {settings.YML_PATH}")
-                yml_file = yaml.load(yml_config, Loader=yaml.Loader)
-                if yml_file:
-                    project_config = ComposeProjectConfig(
-                        compose_file_path=settings.YML_PATH,
-                        config=yml_file,
-                        extra_config=get_extra_config_file(settings.EXTRA_COMPOSE_CONFIG),
-                        project_name=settings.COMPOSE_PROJECT,
-                    )
-                    _cache["config"] = project_config
-                    create_permissions_for_config(_cache["config"])
-            except yaml.YAMLError as exc:
-                logger.exception("error loading file", exc)
-                raise SystemExit("error loading file")
+        version = compose_file_version(settings.YML_PATH)
+        if version != _cache.get("version"):
+            load_compose_config(version)
         return _cache["config"]
 
 
+def compose_file_version(path: str) -> Tuple[int, int, int]:
+    # edits replace the file (new inode), the modification time alone can miss an edit within its resolution
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+# requests arriving while the modified file is being loaded wait for that load instead of running it again
+@single_flight
+def load_compose_config(version: Tuple[int, int, int]):
+    with _config_lock:
+        # the file may have been replaced (and loaded by update_compose_file_content) in the meantime
+        version = compose_file_version(settings.YML_PATH)
+        if version == _cache.get("version"):
+            return
+        install_compose_config(version, validate_and_resolve_config())
+
+
+def install_compose_config(version: Tuple[int, int, int], yml_config: str):
+    _cache["version"] = version
+    try:
+        logger.debug(f"loading yml file at {settings.YML_PATH}")
+        yml_file = yaml.load(yml_config, Loader=yaml.Loader)
+        if yml_file:
+            project_config = ComposeProjectConfig(
+                compose_file_path=settings.YML_PATH,
+                config=yml_file,
+                extra_config=get_extra_config_file(settings.EXTRA_COMPOSE_CONFIG),
+                project_name=settings.COMPOSE_PROJECT,
+            )
+            _cache["config"] = project_config
+            create_permissions_for_config(_cache["config"])
+    except yaml.YAMLError as exc:
+        logger.exception("error loading file", exc)
+        raise SystemExit("error loading file")
+
+
 def get_extra_config_file(extra_path: str) -> ConfigParser:
     config = configparser.ConfigParser()
     config.read(extra_path)
@@ -84,48 +131,46 @@ def create_permissions_for_config(config: ComposeProjectConfig):
     project_permissions = ["up", "down", "remove", "restart"]
     service_permissions = ["view", "up", "stop", "start", "remove", "restart", "scale", "update", "rollback", "logs"]
     container_permissions = ["stop", "start", "remove", "restart", "rename", "logs"]
-    project_content_type, created = ContentType.objects.get_or_create(app_label=config.project_name, model="projects")
-    for perm in project_permissions:
-        name = f"Can {perm} project"
-        codename = perm
-        if not any(Permission.objects.filter(content_type=project_content_type, codename=codename)):
-            Permission.objects.create(content_type=project_content_type, name=name, codename=codename)
+    container_codenames = {"container_" + perm: f"Can {perm} container" for perm in container_permissions}
+    # (app_label, model) of the content type -> {codename: name} of its permissions
+    wanted_permissions = {
+        (config.project_name, "projects"): {perm: f"Can {perm} project" for perm in project_permissions}
+    }
     for service in config.service_configs:
-        service_content_type, created = ContentType.objects.get_or_create(
-            app_label=service.service_name, model="services"
-        )
-        for perm in service_permissions:
-            name = f"Can {perm} service" if perm != "logs" else "Can see service logs"
-            codename = perm
-            if not any(Permission.objects.filter(content_type=service_content_type, codename=codename)):
-                Permission.objects.create(content_type=service_content_type, name=name, codename=codename)
-        for perm in container_permissions:
-            name = f"Can {perm} container"
-            codename = "container_" + perm
-            if not any(Permission.objects.filter(content_type=service_content_type, codename=codename)):
-                Permission.objects.create(content_type=service_content_type, name=name, codename=codename)
+        wanted_permissions[(service.service_name, "services")] = {
+            **{
+                perm: f"Can {perm} service" if perm != "logs" else "Can see service logs"
+                for perm in service_permissions
+            },
+            **container_codenames,
+        }
     # Creates special set of permissions for other project containers and other containers
-    other_projects_content_type, created = ContentType.objects.get_or_create(
-        app_label=other_projects_app_label, model="other"
+    wanted_permissions[(other_projects_app_label, "other")] = container_codenames
+    wanted_permissions[(other_containers_app_label, "other")] = container_codenames
+    wanted_permissions[(docker_system_app_label, "docker")] = {
+        "system_commands": "Can use docker system commands",
+        "push_state": "Can push the state of a docker host",
+    }
+    # a handful of queries in total instead of a few per permission
+    app_labels = {app_label for app_label, model in wanted_permissions}
+    content_types = {
+        (content_type.app_label, content_type.model): content_type
+        for content_type in ContentType.objects.filter(app_label__in=app_labels)
+    }
+    for app_label, model in wanted_permissions:
+        if (app_label, model) not in content_types:
+            content_types[(app_label, model)] = ContentType.objects.create(app_label=app_label, model=model)
+    existing_permissions = set(
+        Permission.objects.filter(content_type__in=content_types.values()).values_list("content_type_id", "codename")
     )
-    for perm in container_permissions:
-        name = f"Can {perm} container"
-        codename = "container_" + perm
-        if not any(Permission.objects.filter(content_type=other_projects_content_type, codename=codename)):
-            Permission.objects.create(content_type=other_projects_content_type, name=name, codename=codename)
-    other_containers_content_type, created = ContentType.objects.get_or_create(
-        app_label=other_containers_app_label, model="other"
+    Permission.objects.bulk_create(
+        [
+            Permission(content_type=content_types[key], codename=codename, name=name)
+            for key, permissions in wanted_permissions.items()
+            for codename, name in permissions.items()
+            if (content_types[key].id, codename) not in existing_permissions
+        ]
     )
-    for perm in container_permissions:
-        name = f"Can {perm} container"
-        codename = "container_" + perm
-        if not any(Permission.objects.filter(content_type=other_containers_content_type, codename=codename)):
-            Permission.objects.create(content_type=other_containers_content_type, name=name, codename=codename)
-    system_content_type, created = ContentType.objects.get_or_create(app_label=docker_system_app_label, model="docker")
-    name = "Can use docker system commands"
-    codename = "system_commands"
-    if not any(Permission.objects.filter(content_type=system_content_type, codename=codename)):
-        Permission.objects.create(content_type=system_content_type, name=name, codename=codename)
 
 
 def validate_and_resolve_config(raise_error=False) -> [str, str]:
@@ -144,9 +189,9 @@ def service_hashes(project_name: str) -> Dict:
         return {project_name: dict(line.split(" ") for line in hashes.splitlines())}
 
 
+# client of the local daemon, created once (see hosts)
 def client() -> DockerClient:
-    docker_client = docker.from_env()
-    return docker_client
+    return hosts.local_host().client
 
 
 def pull_image(project_name, service_name):
@@ -154,41 +199,100 @@ def pull_image(project_name, service_name):
     execute_compose_command(project_name=project_name, args=["pull", service_name])
 
 
-def containers_for_project(project_name: str = None, exclude_project_name: str = None) -> List[Container]:
+# Sparse listing (no inspect of every container, which is what DockerClient.containers.list does):
+# filters are applied by the daemon, keep (optional) filters on the listing data in python, then only the containers
+# that are kept are inspected, for their start time (inspect=False skips it). Image tags come from one image listing.
+# The containers of the local host are listed unless another host is given.
+def list_containers(
+    filters: Dict = None,
+    keep: Callable[[Container], bool] = None,
+    inspect: bool = True,
+    docker_host: Optional[hosts.DockerHost] = None,
+) -> List[Container]:
+    docker_host = docker_host or hosts.local_host()
+    docker_client = docker_host.client
+    container_summaries = [
+        container_summary
+        for container_summary in docker_client.api.containers(all=True, filters=filters)
+        if keep is None or keep(Container.from_summary(container_summary, host=docker_host.name))
+    ]
+    if not container_summaries:
+        return []
+    tags_by_image_id = {
+        image["Id"]: tuple(tag for tag in image.get("RepoTags") or [] if tag != "<none>:<none>")
+        for image in docker_client.api.images()
+    }
     container_list = []
-    docker_container_list = client().containers.list(all=True, filters={"label": "com.docker.compose.project"})
-    for docker_container in docker_container_list:
-        container = Container(container=docker_container)
-        if project_name and container.project == project_name:
-            container_list.append(container)
-        if exclude_project_name and container.project != exclude_project_name:
-            container_list.append(container)
+    for container_summary in container_summaries:
+        state = None
+        if inspect:
+            try:
+                state = docker_client.api.inspect_container(container_summary["Id"])["State"]
+            except NotFound:
+                # removed since it was listed
+                continue
+        tags = tags_by_image_id.get(container_summary.get("ImageID"))
+        container_list.append(Container.from_summary(container_summary, tags=tags, state=state, host=docker_host.name))
     return container_list
 
 
-def standalone_containers() -> List[Container]:
-    container_list = []
-    docker_container_list = client().containers.list(all=True)
-    for docker_container in docker_container_list:
-        container = Container(container=docker_container)
-        if not container.project and not container.service:
-            container_list.append(container)
-    return container_list
+# listing of every host (see hosts.fan_out, and pushed_state for the hosts whose agent pushes their state), the hosts
+# that didn't answer are in unavailable_hosts
+def list_host_containers(
+    filters: Dict = None, keep: Callable[[Container], bool] = None, inspect: bool = True
+) -> hosts.HostResults:
+    def list_hosts(exclude: List[str]) -> hosts.HostResults:
+        return hosts.fan_out(
+            lambda docker_host: list_containers(filters=filters, keep=keep, inspect=inspect, docker_host=docker_host),
+            exclude=exclude,
+        )
+
+    return pushed_state.list_with_pushed_states(list_hosts, filters=filters, keep=keep)
+
+
+# the managed project only runs on the local host, the other projects are listed on every host
+@single_flight
+def containers_for_project(
+    project_name: str = None, exclude_project_name: str = None, inspect: bool = True
+) -> List[Container]:
+    if project_name:
+        return list_containers(filters={"label": f"com.docker.compose.project={project_name}"}, inspect=inspect)
+    # the daemon can only select the compose containers, other projects are filtered on the listing data
+    return list_host_containers(
+        filters={"label": "com.docker.compose.project"},
+        keep=lambda container: container.project != exclude_project_name or not container.is_local,
+        inspect=inspect,
+    )
+
+
+@single_flight
+def standalone_containers(inspect: bool = True) -> List[Container]:
+    # the daemon can't filter on a missing label, containers are filtered on the listing data before any inspect
+    return list_host_containers(keep=lambda container: not container.project and not container.service, inspect=inspect)
+
+
+@single_flight
+def all_containers(inspect: bool = True, all_hosts: bool = False) -> List[Container]:
+    if all_hosts:
+        return list_host_containers(inspect=inspect)
+    return list_containers(inspect=inspect)
+
+
+def inventory(inspect: bool = True, all_hosts: bool = False) -> Inventory:
+    return Inventory(config=compose_config(), containers=all_containers(inspect=inspect, all_hosts=all_hosts))
 
 
+@single_flight
 def containers_for_service(project_name, service_name) -> List[Container]:
-    container_list = []
-    for docker_container in client().containers.list(
-        all=True,
-        filters={"label": [f"com.docker.compose.service={service_name}", f"com.docker.compose.project={project_name}"]},
-    ):
-        container = Container(container=docker_container)
-        container_list.append(container)
-    return container_list
+    return list_containers(
+        filters={"label": [f"com.docker.compose.service={service_name}", f"com.docker.compose.project={project_name}"]}
+    )
 
 
-def container_by_id(container_id) -> Container:
-    return Container(client().containers.get(container_id=container_id))
+@single_flight
+def container_by_id(container_id, host_name: Optional[str] = None) -> Container:
+    docker_host = hosts.host(host_name)
+    return Container.from_docker(docker_host.client.containers.get(container_id=container_id), host=docker_host.name)
 
 
 def compose_service(project_name: str, service_name: str) -> ComposeService:
@@ -211,176 +315,326 @@ def compose_project_by_name(project_name: str) -> ComposeProject:
         raise NotFound(message="Not Found", explanation=message)
 
 
-def execute_compose_command(project_name: str, args: List[str], debug: bool = True) -> str:
+def compose_command_arguments(project_name: str, args: List[str], file_path: Optional[str] = None) -> List[str]:
+    arguments = []
+    if settings.WINDOWS_HOST:
+        arguments = ["env", "COMPOSE_FORCE_WINDOWS_HOST=1", "env", "COMPOSE_CONVERT_WINDOWS_PATHS=1"]
+    arguments = arguments + ["docker", "compose"]
+    if settings.COMPATIBILITY_MODE:
+        arguments = arguments + ["--compatibility"]
+    return arguments + ["--file", file_path or settings.YML_PATH, "--project-name", project_name] + args
+
+
+def execute_compose_command(
+    project_name: str, args: List[str], debug: bool = True, file_path: Optional[str] = None
+) -> str:
     try:
-        arguments = []
-        if settings.WINDOWS_HOST:
-            arguments = ["env", "COMPOSE_FORCE_WINDOWS_HOST=1", "env", "COMPOSE_CONVERT_WINDOWS_PATHS=1"]
-        arguments = arguments + ["docker", "compose"]
-        if settings.COMPATIBILITY_MODE:
-            arguments = arguments + ["--compatibility"]
-        arguments = arguments + ["--file", settings.YML_PATH, "--project-name", project_name] + args
+        arguments = compose_command_arguments(project_name, args, file_path)
         if debug:
             logger.debug("command:\n" + str(arguments))
-        output = subprocess.check_output(arguments, stderr=subprocess.STDOUT).decode()
+        output = subprocess.check_output(arguments, stderr=subprocess.STDOUT)
+        add_output_size(output)
+        output = output.decode()
         if debug:
             logger.debug("output:\n" + output)
         return output
     except CalledProcessError as error:
+        add_output_size(error.output)
         error_output = error.output.decode()
         logger.exception(f"error running docker compose command: {error_output}")
         raise error
 
 
+# app label of the permissions applying to a container
+def container_permission_app_label(container: Container, config: Optional[ComposeProjectConfig] = None) -> str:
+    config = config or compose_config()
+    if container.project and config and container.project == config.project_name and container.is_local:
+        return container.service
+    elif container.project:
+        return "other_projects"
+    return "other_containers"
+
+
 # Checks whether a user has permission to perform the action on a container; if not, raise PermissionDenied
 def check_container_permission(user: User, container: Container, perm: str):
-    config = compose_config()
-    app_label = None
-    if container.project and container.project == config.project_name:
-        app_label = container.service
-    elif container.project and container.project != config.project_name:
-        app_label = "other_projects"
-    elif not container.project:
-        app_label = "other_containers"
-    if not user.has_perm(app_label + "." + perm):
+    if not user.has_perm(container_permission_app_label(container) + "." + perm):
         raise PermissionDenied
 
 
-def update_compose_file_content(file_content: str):
-    config = compose_config()
-    original_file_content = open(config.compose_file_path, "r").read()
-    file_content = file_content.replace("\r\n", "\n")
-    try:
-        open(config.compose_file_path, "w").write(file_content)
-        validate_and_resolve_config(raise_error=True)
-    except CalledProcessError as error:
-        open(config.compose_file_path, "w").write(original_file_content)
-        raise ValidationError(message=error.output.decode())
-    except Exception as err:
-        open(config.compose_file_path, "w").write(original_file_content)
-        raise err
+# same visibility rules as the pages: services need the view permission, other containers any permission
+def user_can_view_container(user: User, container: Container, config: Optional[ComposeProjectConfig] = None) -> bool:
+    return user_can_view_app_label(user, container_permission_app_label(container, config))
+
+
+def user_can_view_app_label(user: User, app_label: str) -> bool:
+    if app_label in ["other_projects", "other_containers"]:
+        return user.has_module_perms(app_label)
+    return user.has_perm(app_label + ".view")
+
+
+class ComposeFileConflict(ValidationError):
+    pass
 
 
-def project_up(project_name: str):
+def compose_file_hash(file_content: str) -> str:
+    return hashlib.sha256(file_content.encode()).hexdigest()
+
+
+# Validates the new content on a copy next to the compose file (relative paths and .env resolve the same way), then
+# renames it over the compose file: the other workers only ever see a valid file and reload it once.
+# With expected_hash (hash of the content the edit started from), a concurrent edit raises ComposeFileConflict.
+def update_compose_file_content(file_content: str, expected_hash: Optional[str] = None) -> str:
+    path = settings.YML_PATH
+    directory, file_name = os.path.split(os.path.abspath(path))
+    file_content = file_content.replace("\r\n", "\n")
+    with _config_lock, open(os.path.join(directory, f".{file_name}.lock"), "w") as lock_file:
+        # the lock file serializes edits between worker processes
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        with open(path, "r") as stream:
+            current_hash = compose_file_hash(stream.read())
+        if expected_hash and expected_hash != current_hash:
+            raise ComposeFileConflict(message="the compose file has been modified since it was read, reload it first")
+        descriptor, scratch_path = tempfile.mkstemp(prefix=f".{file_name}.", suffix=".new", dir=directory)
+        try:
+            with os.fdopen(descriptor, "w") as stream:
+                stream.write(file_content)
+            shutil.copymode(path, scratch_path)
+            try:
+                yml_config = execute_compose_command(
+                    settings.COMPOSE_PROJECT, ["config"], debug=False, file_path=scratch_path
+                )
+            except CalledProcessError as error:
+                raise ValidationError(message=error.output.decode())
+            os.replace(scratch_path, path)
+        finally:
+            if os.path.exists(scratch_path):
+                os.remove(scratch_path)
+        # the validated output is loaded right away, this worker doesn't need to run docker compose config again
+        install_compose_config(compose_file_version(path), yml_config)
+    return compose_file_hash(file_content)
+
+
+@recorded("project", "up")
+def project_up(project_name: str, user: User = None):
     project = compose_project_by_name(project_name=project_name)
     project.up()
 
 
-def project_down(project_name: str):
+# brings up again only the services whose configuration changed (see reconcile)
+@recorded("project", "apply")
+def project_apply(project_name: str, user: User = None) -> List[ServicePlan]:
+    return reconcile.apply(compose_project_by_name(project_name=project_name))
+
+
+# what project_apply would do, nothing is changed (and nothing recorded in the action history)
+def project_apply_plan(project_name: str) -> List[ServicePlan]:
+    return reconcile.plan(compose_project_by_name(project_name=project_name))
+
+
+@recorded("project", "down")
+def project_down(project_name: str, user: User = None):
     project = compose_project_by_name(project_name=project_name)
     project.down()
 
 
-def project_remove(project_name: str):
+@recorded("project", "remove")
+def project_remove(project_name: str, user: User = None):
     project = compose_project_by_name(project_name=project_name)
     project.rm()
 
 
-def project_restart(project_name: str):
+@recorded("project", "restart")
+def project_restart(project_name: str, user: User = None):
     project = compose_project_by_name(project_name=project_name)
     project.restart()
 
 
-def service_up(project_name: str, service_name: str):
+@recorded("service", "up")
+def service_up(project_name: str, service_name: str, user: User = None):
     service = compose_service(project_name=project_name, service_name=service_name)
     service.up()
 
 
-def service_stop(project_name: str, service_name: str):
+@recorded("service", "stop")
+def service_stop(project_name: str, service_name: str, user: User = None):
     service = compose_service(project_name=project_name, service_name=service_name)
     service.stop()
 
 
-def service_start(project_name: str, service_name: str):
+@recorded("service", "start")
+def service_start(project_name: str, service_name: str, user: User = None):
     service = compose_service(project_name=project_name, service_name=service_name)
     service.start()
 
 
-def service_remove(project_name: str, service_name: str):
+@recorded("service", "remove")
+def service_remove(project_name: str, service_name: str, user: User = None):
     service = compose_service(project_name=project_name, service_name=service_name)
     service.rm()
 
 
-def service_restart(project_name: str, service_name: str):
+@recorded("service", "restart")
+def service_restart(project_name: str, service_name: str, user: User = None):
     service = compose_service(project_name=project_name, service_name=service_name)
     service.restart()
 
 
-def service_scale(project_name: str, service_name: str, scale: int):
+@recorded("service", "scale")
+def service_scale(project_name: str, service_name: str, scale: int, user: User = None):
     service = compose_service(project_name=project_name, service_name=service_name)
     service.scale(scale)
 
 
-def service_update(project_name: str, service_name: str):
+@recorded("service", "update")
+def service_update(project_name: str, service_name: str, user: User = None):
     service = compose_service(project_name=project_name, service_name=service_name)
     service.update()
 
 
-def service_rollback(project_name: str, service_name: str):
+@recorded("service", "rollback")
+def service_rollback(project_name: str, service_name: str, user: User = None):
     service = compose_service(project_name=project_name, service_name=service_name)
     service.rollback()
 
 
-def service_logs(project_name: str, service_name: str, lines: int = 100, array=False) -> str:
-    service = compose_service(project_name=project_name, service_name=service_name)
-    return service.logs(lines=lines, array=array)
+def compose_service_config(project_name: str, service_name: str) -> ComposeServiceConfig:
+    try:
+        return compose_config().get_service_config(project_name=project_name, service_name=service_name)
+    except StopIteration:
+        message = f"couldn't find service '{service_name}' in project '{project_name}'"
+        raise NotFound(message="Not Found", explanation=message)
 
 
-def service_logo(project_name: str, service_name: str):
-    service = compose_service(project_name=project_name, service_name=service_name)
-    if service.config.logo:
-        return get_logo_file(os.path.join(Path(settings.EXTRA_COMPOSE_CONFIG).parent, service.config.logo))
+def service_logs(project_name: str, service_name: str, lines: int = 100, array=False) -> Union[List[str], str]:
+    # only the service configuration is needed, there is no need to list the service containers
+    compose_service_config(project_name=project_name, service_name=service_name)
+    return format_log_tail(compose_logs(project_name, service_name, lines), array=array)
+
+
+def compose_logs(project_name: str, service_name: str, lines: int) -> LogTail:
+    # the output is read in chunks, only the most recent LOGS_MAX_BYTES are kept
+    arguments = compose_command_arguments(project_name, compose_logs_arguments(service_name, lines))
+    # remove first line of logs (it's useless)
+    tail = LogTail(skip_first_line=True)
+    with subprocess.Popen(arguments, stdout=subprocess.PIPE, stderr=subprocess.STDOUT) as process:
+        for chunk in iter(partial(process.stdout.read1, LOG_CHUNK_SIZE), b""):
+            tail.feed(chunk)
+    if process.returncode:
+        output = tail.text()
+        logger.error(f"error running docker compose command: {output}")
+        raise CalledProcessError(process.returncode, arguments, output=output.encode())
+    return tail
+
+
+def service_logo(project_name: str, service_name: str) -> Optional[ServiceLogo]:
+    # only the service configuration is needed, there is no need to list the service containers
+    service_config = compose_service_config(project_name=project_name, service_name=service_name)
+    if service_config and service_config.logo:
+        return get_logo_file(os.path.join(Path(settings.EXTRA_COMPOSE_CONFIG).parent, service_config.logo))
 
 
-def get_logo_file(path):
-    logo = None
-    if path and os.path.exists(path):
-        with open(path, "rb") as f:
-            logo = f.read()
+# logos are kept in memory (least recently used ones are dropped) and re-read when the file is modified
+def get_logo_file(path) -> Optional[ServiceLogo]:
+    try:
+        modified = os.path.getmtime(path) if path else None
+    except OSError:
+        modified = None
+    with _logo_cache_lock:
+        if modified is None:
+            _logo_cache.pop(path, None)
+            return None
+        logo = _logo_cache.get(path)
+        if logo and logo.modified == modified:
+            _logo_cache.move_to_end(path)
+            return logo
+    with open(path, "rb") as f:
+        logo = ServiceLogo(f.read(), mimetypes.guess_type(path)[0] or "application/octet-stream", modified)
+    with _logo_cache_lock:
+        _logo_cache[path] = logo
+        _logo_cache.move_to_end(path)
+        while len(_logo_cache) > settings.LOGO_CACHE_SIZE:
+            _logo_cache.popitem(last=False)
     return logo
 
 
-def container_stop(user: User, container_id: str):
-    container = container_by_id(container_id)
+@recorded("container", "stop")
+def container_stop(user: User, container_id: str, host_name: Optional[str] = None):
+    container = container_by_id(container_id, host_name)
     check_container_permission(user=user, container=container, perm="container_remove")
     container.stop()
     return container
 
 
-def container_start(user: User, container_id: str):
-    container = container_by_id(container_id)
+@recorded("container", "start")
+def container_start(user: User, container_id: str, host_name: Optional[str] = None):
+    container = container_by_id(container_id, host_name)
     check_container_permission(user=user, container=container, perm="container_remove")
     container.start()
     return container
 
 
-def container_restart(user: User, container_id: str):
-    container = container_by_id(container_id)
+@recorded("container", "restart")
+def container_restart(user: User, container_id: str, host_name: Optional[str] = None):
+    container = container_by_id(container_id, host_name)
     check_container_permission(user=user, container=container, perm="container_remove")
     container.restart()
     return container
 
 
-def container_remove(user: User, container_id: str):
-    container = container_by_id(container_id)
+@recorded("container", "remove")
+def container_remove(user: User, container_id: str, host_name: Optional[str] = None):
+    container = container_by_id(container_id, host_name)
     check_container_permission(user=user, container=container, perm="container_remove")
     container.rm()
     return container
 
 
-def clean_old_images():
-    images = client().images.list(all=True, filters={"dangling": True})
-    for image in images:
-        client().images.remove(image.id, force=True)
+# categories removed by each system action
+SYSTEM_CLEANUP_CATEGORIES = {
+    "clean_old_images": ["images"],
+    "prune": ["containers", "images", "networks"],
+    "prune_all": cleanup.CATEGORIES,
+}
+
+
+@recorded("system", "clean_old_images")
+def clean_old_images(user: User = None, filters: CleanupFilters = CleanupFilters()) -> CleanupReport:
+    return cleanup_and_invalidate(SYSTEM_CLEANUP_CATEGORIES["clean_old_images"], filters)
+
+
+@recorded("system", "prune")
+def prune(user: User = None, filters: CleanupFilters = CleanupFilters()) -> CleanupReport:
+    return cleanup_and_invalidate(SYSTEM_CLEANUP_CATEGORIES["prune"], filters)
+
+
+@recorded("system", "prune_all")
+def prune_all(user: User = None, filters: CleanupFilters = CleanupFilters()) -> CleanupReport:
+    return cleanup_and_invalidate(SYSTEM_CLEANUP_CATEGORIES["prune_all"], filters)
+
+
+def cleanup_and_invalidate(categories: List[str], filters: CleanupFilters) -> CleanupReport:
+    try:
+        return cleanup.run(client().api, categories, filters)
+    finally:
+        disk_usage_cache.invalidate()
+
+
+# what a system action would remove, nothing is removed (and nothing recorded in the action history)
+def cleanup_preview(action: str, filters: CleanupFilters = CleanupFilters()) -> CleanupReport:
+    return cleanup.run(client().api, SYSTEM_CLEANUP_CATEGORIES[action], filters, dry_run=True)
+
 
+# cached disk usage of the docker system page, stale categories are computed in the background
+def disk_usage(refresh: bool = False) -> DiskUsage:
+    return disk_usage_cache.get(lambda: client().api, refresh=refresh)
 
-def prune():
-    clean_old_images()
-    client().containers.prune()
-    client().networks.prune()
 
+# drift of the host from the compose file, cached until an action runs or the compose file changes
+def drift_report(refresh: bool = False) -> DriftReport:
+    def compute() -> DriftReport:
+        snapshot = inventory(inspect=False)
+        app_label = partial(container_permission_app_label, config=snapshot.config)
+        return compute_drift_report(snapshot, app_label, ComposeService.ROLLBACK_SUFFIX)
 
-def prune_all():
-    prune()
-    client().images.prune()
-    client().volumes.prune()
+    compose_config()
+    return drift_cache.get((state_generation(), _cache.get("version")), compute, refresh=refresh)
@@ -0,0 +1,120 @@
+from datetime import datetime
+from threading import Lock
+from typing import TYPE_CHECKING, Callable, Dict, Hashable, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+if TYPE_CHECKING:
+    # objects imports the docker module, which imports this one
+    from control_center.apps.delegate.objects import ComposeService, Container, Inventory
+
+# Drift of the host from the compose file, computed in a single pass over one inventory snapshot:
+# - config: the container was created from another configuration than the current one of its service
+# - image: the image tag of the service no longer points to the image the container runs (a newer image was pulled)
+# - orphan: the container belongs to a service that is no longer in the compose file
+# - rollback: a container kept by an update for a rollback ("_previous") is still there
+# Reports are cached until an action is run by this process, the compose file changes or DRIFT_MAX_AGE is over.
+
+CONFIG = "config"
+IMAGE = "image"
+ORPHAN = "orphan"
+ROLLBACK = "rollback"
+
+DRIFT_KINDS = [CONFIG, IMAGE, ORPHAN, ROLLBACK]
+
+
+class Drift(NamedTuple):
+    kind: str
+    project_name: Optional[str]
+    service_name: Optional[str]
+    container_id: str
+    container_name: str
+    detail: str
+    # app label of the container permissions, reports are filtered for each user
+    app_label: str
+
+
+class DriftReport(NamedTuple):
+    items: List[Drift]
+    generated_at: datetime
+    etag: str
+
+    def counts(self, items: Optional[List[Drift]] = None) -> Dict[str, int]:
+        counts = {kind: 0 for kind in DRIFT_KINDS}
+        for item in self.items if items is None else items:
+            counts[item.kind] += 1
+        return counts
+
+    # can_view(user, app label): the visibility rules of the containers (see docker.user_can_view_app_label)
+    def visible_to(self, user, can_view: Callable[[object, str], bool]) -> List[Drift]:
+        return [item for item in self.items if can_view(user, item.app_label)]
+
+
+def image_reference(image: Optional[str]) -> Optional[str]:
+    # as docker lists the tags of the images: no default registry, ":latest" when no tag is given
+    if not image or "@" in image:
+        # pinned by digest, the tag can't move
+        return None
+    for prefix in ("docker.io/library/", "docker.io/", "index.docker.io/library/", "index.docker.io/"):
+        if image.startswith(prefix):
+            image = image[len(prefix) :]
+            break
+    return image if ":" in image.rsplit("/", 1)[-1] else image + ":latest"
+
+
+def container_drift(
+    container: "Container", service: Optional["ComposeService"], app_label: str, rollback_suffix: str
+) -> List[Drift]:
+    drifts = []
+
+    def add(kind: str, detail: str):
+        drifts.append(
+            Drift(kind, container.project, container.service, container.short_id, container.name, detail, app_label)
+        )
+
+    is_rollback = container.name.endswith(rollback_suffix)
+    if is_rollback:
+        add(ROLLBACK, "kept for a rollback by the last update")
+    if service is None:
+        return drifts
+    if not service.config:
+        add(ORPHAN, f"service '{container.service}' is not in the compose file")
+        return drifts
+    if not is_rollback:
+        if container.service_hash != service.config.hash:
+            add(CONFIG, "created from a previous configuration of the service")
+        reference = image_reference(service.config.image)
+        # tags are only known for images still present locally
+        if reference and container.tags is not None and reference not in container.tags:
+            add(IMAGE, f"{reference} now points to another image")
+    return drifts
+
+
+def drift_report(inventory: "Inventory", app_label: Callable[["Container"], str], rollback_suffix: str) -> DriftReport:
+    items = []
+    for container in inventory.containers:
+        items += container_drift(container, inventory.service(container), app_label(container), rollback_suffix)
+    items.sort(key=lambda item: (item.project_name or "", item.service_name or "", item.container_name, item.kind))
+    return DriftReport(items, timezone.now(), inventory.etag())
+
+
+class DriftCache(object):
+    def __init__(self):
+        self._lock = Lock()
+        self._key: Optional[Hashable] = None
+        self._report: Optional[DriftReport] = None
+
+    def get(self, key: Hashable, compute: Callable[[], DriftReport], refresh: bool = False) -> DriftReport:
+        with self._lock:
+            report = self._report
+            if not refresh and report and self._key == key:
+                if (timezone.now() - report.generated_at).total_seconds() <= settings.DRIFT_MAX_AGE:
+                    return report
+        report = compute()
+        with self._lock:
+            self._key, self._report = key, report
+        return report
+
+
+drift_cache = DriftCache()
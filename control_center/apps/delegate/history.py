@@ -0,0 +1,198 @@
+import atexit
+import inspect
+import math
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+from functools import wraps
+from logging import getLogger
+from queue import Empty, Queue
+from subprocess import CalledProcessError
+from threading import Condition, Lock, Thread
+from typing import Dict, List, Optional, Sequence
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from control_center.apps.delegate.models import ActionRecord
+
+logger = getLogger("control_center")
+
+# record of the action running in the current thread (or task), docker compose output sizes are added to it
+_current_action: ContextVar[Optional[ActionRecord]] = ContextVar("current_action", default=None)
+
+TIMED_ACTIONS = ["up", "update", "restart"]
+
+# number of actions ended in this process, caches of the docker state are invalidated when it changes
+_generation = {"value": 0}
+_generation_lock = Lock()
+
+
+# records are queued by the request threads and written in batches by a background thread,
+# so that the database writes stay off the request path
+class ActionHistoryWriter(object):
+    def __init__(self):
+        self._queue: Queue = Queue()
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+        self._pid: Optional[int] = None
+        # records added and not written yet, including the batch the thread is collecting
+        self._pending = 0
+        self._written = Condition()
+
+    def add(self, record: ActionRecord):
+        with self._written:
+            self._pending += 1
+        self._queue.put(record)
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        with self._lock:
+            # forked workers (gunicorn preload_app) don't inherit the thread of the parent process
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._pid = os.getpid()
+                self._thread = Thread(target=self._run, name="action-history-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            # waits for a first record, then for more of them until the batch is full or the interval is over
+            records = [self._queue.get()]
+            deadline = time.monotonic() + settings.ACTION_HISTORY_FLUSH_INTERVAL
+            while len(records) < settings.ACTION_HISTORY_BATCH_SIZE:
+                try:
+                    records.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except Empty:
+                    break
+            self._write(records)
+
+    def flush(self):
+        # writes the queued records from the calling thread (on exit, or at the end of a management command)
+        records = []
+        while True:
+            try:
+                records.append(self._queue.get_nowait())
+            except Empty:
+                break
+        if records:
+            self._write(records)
+        # and waits for the batch of the thread, a short lived process would otherwise exit before it is written
+        with self._written:
+            self._written.wait_for(lambda: self._pending <= 0, timeout=settings.ACTION_HISTORY_FLUSH_INTERVAL + 5)
+
+    def _write(self, records: List[ActionRecord]):
+        try:
+            ActionRecord.objects.bulk_create(records)
+        except Exception:
+            logger.exception(f"error writing {len(records)} action history records")
+        finally:
+            connections.close_all()
+            with self._written:
+                self._pending -= len(records)
+                self._written.notify_all()
+
+
+writer = ActionHistoryWriter()
+atexit.register(writer.flush)
+
+
+@contextmanager
+def recorded_action(user, target: str, action: str, project_name="", service_name="", container_id=""):
+    authenticated = getattr(user, "is_authenticated", False)
+    record = ActionRecord(
+        user=user if authenticated else None,
+        username=user.get_username() if authenticated else "",
+        target=target,
+        project_name=project_name or "",
+        service_name=service_name or "",
+        container_id=container_id or "",
+        action=action,
+        started_at=timezone.now(),
+        exit_status=-1,
+        output_size=0,
+    )
+    token = _current_action.set(record)
+    start = time.perf_counter()
+    try:
+        yield record
+        record.exit_status = 0
+    except CalledProcessError as error:
+        record.exit_status = error.returncode
+        raise
+    finally:
+        record.duration = time.perf_counter() - start
+        record.ended_at = record.started_at + timedelta(seconds=record.duration)
+        _current_action.reset(token)
+        writer.add(record)
+        with _generation_lock:
+            _generation["value"] += 1
+
+
+def state_generation() -> int:
+    return _generation["value"]
+
+
+# decorator for the actions of the delegate module, the target is read from the arguments of the function
+def recorded(target: str, action: str):
+    def decorator(function):
+        signature = inspect.signature(function)
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _current_action.get() is not None:
+                # part of an action already recorded (prune cleans old images)
+                return function(*args, **kwargs)
+            arguments = signature.bind(*args, **kwargs).arguments
+            with recorded_action(
+                arguments.get("user"),
+                target,
+                action,
+                project_name=arguments.get("project_name"),
+                service_name=arguments.get("service_name"),
+                container_id=arguments.get("container_id"),
+            ):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def add_output_size(output: Optional[bytes]):
+    record = _current_action.get()
+    if record is not None and output:
+        record.output_size += len(output)
+
+
+def percentile(values: Sequence[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(percent / 100 * len(ordered)) - 1))]
+
+
+# p50/p95 durations of the successful service actions over the last ACTION_HISTORY_STATS_DAYS days
+def service_duration_percentiles(service_names: Optional[Sequence[str]] = None) -> List[Dict]:
+    records = ActionRecord.objects.filter(
+        target="service",
+        action__in=TIMED_ACTIONS,
+        exit_status=0,
+        started_at__gte=timezone.now() - timedelta(days=settings.ACTION_HISTORY_STATS_DAYS),
+    )
+    if service_names is not None:
+        records = records.filter(service_name__in=service_names)
+    durations = defaultdict(list)
+    for service_name, action, duration in records.values_list("service_name", "action", "duration"):
+        durations[(service_name, action)].append(duration)
+    return [
+        {
+            "service_name": service_name,
+            "action": action,
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+        }
+        for (service_name, action), values in sorted(durations.items())
+    ]
@@ -0,0 +1,143 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from logging import getLogger
+from threading import Lock
+from typing import Callable, Collection, Dict, List, Optional, Union
+
+import docker
+from django.conf import settings
+from docker import DockerClient
+from docker.errors import NotFound
+
+from control_center.libs.circuit_breaker import CircuitBreaker
+
+# Docker daemons managed by Control Center: the local one (the daemon of the environment, DOCKER_HOST...) named
+# LOCAL_DOCKER_HOST, and the ones of DOCKER_HOSTS. Each host keeps a single client (and its connection pool) for the
+# life of the process. Listings run on all the hosts at once: a host answering after DOCKER_HOST_TIMEOUT seconds or
+# failing is left out of the results, and is skipped by a circuit breaker after repeated failures.
+
+logger = getLogger("control_center")
+
+
+class DockerHost(object):
+    # config: base url of the daemon (unix:// or tcp://) or keyword arguments of DockerClient, None for the environment
+    def __init__(self, name: str, config: Optional[Union[str, Dict]] = None):
+        self.name = name
+        self.config = config
+        self.breaker = CircuitBreaker(
+            settings.DOCKER_HOST_CIRCUIT_BREAKER_FAILURES, settings.DOCKER_HOST_CIRCUIT_BREAKER_RESET
+        )
+        self._lock = Lock()
+        self._client: Optional[DockerClient] = None
+
+    @property
+    def is_local(self) -> bool:
+        return self.name == settings.LOCAL_DOCKER_HOST
+
+    @property
+    def client(self) -> DockerClient:
+        with self._lock:
+            if self._client is None:
+                if self.config is None:
+                    self._client = docker.from_env()
+                elif isinstance(self.config, dict):
+                    self._client = DockerClient(**self.config)
+                else:
+                    self._client = DockerClient(base_url=self.config)
+            return self._client
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+    def __repr__(self):
+        return f"<DockerHost: {self.name}>"
+
+
+# results of a function run on every host, with the reason why each host left out didn't answer
+class HostResults(list):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.unavailable_hosts: Dict[str, str] = {}
+
+
+_hosts_lock = Lock()
+_hosts: Dict[str, DockerHost] = {}
+
+
+def hosts() -> List[DockerHost]:
+    with _hosts_lock:
+        configs = {settings.LOCAL_DOCKER_HOST: None, **settings.DOCKER_HOSTS}
+        for name, config in configs.items():
+            if name not in _hosts or _hosts[name].config != config:
+                _hosts[name] = DockerHost(name, config)
+        return [_hosts[name] for name in configs]
+
+
+# closes the connections of every host, their clients are created again on first use (after a daemon was replaced)
+def reset():
+    with _hosts_lock:
+        for docker_host in _hosts.values():
+            docker_host.close()
+        _hosts.clear()
+
+
+def host(name: Optional[str] = None) -> DockerHost:
+    name = name or settings.LOCAL_DOCKER_HOST
+    for docker_host in hosts():
+        if docker_host.name == name:
+            return docker_host
+    message = f"couldn't find docker host '{name}'"
+    raise NotFound(message="Not Found", explanation=message)
+
+
+# False for the hosts only known through their agent (see pushed_state), their containers can't be acted on
+def is_reachable(name: str) -> bool:
+    return any(docker_host.name == name for docker_host in hosts())
+
+
+def local_host() -> DockerHost:
+    return host(settings.LOCAL_DOCKER_HOST)
+
+
+def several_hosts() -> bool:
+    return bool(settings.DOCKER_HOSTS)
+
+
+# function(host) returns a list for the host, the lists of the hosts that answered in time are concatenated,
+# the hosts named in exclude are left out (their state is pushed by an agent, see pushed_state)
+def fan_out(function: Callable[[DockerHost], list], exclude: Collection[str] = ()) -> HostResults:
+    if not several_hosts() and not exclude:
+        # a single daemon: no threads, and its errors are raised as before
+        return HostResults(function(local_host()))
+    results = HostResults()
+    available = []
+    for docker_host in hosts():
+        if docker_host.name in exclude:
+            continue
+        if docker_host.breaker.allow():
+            available.append(docker_host)
+        else:
+            results.unavailable_hosts[docker_host.name] = "skipped after repeated failures"
+    if not available:
+        return results
+    executor = ThreadPoolExecutor(max_workers=len(available), thread_name_prefix="docker-host")
+    try:
+        futures = {executor.submit(function, docker_host): docker_host for docker_host in available}
+        _, not_done = wait(futures, timeout=settings.DOCKER_HOST_TIMEOUT)
+        # results are kept in the order of the hosts
+        for future, docker_host in futures.items():
+            if future in not_done or future.exception() is not None:
+                timed_out = future in not_done
+                reason = f"no answer within {settings.DOCKER_HOST_TIMEOUT}s" if timed_out else future.exception()
+                logger.warning(f"docker host {docker_host.name} left out of the listing: {reason}")
+                docker_host.breaker.failure()
+                results.unavailable_hosts[docker_host.name] = str(reason)
+            else:
+                docker_host.breaker.success()
+                results.extend(future.result())
+    finally:
+        # the calls still running finish in the background, their results are dropped
+        executor.shutdown(wait=False)
+    return results
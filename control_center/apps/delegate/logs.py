@@ -0,0 +1,145 @@
+from collections import deque
+from typing import Deque, List, Optional
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+
+from control_center.libs.decorators.view_decorators import PerUserLimit
+
+# Bounds of the logs read for a page or an API call: at most LOGS_MAX_LINES lines are asked to docker ("all" included),
+# and only the most recent LOGS_MAX_BYTES bytes of them are kept while reading, the older lines being replaced by a
+# truncation marker. Each user can have at most LOGS_MAX_CONCURRENT_PER_USER log requests (followed logs included)
+# in progress in a process.
+
+DEFAULT_LINES = 100
+# size of the reads of the docker compose logs output
+LOG_CHUNK_SIZE = 65536
+# end of a line cut because it was over the budget
+LINE_CUT_MARKER = b" [...]"
+
+
+def parse_lines(value) -> int:
+    if value is None or value == "":
+        return DEFAULT_LINES
+    if value == "all":
+        return settings.LOGS_MAX_LINES
+    try:
+        lines = int(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f"invalid number of lines '{value}', use a number or 'all'")
+    return max(1, min(lines, settings.LOGS_MAX_LINES))
+
+
+class LogTail(object):
+    # last lines of a log output read in chunks, at most max_bytes of them are kept
+    def __init__(self, skip_first_line: bool = False, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes or settings.LOGS_MAX_BYTES
+        self.truncated_lines = 0
+        self.truncated_bytes = 0
+        self._skip_first_line = skip_first_line
+        self._lines: Deque[bytes] = deque()
+        self._size = 0
+        self._partial = b""
+        self._dropping = False
+
+    def feed(self, chunk: bytes):
+        *lines, partial = (self._partial + chunk).split(b"\n")
+        self._partial = b""
+        if self._dropping:
+            if not lines:
+                # still in the end of a line over the budget
+                self.truncated_bytes += len(partial)
+                return
+            self.truncated_bytes += len(lines[0])
+            lines = lines[1:]
+            self._dropping = False
+        for line in lines:
+            self._add(line)
+        if len(partial) > self.max_bytes:
+            # a single line over the budget, its start is kept and the rest of it dropped
+            self._add(partial)
+            partial = b""
+            self._dropping = True
+        self._partial = partial
+
+    def close(self):
+        if self._partial:
+            self._add(self._partial)
+            self._partial = b""
+        self._dropping = False
+
+    def _add(self, line: bytes):
+        if self._skip_first_line:
+            self._skip_first_line = False
+            return
+        line = line.rstrip(b"\r")
+        if len(line) + 1 > self.max_bytes:
+            # a single line over the budget keeps its start (and its date) followed by a marker
+            kept = max(0, self.max_bytes - 1 - len(LINE_CUT_MARKER))
+            self.truncated_bytes += len(line) - kept
+            line = line[:kept] + LINE_CUT_MARKER
+        self._lines.append(line)
+        self._size += len(line) + 1
+        while self._size > self.max_bytes and self._lines:
+            dropped = self._lines.popleft()
+            self._size -= len(dropped) + 1
+            self.truncated_lines += 1
+            self.truncated_bytes += len(dropped) + 1
+
+    def text(self) -> str:
+        self.close()
+        return b"\n".join(self._lines).decode(errors="replace")
+
+    @property
+    def empty(self) -> bool:
+        return not self._lines and not self._partial
+
+    @property
+    def marker(self) -> Optional[str]:
+        if self.truncated_bytes:
+            return (
+                f"[... {self.truncated_bytes} bytes ({self.truncated_lines} lines) of older logs not shown, "
+                f"the logs are limited to their last {self.max_bytes} bytes ...]"
+            )
+        return None
+
+
+class LogLines(object):
+    # complete lines of a followed log output read in chunks (a chunk can end in the middle of a line or of a character),
+    # a line longer than max_bytes keeps its start (and its date) and the rest of it is dropped
+    def __init__(self, skip_first_line: bool = False, max_bytes: Optional[int] = None):
+        self.max_bytes = max_bytes or settings.LOGS_MAX_BYTES
+        self._skip_first_line = skip_first_line
+        self._partial = b""
+        self._dropping = False
+
+    def feed(self, chunk: bytes) -> List[str]:
+        *lines, partial = (self._partial + chunk).split(b"\n")
+        self._partial = b""
+        if self._dropping:
+            if not lines:
+                # still in the end of a line over the budget
+                return []
+            lines = lines[1:]
+            self._dropping = False
+        if len(partial) > self.max_bytes:
+            lines.append(partial[: self.max_bytes] + LINE_CUT_MARKER)
+            partial = b""
+            self._dropping = True
+        self._partial = partial
+        return self._decode(lines)
+
+    def close(self) -> List[str]:
+        # the last line, when the output doesn't end with a new line
+        partial, self._partial = self._partial, b""
+        return self._decode([partial] if partial else [])
+
+    def _decode(self, lines: List[bytes]) -> List[str]:
+        if lines and self._skip_first_line:
+            self._skip_first_line = False
+            lines = lines[1:]
+        return [line.rstrip(b"\r").decode(errors="replace") for line in lines]
+
+
+# log requests in progress per user (streamed logs until the client goes away)
+log_requests = PerUserLimit("LOGS_MAX_CONCURRENT_PER_USER")
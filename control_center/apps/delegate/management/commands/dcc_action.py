@@ -0,0 +1,205 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from subprocess import CalledProcessError
+from typing import Callable, Dict, List, Optional
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import CommandError
+from docker.errors import DockerException
+
+from control_center.apps.delegate import docker, history, hosts, reconcile
+from control_center.apps.delegate.management.streaming import StreamingCommand
+from control_center.apps.delegate.objects import ComposeProject, ComposeService, Container, Inventory
+
+# methods of the objects of the inventory run by each action
+PROJECT_ACTIONS = {"up": "up", "apply": None, "down": "down", "remove": "rm", "restart": "restart"}
+SERVICE_ACTIONS = {
+    "up": "up",
+    "stop": "stop",
+    "start": "start",
+    "remove": "rm",
+    "restart": "restart",
+    "update": "update",
+    "rollback": "rollback",
+}
+CONTAINER_ACTIONS = {"stop": "stop", "start": "start", "restart": "restart", "remove": "rm"}
+
+
+# actions on the managed project, on several of its services or on several containers (of any docker host), without
+# going through the web server. The targets are found in a single listing (the same inventory as the api), and each
+# action is recorded in the action history like the ones of the web interface. There is no permission check, the
+# command runs with the access of the server to the docker daemons.
+class Command(StreamingCommand):
+    help = "Runs an action on the managed project, on some of its services or on some containers"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("action", help="up, apply, down, stop, start, restart, remove, update or rollback")
+        targets = parser.add_mutually_exclusive_group(required=True)
+        targets.add_argument("--project", action="store_true", help="the managed project")
+        targets.add_argument("--service", nargs="+", metavar="NAME", help="services of the project ('all' for all)")
+        targets.add_argument("--container", nargs="+", metavar="ID", help="container names or ids ('all' for all)")
+        parser.add_argument("--host", help="only the containers of this docker host")
+        parser.add_argument("--status", help="only the containers with this status (running, exited...)")
+        parser.add_argument("--user", help="user the actions are recorded for in the action history")
+        parser.add_argument("--parallel", type=int, default=1, help="number of containers acted on at once")
+        parser.add_argument("--dry-run", action="store_true", help="show the targets without running the action")
+
+    def handle(self, *args, **options):
+        self.user = self.get_user(options["user"])
+        self.dry_run = options["dry_run"]
+        # services that failed during an apply (reconcile handles their errors)
+        self.apply_failures = 0
+        action = options["action"]
+        actions = (
+            PROJECT_ACTIONS if options["project"] else SERVICE_ACTIONS if options["service"] else CONTAINER_ACTIONS
+        )
+        if action not in actions:
+            raise CommandError(f"'{action}' is not an action of this target, use one of: {', '.join(actions)}")
+        inventory = docker.inventory(inspect=False, all_hosts=bool(options["container"]))
+        try:
+            if options["project"]:
+                if not inventory.project:
+                    raise CommandError("there is no compose project to act on")
+                failed = (not self.project_action(inventory.project, action)) + self.apply_failures
+            elif options["service"]:
+                failed = self.service_actions(self.find_services(inventory, options["service"]), action)
+            else:
+                for name, reason in inventory.unavailable_hosts.items():
+                    self.emit({"target": "host", "host": name, "error": reason}, f"host {name} unavailable: {reason}")
+                failed = self.container_actions(self.find_containers(inventory, options), action, options["parallel"])
+        finally:
+            # the records of the actions are written before the command exits
+            history.writer.flush()
+        if failed:
+            raise CommandError(f"{failed} action(s) failed")
+
+    @staticmethod
+    def get_user(username: Optional[str]):
+        if not username:
+            return None
+        try:
+            return get_user_model().objects.get(username=username)
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"user '{username}' doesn't exist")
+
+    def project_action(self, project: ComposeProject, action: str) -> bool:
+        return self.run_action(
+            {"target": "project", "project": project.project_name, "action": action},
+            f"project {project.project_name}",
+            action in project.allowed_actions() or action == "apply",
+            lambda: self.apply(project) if action == "apply" else getattr(project, PROJECT_ACTIONS[action])(),
+            project_name=project.project_name,
+        )
+
+    def apply(self, project: ComposeProject):
+        for item in reconcile.apply(project):
+            self.apply_failures += item.result == reconcile.FAILED
+            self.emit(
+                {"target": "service", "project": project.project_name, "action": "apply", **item._asdict()},
+                f"  service {item.service_name}: {item.action} {item.result or ''} {item.error or ''}".rstrip(),
+            )
+
+    def find_services(self, inventory: Inventory, names: List[str]) -> List[ComposeService]:
+        if not inventory.project:
+            raise CommandError("there is no compose project to act on")
+        services = {service.service_name: service for service in inventory.project.services}
+        if names == ["all"]:
+            return list(services.values())
+        unknown = [name for name in names if name not in services]
+        if unknown:
+            raise CommandError(f"unknown service(s): {', '.join(unknown)}")
+        return [services[name] for name in names]
+
+    def service_actions(self, services: List[ComposeService], action: str) -> int:
+        # one at a time, the docker compose commands of a project would compete for its containers and networks
+        failed = 0
+        for service in services:
+            done = self.run_action(
+                {
+                    "target": "service",
+                    "project": service.project_name,
+                    "service": service.service_name,
+                    "action": action,
+                },
+                f"service {service.service_name}",
+                action in service.allowed_actions(),
+                getattr(service, SERVICE_ACTIONS[action]),
+                project_name=service.project_name,
+                service_name=service.service_name,
+            )
+            failed += not done
+        return failed
+
+    def find_containers(self, inventory: Inventory, options) -> List[Container]:
+        containers = [
+            cont
+            for cont in inventory.containers
+            if (not options["host"] or cont.host == options["host"])
+            and (not options["status"] or cont.status == options["status"])
+        ]
+        if options["container"] == ["all"]:
+            return containers
+        found: Dict[Container, None] = {}
+        for reference in options["container"]:
+            matches = [cont for cont in containers if cont.name == reference] or [
+                cont for cont in containers if cont.id.startswith(reference)
+            ]
+            if not matches:
+                raise CommandError(f"no container named or with an id starting with '{reference}'")
+            if len(matches) > 1:
+                names = ", ".join(f"{cont.host}/{cont.name}" for cont in matches)
+                raise CommandError(f"'{reference}' matches several containers ({names}), use --host or a longer id")
+            found[matches[0]] = None
+        return list(found)
+
+    def container_actions(self, containers: List[Container], action: str, parallel: int) -> int:
+        def act(container: Container) -> Callable[[], bool]:
+            return lambda: self.run_action(
+                {"target": "container", "host": container.host, "id": container.id, "action": action},
+                f"container {container.host}/{container.name}",
+                action in container.allowed_actions(),
+                getattr(container, CONTAINER_ACTIONS[action]),
+                # the containers of hosts only known through their agent can't be acted on
+                reason=None if hosts.is_reachable(container.host) else "the host is only known through its agent",
+                container_id=container.id,
+            )
+
+        # the containers of every host share the pooled client of their host, the results are written as they come
+        with ThreadPoolExecutor(max_workers=max(1, parallel), thread_name_prefix="dcc-action") as executor:
+            futures = [executor.submit(act(container)) for container in containers]
+            return sum(not future.result() for future in as_completed(futures))
+
+    # runs (and records) the action if it is allowed in the state of the listing, returns False when it failed
+    def run_action(
+        self, target: dict, label: str, allowed: bool, function: Callable, reason: Optional[str] = None, **names
+    ) -> bool:
+        if reason:
+            self.emit({**target, "result": "failed", "error": reason}, f"{label}: {reason}", self.style.ERROR)
+            return False
+        if self.dry_run or not allowed:
+            result = "planned" if self.dry_run and allowed else "skipped"
+            self.emit({**target, "result": result}, f"{label}: {target['action']} {result}")
+            return True
+        start = time.perf_counter()
+        try:
+            with history.recorded_action(self.user, target["target"], target["action"], **names):
+                function()
+        except (CalledProcessError, DockerException) as error:
+            duration = time.perf_counter() - start
+            # docker compose writes its errors with the rest of its output
+            output = getattr(error, "output", None)
+            message = output.decode(errors="replace").strip() if output else str(error)
+            self.emit(
+                {**target, "result": "failed", "duration": duration, "error": message},
+                f"{label}: {target['action']} failed: {message}",
+                self.style.ERROR,
+            )
+            return False
+        duration = time.perf_counter() - start
+        self.emit(
+            {**target, "result": "done", "duration": duration},
+            f"{label}: {target['action']} done in {duration:.1f}s",
+            self.style.SUCCESS,
+        )
+        return True
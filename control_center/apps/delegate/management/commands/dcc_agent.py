@@ -0,0 +1,29 @@
+import socket
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from control_center.apps.delegate.agent import Agent
+
+
+# runs the agent of the local docker daemon (see delegate.agent) until interrupted
+class Command(BaseCommand):
+    help = "Pushes the state of the containers of the local docker daemon to a central control center"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--central", default=settings.AGENT_CENTRAL_URL, help="url of the central control center")
+        parser.add_argument("--token", default=settings.AGENT_TOKEN, help="API token of a user allowed to push states")
+        parser.add_argument(
+            "--name", default=settings.AGENT_HOST_NAME or socket.gethostname(), help="name of this docker host"
+        )
+        parser.add_argument("--once", action="store_true", help="push the full state once and exit")
+
+    def handle(self, *args, **options):
+        if not options["central"] or not options["token"]:
+            raise CommandError("the central url and the API token are required (AGENT_CENTRAL_URL, AGENT_TOKEN)")
+        agent = Agent(options["central"], options["token"], options["name"])
+        self.stdout.write(f"pushing the state of {options['name']} to {agent.push_url}")
+        try:
+            agent.run(once=options["once"])
+        except KeyboardInterrupt:
+            agent.stop()
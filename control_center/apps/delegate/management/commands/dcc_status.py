@@ -0,0 +1,83 @@
+import time
+
+from django.utils import timezone
+
+from control_center.apps.delegate import docker
+from control_center.apps.delegate.management.streaming import StreamingCommand
+from control_center.apps.delegate.objects import Container, Inventory
+
+
+# state of the managed project and of the containers of every docker host, read from a single listing (the same
+# inventory as the api) without going through the web server
+class Command(StreamingCommand):
+    help = "Shows the state of the managed project and of the containers of every docker host"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument("--host", help="only the containers of this docker host")
+        parser.add_argument("--status", help="only the containers with this status (running, exited...)")
+        parser.add_argument(
+            "--watch",
+            type=float,
+            nargs="?",
+            const=5.0,
+            metavar="SECONDS",
+            help="list again every SECONDS (5 by default) and show the state whenever it changes, until interrupted",
+        )
+
+    def handle(self, *args, **options):
+        etag = None
+        try:
+            while True:
+                inventory = docker.inventory(inspect=True, all_hosts=True)
+                if inventory.etag() != etag:
+                    etag = inventory.etag()
+                    self.show(inventory, options)
+                if not options["watch"]:
+                    return
+                time.sleep(options["watch"])
+        except KeyboardInterrupt:
+            pass
+
+    def show(self, inventory: Inventory, options):
+        now = timezone.now()
+        self.emit({"kind": "snapshot", "etag": inventory.etag(), "at": now}, f"# {now:%Y-%m-%d %H:%M:%S}")
+        if inventory.project and not options["host"] and not options["status"]:
+            project = inventory.project
+            self.emit(
+                {"kind": "project", "name": project.project_name, "status": project.status()},
+                f"project {project.project_name}: {project.status()}",
+            )
+            for service in project.services:
+                summary = service.summary()
+                self.emit(
+                    {
+                        "kind": "service",
+                        "project": project.project_name,
+                        "name": service.service_name,
+                        "status": service.status(),
+                        "counts": dict(summary.counts),
+                        "out_of_sync": len(summary.out_of_sync),
+                        "allowed_actions": service.allowed_actions(),
+                    },
+                    f"  service {service.service_name}: {service.status()} ({summary.total} containers)",
+                )
+        for container in inventory.containers:
+            if options["host"] and container.host != options["host"]:
+                continue
+            if options["status"] and container.status != options["status"]:
+                continue
+            self.emit_container(container)
+        for name, reason in inventory.unavailable_hosts.items():
+            self.emit(
+                {"kind": "unavailable_host", "host": name, "reason": reason},
+                f"host {name} unavailable: {reason}",
+                self.style.WARNING,
+            )
+
+    def emit_container(self, container: Container):
+        origin = " ".join(part for part in [container.project, container.service] if part) or "standalone"
+        self.emit(
+            {"kind": "container", "host": container.host, **container.as_record()},
+            f"{container.host} {container.id[:12]} {container.name}: {container.status} ({origin})",
+        )
@@ -0,0 +1,23 @@
+import json
+from typing import Optional
+
+from django.core.management.base import BaseCommand
+
+
+# base of the commands writing their results one line at a time (one json object per line with --json), each line is
+# flushed as soon as it is written so that a script reading the output doesn't wait for the end of the command
+class StreamingCommand(BaseCommand):
+    def add_arguments(self, parser):
+        parser.add_argument("--json", action="store_true", help="one json object per line")
+
+    def execute(self, *args, **options):
+        self.json = options.get("json", False)
+        return super().execute(*args, **options)
+
+    def emit(self, item: dict, text: Optional[str] = None, style=None):
+        if self.json:
+            line = json.dumps(item, separators=(",", ":"), default=str)
+        else:
+            line = text if style is None else style(text)
+        self.stdout.write(line)
+        self.stdout.flush()
@@ -0,0 +1,67 @@
+# Generated by Django 5.2 on 2026-10-19 11:22
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ActionRecord",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("username", models.CharField(blank=True, max_length=150)),
+                (
+                    "target",
+                    models.CharField(
+                        choices=[
+                            ("project", "project"),
+                            ("service", "service"),
+                            ("container", "container"),
+                            ("system", "system"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("project_name", models.CharField(blank=True, max_length=255)),
+                ("service_name", models.CharField(blank=True, max_length=255)),
+                ("container_id", models.CharField(blank=True, max_length=255)),
+                ("action", models.CharField(max_length=50)),
+                ("started_at", models.DateTimeField()),
+                ("ended_at", models.DateTimeField()),
+                ("duration", models.FloatField(help_text="seconds")),
+                ("exit_status", models.IntegerField()),
+                (
+                    "output_size",
+                    models.IntegerField(help_text="bytes of docker compose output"),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-started_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["action", "started_at"],
+                        name="delegate_ac_action_02225a_idx",
+                    ),
+                    models.Index(fields=["started_at"], name="delegate_ac_started_d23dcd_idx"),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-19 11:51
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("delegate", "0001_initial"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PushedHostState",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("host", models.CharField(max_length=255, unique=True)),
+                ("agent_run", models.CharField(max_length=64)),
+                ("sequence", models.BigIntegerField()),
+                ("containers", models.JSONField(default=dict)),
+                ("pushed_at", models.DateTimeField()),
+                (
+                    "pushed_by",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["host"],
+            },
+        ),
+    ]
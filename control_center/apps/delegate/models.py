@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.db import models
+
+
+# append-only history of the actions run through the control center (see delegate.history)
+class ActionRecord(models.Model):
+    TARGET_CHOICES = [
+        ("project", "project"),
+        ("service", "service"),
+        ("container", "container"),
+        ("system", "system"),
+    ]
+
+    # explicit, the project sets no DEFAULT_AUTO_FIELD
+    id = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    # kept when the user is deleted
+    username = models.CharField(max_length=150, blank=True)
+    target = models.CharField(max_length=20, choices=TARGET_CHOICES)
+    project_name = models.CharField(max_length=255, blank=True)
+    service_name = models.CharField(max_length=255, blank=True)
+    container_id = models.CharField(max_length=255, blank=True)
+    action = models.CharField(max_length=50)
+    started_at = models.DateTimeField()
+    ended_at = models.DateTimeField()
+    duration = models.FloatField(help_text="seconds")
+    # 0 on success, the exit code of the failed docker command or -1 for any other error
+    exit_status = models.IntegerField()
+    output_size = models.IntegerField(help_text="bytes of docker compose output")
+
+    class Meta:
+        ordering = ["-started_at"]
+        indexes = [models.Index(fields=["action", "started_at"]), models.Index(fields=["started_at"])]
+
+    def __str__(self):
+        target = self.service_name or self.project_name or self.container_id or self.target
+        return f"{self.action} {target} by {self.username or '?'} at {self.started_at}"
+
+
+# latest state of the containers of a docker host, pushed by the agent running beside its daemon (see delegate.agent
+# and delegate.pushed_state)
+class PushedHostState(models.Model):
+    id = models.BigAutoField(primary_key=True)
+    host = models.CharField(max_length=255, unique=True)
+    # user of the agent that first pushed the host, the only one allowed to push it (delete the state to change it)
+    pushed_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    # identifies a run of the agent, the pushes of a run are numbered one after the other
+    agent_run = models.CharField(max_length=64)
+    sequence = models.BigIntegerField()
+    # container id: record of the container (see objects.Container.as_record)
+    containers = models.JSONField(default=dict)
+    pushed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ["host"]
+
+    def __str__(self):
+        return f"{self.host} ({len(self.containers)} containers) pushed at {self.pushed_at}"
@@ -1,7 +1,8 @@
+import hashlib
 from configparser import ConfigParser
 from datetime import datetime
-from types import SimpleNamespace
-from typing import List, Optional, Union
+from types import MappingProxyType, SimpleNamespace
+from typing import Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple, Union
 
 from dateutil import parser
 from django.conf import settings
@@ -10,7 +11,8 @@ from docker.errors import ImageNotFound
 from docker.models.containers import Container as DockerContainer
 from pytz import utc
 
-from control_center.apps.delegate import docker
+from control_center.apps.delegate import docker, hosts
+from control_center.apps.delegate.logs import LogTail
 
 
 class ComposeServiceConfig(object):
@@ -40,6 +42,14 @@ class ComposeServiceConfig(object):
         return 1
 
 
+class ServiceLogo(object):
+    def __init__(self, content: bytes, content_type: str, modified: float):
+        self.content: bytes = content
+        self.content_type: str = content_type
+        self.modified: float = modified
+        self.etag: str = hashlib.sha256(content).hexdigest()[:32]
+
+
 class Container(object):
     STATUS = SimpleNamespace(
         **{
@@ -53,22 +63,114 @@ class Container(object):
         }
     )
 
-    def __init__(self, container: DockerContainer):
-        self._docker_container: DockerContainer = container
-        self.name: str = container.name
-        self.short_id: str = container.short_id
-        self.id: str = container.id
+    # compact, immutable record: only what the pages and the API use is kept from the docker inspect data
+    __slots__ = ("id", "name", "status", "started_at", "tags", "service", "service_hash", "project", "host")
+
+    def __init__(
+        self,
+        id: str,
+        name: str,
+        status: str,
+        started_at: Optional[datetime] = None,
+        tags: Optional[Tuple[str, ...]] = None,
+        service: Optional[str] = None,
+        service_hash: Optional[str] = None,
+        project: Optional[str] = None,
+        host: Optional[str] = None,
+    ):
+        set_attribute = super().__setattr__
+        set_attribute("id", id)
+        set_attribute("name", name)
+        set_attribute("status", status)
+        set_attribute("started_at", started_at)
+        set_attribute("tags", tags)
+        set_attribute("service", service)
+        set_attribute("service_hash", service_hash)
+        set_attribute("project", project)
+        # name of the docker host running the container (see hosts)
+        set_attribute("host", host or settings.LOCAL_DOCKER_HOST)
+
+    @classmethod
+    def from_docker(cls, container: DockerContainer, host: Optional[str] = None) -> "Container":
         try:
-            self.tags: str = container.image.tags
+            tags = tuple(container.image.tags)
         except ImageNotFound:
-            self.tags = None
-        self.status: str = container.status
-        self.started_at: datetime = parse_datetime(container.attrs["State"]["StartedAt"]) if parse_datetime(
-            container.attrs["State"]["StartedAt"]
-        ) != utc.localize(datetime.min) else None
-        self.service: str = container.labels.get("com.docker.compose.service")
-        self.service_hash: str = container.labels.get("com.docker.compose.config-hash")
-        self.project: str = container.labels.get("com.docker.compose.project")
+            tags = None
+        return cls.from_summary(container.attrs, tags=tags, state=container.attrs["State"], host=host)
+
+    # summary: an item of the sparse container listing or the container inspect data (same labels and id),
+    # state: the "State" of the inspect data, only needed for the status and the start time
+    @classmethod
+    def from_summary(
+        cls,
+        summary: dict,
+        tags: Optional[Tuple[str, ...]] = None,
+        state: Optional[dict] = None,
+        host: Optional[str] = None,
+    ) -> "Container":
+        labels = summary.get("Labels") or (summary.get("Config") or {}).get("Labels") or {}
+        name = summary["Names"][0] if "Names" in summary else summary["Name"]
+        return cls(
+            id=summary["Id"],
+            name=name.lstrip("/"),
+            status=state["Status"] if state else summary.get("State"),
+            started_at=parse_started_at(state["StartedAt"]) if state else None,
+            tags=tags,
+            service=labels.get("com.docker.compose.service"),
+            service_hash=labels.get("com.docker.compose.config-hash"),
+            project=labels.get("com.docker.compose.project"),
+            host=host,
+        )
+
+    # compact form of the container pushed by the agents (see agent and pushed_state)
+    def as_record(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "tags": list(self.tags) if self.tags is not None else None,
+            "service": self.service,
+            "service_hash": self.service_hash,
+            "project": self.project,
+        }
+
+    @classmethod
+    def from_record(cls, record: dict, host: str) -> "Container":
+        return cls(
+            id=record["id"],
+            name=record["name"],
+            status=record["status"],
+            started_at=parse_datetime(record["started_at"]) if record.get("started_at") else None,
+            tags=tuple(record["tags"]) if record.get("tags") is not None else None,
+            service=record.get("service"),
+            service_hash=record.get("service_hash"),
+            project=record.get("project"),
+            host=host,
+        )
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __eq__(self, other):
+        return isinstance(other, Container) and other.id == self.id and other.host == self.host
+
+    def __hash__(self):
+        return hash((self.host, self.id))
+
+    def __repr__(self):
+        return f"<Container: {self.short_id} {self.name} on {self.host}>"
+
+    @property
+    def short_id(self) -> str:
+        return self.id[:12]
+
+    @property
+    def is_local(self) -> bool:
+        return self.host == settings.LOCAL_DOCKER_HOST
+
+    def client(self):
+        return hosts.host(self.host).client
 
     def tags_display(self) -> str:
         if self.tags:
@@ -88,91 +190,145 @@ class Container(object):
     def can_be_removed(self):
         return self.status == self.STATUS.EXITED
 
+    def allowed_actions(self) -> List[str]:
+        actions = {
+            "stop": self.can_be_stopped,
+            "start": self.can_be_started,
+            "restart": self.can_be_restarted,
+            "remove": self.can_be_removed,
+        }
+        return [action for action, allowed in actions.items() if allowed()]
+
+    # actions go straight to the docker API of its host with the container id, there is no need to inspect the container
+    # again
     def stop(self):
         if self.can_be_stopped():
-            self._docker_container.stop()
+            self.client().api.stop(self.id)
 
     def start(self):
         if self.can_be_started():
-            self._docker_container.start()
+            self.client().api.start(self.id)
 
     def restart(self):
         if self.can_be_restarted():
-            self._docker_container.restart()
+            self.client().api.restart(self.id)
 
     def rm(self):
         if self.can_be_removed():
-            self._docker_container.remove()
+            self.remove()
+
+    def remove(self):
+        self.client().api.remove_container(self.id)
 
     def rename(self, name: str):
-        self._docker_container.rename(name)
+        self.client().api.rename(self.id, name)
 
     def logs(self, lines: int, array=False) -> Union[List[str], str]:
-        output = self._docker_container.logs(tail=lines, timestamps=True)
-        if output:
-            output = output.decode()
-            # make sure we are only dealing with \n
-            output = output.replace("\r\n", "\n")
-            log_output = output.split("\n")
-            new_output = [recompose_log_line_with_formatted_date(line, "%m-%d %H:%M:%S") for line in log_output]
-            if array:
-                return new_output
-            else:
-                return "\n".join(new_output)
+        # read in chunks, only the most recent LOGS_MAX_BYTES are kept
+        tail = LogTail()
+        for chunk in self.client().api.logs(self.id, tail=lines, timestamps=True, stream=True, follow=False):
+            tail.feed(chunk)
+        if not tail.empty:
+            return format_log_tail(tail, array=array)
+
+    def follow_logs(self, lines: int):
+        # blocking generator of log chunks, following the container output until closed
+        return self.client().api.logs(self.id, tail=lines, timestamps=True, stream=True, follow=True)
 
 
 class ComposeService(object):
     ROLLBACK_SUFFIX = "_previous"
 
-    def __init__(self, project_name: str, service_name: str, service_config: Optional[ComposeServiceConfig]):
+    def __init__(
+        self,
+        project_name: str,
+        service_name: str,
+        service_config: Optional[ComposeServiceConfig],
+        containers: Optional[List[Container]] = None,
+    ):
         self.project_name: str = project_name
         self.service_name: str = service_name
         self.config: ComposeServiceConfig = service_config
         self.containers: List[Container] = []
-        self.refresh_containers()
+        # containers can be given when they were already listed for the whole project
+        if containers is None:
+            self.refresh_containers()
+        else:
+            self.containers = containers
+
+    @property
+    def containers(self) -> List[Container]:
+        return self._containers
+
+    @containers.setter
+    def containers(self, containers: List[Container]):
+        self._containers: List[Container] = containers
+        self._summary: Optional[ContainersSummary] = None
 
     def refresh_containers(self):
         self.containers = docker.containers_for_service(project_name=self.project_name, service_name=self.service_name)
 
+    # computed once for the current containers, every can_be_* method reads from it
+    def summary(self) -> "ContainersSummary":
+        if self._summary is None:
+            self._summary = ContainersSummary.of(
+                self._containers, self.config.hash if self.config else None, self.ROLLBACK_SUFFIX
+            )
+        return self._summary
+
     def stopped_containers(self) -> List[Container]:
-        return list(filter(lambda cont: cont.status == Container.STATUS.EXITED, self.containers))
+        return list(self.summary().stopped)
 
     def running_containers(self) -> List[Container]:
-        return list(filter(lambda cont: cont.status == Container.STATUS.RUNNING, self.containers))
+        return list(self.summary().running)
 
     def rollback_containers(self) -> List[Container]:
-        return list(filter(lambda cont: cont.name.endswith(self.ROLLBACK_SUFFIX), self.containers))
+        return list(self.summary().rollback)
 
     def out_of_sync_containers(self) -> List[Container]:
-        return list(filter(lambda cont: self.config and cont.service_hash != self.config.hash, self.containers))
+        return list(self.summary().out_of_sync)
 
     def config_image_display(self) -> str:
         return remove_custom_registry_from_image_name(self.config.image) if self.config else ""
 
     def can_be_upped(self) -> bool:
-        return not any(self.rollback_containers())
+        return not self.summary().rollback
 
     def can_be_started(self) -> bool:
-        return not any(self.rollback_containers()) and any(self.stopped_containers())
+        return not self.summary().rollback and bool(self.summary().stopped)
 
     def can_be_stopped(self) -> bool:
-        return any(self.running_containers())
+        return bool(self.summary().running)
 
     def can_be_restarted(self) -> bool:
-        return not any(self.rollback_containers()) and any(self.containers)
+        return not self.summary().rollback and self.summary().total > 0
 
     def can_be_removed(self) -> bool:
-        return any(self.stopped_containers())
+        return bool(self.summary().stopped)
 
     def can_be_updated(self) -> bool:
-        return (
-            self.config
-            and not self.config.ports
-            and any(filter(lambda cont: cont not in self.rollback_containers(), self.out_of_sync_containers()))
-        )
+        return bool(self.config and not self.config.ports and self.summary().updatable)
 
     def can_be_rolled_back(self) -> bool:
-        return any(self.rollback_containers())
+        return bool(self.summary().rollback)
+
+    def status(self) -> str:
+        return self.summary().status()
+
+    def allowed_actions(self) -> List[str]:
+        if not self.config:
+            # orphan services can't be managed with docker compose
+            return []
+        actions = {
+            "up": self.can_be_upped,
+            "stop": self.can_be_stopped,
+            "start": self.can_be_started,
+            "restart": self.can_be_restarted,
+            "remove": self.can_be_removed,
+            "update": self.can_be_updated,
+            "rollback": self.can_be_rolled_back,
+        }
+        return [action for action, allowed in actions.items() if allowed()]
 
     def up(self):
         if self.can_be_upped():
@@ -236,27 +392,14 @@ class ComposeService(object):
             for container in self.containers:
                 if container not in rollback_containers:
                     container.stop()
-                    container._docker_container.remove()
+                    container.remove()
             for container in rollback_containers:
                 container.rename(container.name.replace(self.ROLLBACK_SUFFIX, ""))
                 container.start()
             run_extra_command(self.project_name)
 
     def logs(self, lines=100, array=False) -> Union[List[str], str]:
-        log_output = docker.execute_compose_command(
-            self.project_name, ["logs", "--no-color", "--timestamps", f"--tail={lines}", self.service_name], debug=False
-        )
-        # make sure we are only dealing with \n
-        log_output = log_output.replace("\r\n", "\n")
-        # remove first line of logs (it's useless)
-        log_output = log_output.split("\n")[1:]
-
-        new_output = [recompose_log_line_with_formatted_date(line, "%m-%d %H:%M:%S") for line in log_output]
-
-        if array:
-            return new_output
-        else:
-            return "\n".join(new_output)
+        return format_log_tail(docker.compose_logs(self.project_name, self.service_name, lines), array=array)
 
 
 class ComposeProjectConfig(object):
@@ -281,6 +424,13 @@ class ComposeProjectConfig(object):
                 )
             )
 
+    def etag(self) -> str:
+        # changes whenever the resolved configuration of any service changes
+        state = [self.compose_file_path, self.project_name] + [
+            f"{ser_conf.service_name}={ser_conf.hash}" for ser_conf in self.service_configs
+        ]
+        return hashlib.sha256("\n".join(state).encode()).hexdigest()[:32]
+
     def original_file_content(self):
         with open(self.compose_file_path, "r") as stream:
             return stream.read()
@@ -290,6 +440,34 @@ class ComposeProjectConfig(object):
             return next(filter(lambda ser_conf: ser_conf.service_name == service_name, self.service_configs))
 
 
+def parse_started_at(started_at: str) -> Optional[datetime]:
+    # containers that never ran have a zero date
+    parsed = parse_datetime(started_at)
+    return parsed if parsed != utc.localize(datetime.min) else None
+
+
+def compose_logs_arguments(service_name: str, lines, follow: bool = False) -> List[str]:
+    return ["logs", "--no-color", "--timestamps", f"--tail={lines}"] + (["--follow"] if follow else []) + [service_name]
+
+
+def format_logs(output: str, array=False, skip_lines: int = 0) -> Union[List[str], str]:
+    # make sure we are only dealing with \n
+    log_output = output.replace("\r\n", "\n").split("\n")[skip_lines:]
+    new_output = [recompose_log_line_with_formatted_date(line, "%m-%d %H:%M:%S") for line in log_output]
+    if array:
+        return new_output
+    else:
+        return "\n".join(new_output)
+
+
+def format_log_tail(tail: LogTail, array=False) -> Union[List[str], str]:
+    # the truncation marker (if any) comes first, in place of the older lines
+    logs = format_logs(tail.text(), array=array)
+    if tail.marker:
+        return [tail.marker] + logs if array else tail.marker + "\n" + logs
+    return logs
+
+
 def recompose_log_line_with_formatted_date(line: str, date_format: str) -> str:
     new_line = line
     # docker-compose has a very strict formatting. date is always 31 long, after | character
@@ -298,7 +476,11 @@ def recompose_log_line_with_formatted_date(line: str, date_format: str) -> str:
         if "|" in line:
             index_date_start = line.index("|") + 2
         index_date_end = index_date_start + 30
-        date = parser.parse(line[index_date_start:index_date_end])
+        try:
+            date = parser.parse(line[index_date_start:index_date_end])
+        except (ValueError, OverflowError):
+            # not a log line (docker compose messages, end of a cut line...), left as is
+            return line
         new_line = line[0:index_date_start] + "[" + date.strftime(date_format) + "]" + line[index_date_end : len(line)]
     return new_line
 
@@ -309,43 +491,87 @@ def run_extra_command(project_name: str):
 
 
 class ComposeProject(object):
-    def __init__(self, project_name: str, project_config: ComposeProjectConfig):
+    def __init__(
+        self, project_name: str, project_config: ComposeProjectConfig, containers: Optional[List[Container]] = None
+    ):
         self.project_name: str = project_name
         self.config: ComposeProjectConfig = project_config
         self.services: List[ComposeService] = []
-        self.create_services()
+        self._summary: Optional[ContainersSummary] = None
+        self.create_services(containers)
+
+    def create_services(self, containers: Optional[List[Container]] = None):
+        # a single container listing for the whole project, split between its services
+        if containers is None:
+            containers = docker.containers_for_project(project_name=self.project_name)
+        containers_by_service: Dict[str, List[Container]] = {}
+        for container in containers:
+            containers_by_service.setdefault(container.service, []).append(container)
+        for service_config in self.config.service_configs:
+            self.services.append(
+                ComposeService(
+                    project_name=self.project_name,
+                    service_name=service_config.service_name,
+                    service_config=service_config,
+                    containers=containers_by_service.pop(service_config.service_name, []),
+                )
+            )
+        # orphan services (containers left from services that are no longer in the compose file)
+        for service_name, service_containers in containers_by_service.items():
+            self.services.append(
+                ComposeService(
+                    project_name=self.project_name,
+                    service_name=service_name,
+                    service_config=None,
+                    containers=service_containers,
+                )
+            )
 
-    def create_services(self):
-        service_names = [service_config.service_name for service_config in self.config.service_configs]
-        containers: List[Container] = docker.containers_for_project(project_name=self.project_name)
-        orphan_service_names = set([cont.service for cont in containers]) - set(service_names)
-        service_names = service_names + list(orphan_service_names)
-        for service_name in service_names:
-            self.services.append(docker.compose_service(project_name=self.project_name, service_name=service_name))
+    def all_containers(self) -> List[Container]:
+        return [container for sublist in self.services for container in sublist.containers]
+
+    # merged from the service summaries once per snapshot of the project
+    def summary(self) -> "ContainersSummary":
+        if self._summary is None:
+            self._summary = ContainersSummary.merge([service.summary() for service in self.services])
+        return self._summary
 
     def stopped_containers(self) -> List[Container]:
-        return [container for sublist in self.services for container in sublist.stopped_containers()]
+        return list(self.summary().stopped)
 
     def running_containers(self) -> List[Container]:
-        return [container for sublist in self.services for container in sublist.running_containers()]
+        return list(self.summary().running)
 
     def rollback_containers(self) -> List[Container]:
-        return [container for sublist in self.services for container in sublist.rollback_containers()]
+        return list(self.summary().rollback)
 
     def can_be_upped(self) -> bool:
-        return not any(self.rollback_containers())
+        return not self.summary().rollback
 
     @staticmethod
     def can_be_downed() -> bool:
         return True
 
     def can_be_removed(self) -> bool:
-        return not any(self.rollback_containers()) and any(self.stopped_containers())
+        return not self.summary().rollback and bool(self.summary().stopped)
 
     def can_be_restarted(self) -> bool:
-        return not any(self.rollback_containers()) and (
-            any(self.stopped_containers()) or any(self.running_containers())
-        )
+        return not self.summary().rollback and bool(self.summary().stopped or self.summary().running)
+
+    def status(self) -> str:
+        return self.summary().status()
+
+    def out_of_sync(self) -> bool:
+        return bool(self.summary().out_of_sync)
+
+    def allowed_actions(self) -> List[str]:
+        actions = {
+            "up": self.can_be_upped,
+            "down": self.can_be_downed,
+            "restart": self.can_be_restarted,
+            "remove": self.can_be_removed,
+        }
+        return [action for action, allowed in actions.items() if allowed()]
 
     def up(self):
         if self.can_be_upped():
@@ -366,5 +592,123 @@ class ComposeProject(object):
             docker.execute_compose_command(self.project_name, ["restart"])
 
 
+# state of the managed project and of every other container, built from a single container listing
+class Inventory(object):
+    def __init__(self, config: Optional[ComposeProjectConfig], containers: List[Container]):
+        self.config: Optional[ComposeProjectConfig] = config
+        self.containers: List[Container] = containers
+        self.project: Optional[ComposeProject] = None
+        self._services: Dict[str, ComposeService] = {}
+        if config:
+            self.project = ComposeProject(
+                project_name=config.project_name,
+                project_config=config,
+                containers=[cont for cont in containers if cont.project == config.project_name and cont.is_local],
+            )
+            self._services = {service.service_name: service for service in self.project.services}
+
+    @property
+    def unavailable_hosts(self) -> Dict[str, str]:
+        # hosts left out of a listing of every host
+        return getattr(self.containers, "unavailable_hosts", {})
+
+    def is_managed(self, container: Container) -> bool:
+        return bool(self.project and container.project == self.project.project_name and container.is_local)
+
+    def service(self, container: Container) -> Optional[ComposeService]:
+        if self.is_managed(container):
+            return self._services.get(container.service)
+
+    def other_projects(self) -> Dict[str, List[Container]]:
+        projects: Dict[str, List[Container]] = {}
+        for container in self.containers:
+            if container.project and not self.is_managed(container):
+                projects.setdefault(container.project, []).append(container)
+        return projects
+
+    def standalone_containers(self) -> List[Container]:
+        return [cont for cont in self.containers if not cont.project and not cont.service]
+
+    def etag(self) -> str:
+        # changes whenever the configuration or the state of any container changes
+        state = (
+            [self.config.etag() if self.config else ""]
+            + sorted(
+                f"{cont.host} {cont.id} {cont.name} {cont.status} {cont.started_at} {cont.service_hash} {cont.tags}"
+                for cont in self.containers
+            )
+            + sorted(self.unavailable_hosts)
+        )
+        return hashlib.sha256("\n".join(state).encode()).hexdigest()[:32]
+
+
+class ContainersSummary(NamedTuple):
+    total: int
+    counts: Mapping[str, int]
+    running: Tuple[Container, ...]
+    stopped: Tuple[Container, ...]
+    rollback: Tuple[Container, ...]
+    out_of_sync: Tuple[Container, ...]
+    # out of sync containers that are not rollback containers (the ones an update replaces)
+    updatable: int
+
+    @classmethod
+    def of(
+        cls, containers: Iterable[Container], config_hash: Optional[str] = None, rollback_suffix: str = None
+    ) -> "ContainersSummary":
+        # a single pass over the containers
+        counts: Dict[str, int] = {}
+        running, stopped, rollback, out_of_sync = [], [], [], []
+        updatable = 0
+        for container in containers:
+            counts[container.status] = counts.get(container.status, 0) + 1
+            if container.status == Container.STATUS.RUNNING:
+                running.append(container)
+            elif container.status == Container.STATUS.EXITED:
+                stopped.append(container)
+            is_rollback = bool(rollback_suffix) and container.name.endswith(rollback_suffix)
+            if is_rollback:
+                rollback.append(container)
+            if config_hash and container.service_hash != config_hash:
+                out_of_sync.append(container)
+                updatable += not is_rollback
+        return cls(
+            sum(counts.values()),
+            MappingProxyType(counts),
+            tuple(running),
+            tuple(stopped),
+            tuple(rollback),
+            tuple(out_of_sync),
+            updatable,
+        )
+
+    @classmethod
+    def merge(cls, summaries: List["ContainersSummary"]) -> "ContainersSummary":
+        counts: Dict[str, int] = {}
+        for summary in summaries:
+            for status, count in summary.counts.items():
+                counts[status] = counts.get(status, 0) + count
+        return cls(
+            sum(summary.total for summary in summaries),
+            MappingProxyType(counts),
+            tuple(cont for summary in summaries for cont in summary.running),
+            tuple(cont for summary in summaries for cont in summary.stopped),
+            tuple(cont for summary in summaries for cont in summary.rollback),
+            tuple(cont for summary in summaries for cont in summary.out_of_sync),
+            sum(summary.updatable for summary in summaries),
+        )
+
+    def status(self) -> str:
+        if not self.total:
+            return "missing"
+        if len(self.running) == self.total:
+            return "running"
+        return "partial" if self.running else "stopped"
+
+
+def summary_status(containers: List[Container]) -> str:
+    return ContainersSummary.of(containers).status()
+
+
 def remove_custom_registry_from_image_name(name: str) -> str:
     return name.replace(settings.STRIP_CUSTOM_REGISTRY, "")
@@ -0,0 +1,124 @@
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from control_center.apps.delegate.hosts import HostResults
+from control_center.apps.delegate.models import PushedHostState
+from control_center.apps.delegate.objects import Container
+
+# Central side of the agent mode (see agent): the agents push the changes of the containers of their host, and the
+# listings of the central instance read the states of the hosts from the database instead of querying their daemons.
+# A push is either a full state or the changes since the previous push of the same agent run: a change pushed out of
+# sequence (central restarted its database, push lost...) is refused and the agent pushes its full state again.
+# The hosts of this instance (LOCAL_DOCKER_HOST, DOCKER_HOSTS) can't be pushed, and a pushed host can only be pushed
+# by the user that pushed it first.
+
+# labels the daemon can filter on, and the container attribute holding their value in the pushed records
+COMPOSE_LABEL_ATTRIBUTES = {
+    "com.docker.compose.project": "project",
+    "com.docker.compose.service": "service",
+    "com.docker.compose.config-hash": "service_hash",
+}
+
+
+def check_push(payload) -> dict:
+    if not isinstance(payload, dict):
+        raise ValidationError("the push must be a json object")
+    for key, kind in [("host", str), ("agent_run", str), ("sequence", int), ("full", bool), ("containers", dict)]:
+        if not isinstance(payload.get(key), kind):
+            raise ValidationError(f"'{key}' is missing or invalid")
+    if is_configured(payload["host"]):
+        raise ValidationError(f"'{payload['host']}' is a docker host of this instance, push under another name")
+    if not isinstance(payload.get("removed", []), list):
+        raise ValidationError("'removed' must be a list of container ids")
+    for record in payload["containers"].values():
+        if not isinstance(record, dict) or not all(
+            isinstance(record.get(key), str) for key in ["id", "name", "status"]
+        ):
+            raise ValidationError("containers must be records with an id, a name and a status")
+    return payload
+
+
+def is_configured(name: str) -> bool:
+    return name == settings.LOCAL_DOCKER_HOST or name in settings.DOCKER_HOSTS
+
+
+# applies a push of the user, returns False when the agent has to push its full state instead
+def apply_push(payload: dict, user) -> bool:
+    payload = check_push(payload)
+    with transaction.atomic():
+        state = PushedHostState.objects.select_for_update().filter(host=payload["host"]).first()
+        if state is not None and state.pushed_by_id != user.pk:
+            raise PermissionDenied(f"'{payload['host']}' is pushed by another user")
+        if payload["full"]:
+            containers = payload["containers"]
+        elif state is None or state.agent_run != payload["agent_run"] or payload["sequence"] > state.sequence + 1:
+            return False
+        elif payload["sequence"] <= state.sequence:
+            # already applied, the agent didn't get the answer
+            return True
+        else:
+            containers = {**state.containers, **payload["containers"]}
+            for container_id in payload.get("removed", []):
+                containers.pop(container_id, None)
+        values = {
+            "agent_run": payload["agent_run"],
+            "sequence": payload["sequence"],
+            "containers": containers,
+            "pushed_at": timezone.now(),
+        }
+        PushedHostState.objects.update_or_create(
+            host=payload["host"], defaults=values, create_defaults={**values, "pushed_by": user}
+        )
+    return True
+
+
+def pushed_states() -> Dict[str, PushedHostState]:
+    if not settings.AGENT_PUSH_ENABLED:
+        return {}
+    # states pushed before their name was added to DOCKER_HOSTS are ignored, the daemon is queried instead
+    return {state.host: state for state in PushedHostState.objects.all() if not is_configured(state.host)}
+
+
+def is_fresh(state: PushedHostState) -> bool:
+    return state.pushed_at >= timezone.now() - timedelta(seconds=settings.AGENT_STALE_AFTER)
+
+
+def matches_filters(container: Container, filters: Optional[Dict]) -> bool:
+    # the label filters of the daemon listing, on the compose labels kept in the records
+    label_filters = (filters or {}).get("label", [])
+    for label_filter in [label_filters] if isinstance(label_filters, str) else label_filters:
+        label, has_value, value = label_filter.partition("=")
+        actual = getattr(container, COMPOSE_LABEL_ATTRIBUTES[label]) if label in COMPOSE_LABEL_ATTRIBUTES else None
+        if actual is None or (has_value and actual != value):
+            return False
+    return True
+
+
+def pushed_containers(
+    state: PushedHostState, filters: Optional[Dict] = None, keep: Optional[Callable[[Container], bool]] = None
+) -> List[Container]:
+    containers = [Container.from_record(record, host=state.host) for record in state.containers.values()]
+    return [cont for cont in containers if matches_filters(cont, filters) and (keep is None or keep(cont))]
+
+
+# the hosts with a recent pushed state are read from it, the others are listed by list_hosts(names of the hosts to
+# leave out), see hosts.fan_out
+def list_with_pushed_states(
+    list_hosts: Callable[[List[str]], HostResults],
+    filters: Optional[Dict] = None,
+    keep: Optional[Callable[[Container], bool]] = None,
+) -> HostResults:
+    states = pushed_states()
+    fresh = [name for name, state in states.items() if is_fresh(state)]
+    results = list_hosts(fresh)
+    for name, state in states.items():
+        if name in fresh:
+            results.extend(pushed_containers(state, filters, keep))
+        else:
+            results.unavailable_hosts[name] = f"no state pushed since {state.pushed_at:%Y-%m-%d %H:%M:%S}"
+    return results
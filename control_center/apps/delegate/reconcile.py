@@ -0,0 +1,123 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from subprocess import CalledProcessError
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional
+
+from django.conf import settings
+
+if TYPE_CHECKING:
+    # objects imports the docker module, which imports this one
+    from control_center.apps.delegate.objects import ComposeProject, ComposeService
+
+# Reconciliation of a project with its compose file: the config hash of each service (docker compose config --hash)
+# is compared with the hash label of its containers, and only the services that differ are brought up again.
+# Services are applied by dependency level (depends_on), the services of a level in parallel.
+
+CREATE = "create"
+RECREATE = "recreate"
+UNCHANGED = "unchanged"
+# rollback containers are waiting for a rollback or the next update, up is not allowed until then
+BLOCKED = "blocked"
+# containers of a service that is no longer in the compose file, docker compose can't manage them
+ORPHAN = "orphan"
+
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+# result is set once the plan is applied (for services to create or recreate)
+class ServicePlan(NamedTuple):
+    service_name: str
+    action: str
+    reason: str
+    level: int
+    result: Optional[str] = None
+    duration: Optional[float] = None
+    error: Optional[str] = None
+
+
+def dependencies(service: "ComposeService") -> List[str]:
+    # a list in the compose file, a mapping (service: condition) once resolved by docker compose config
+    depends_on = service.config.depends_on if service.config else None
+    return list(depends_on or [])
+
+
+def dependency_levels(services: List["ComposeService"]) -> Dict[str, int]:
+    # a service comes after all the services it depends on (directly or not), cycles are broken arbitrarily
+    by_name = {service.service_name: service for service in services}
+    levels: Dict[str, int] = {}
+
+    def level(service_name: str, visiting: frozenset) -> int:
+        if service_name not in levels:
+            known = [name for name in dependencies(by_name[service_name]) if name in by_name and name not in visiting]
+            levels[service_name] = 1 + max((level(name, visiting | {service_name}) for name in known), default=-1)
+        return levels[service_name]
+
+    for service in services:
+        level(service.service_name, frozenset())
+    return levels
+
+
+def service_plan(service: "ComposeService", level: int) -> ServicePlan:
+    summary = service.summary()
+    if not service.config:
+        return ServicePlan(service.service_name, ORPHAN, "not in the compose file", level)
+    if summary.rollback:
+        return ServicePlan(service.service_name, BLOCKED, f"{len(summary.rollback)} rollback container(s)", level)
+    if not summary.total:
+        return ServicePlan(service.service_name, CREATE, "no container", level)
+    if summary.updatable:
+        return ServicePlan(service.service_name, RECREATE, f"{summary.updatable} container(s) out of sync", level)
+    return ServicePlan(service.service_name, UNCHANGED, "config hash matches", level)
+
+
+def plan(project: "ComposeProject") -> List[ServicePlan]:
+    levels = dependency_levels(project.services)
+    plans = [service_plan(service, levels[service.service_name]) for service in project.services]
+    return sorted(plans, key=lambda item: (item.level, item.service_name))
+
+
+def apply(project: "ComposeProject") -> List[ServicePlan]:
+    services = {service.service_name: service for service in project.services}
+    plans = {item.service_name: item for item in plan(project)}
+    failed = set()
+    for level in sorted({item.level for item in plans.values() if item.action in (CREATE, RECREATE)}):
+        level_plans = [item for item in plans.values() if item.level == level and item.action in (CREATE, RECREATE)]
+        runnable = []
+        for item in level_plans:
+            failed_dependencies = [name for name in dependencies(services[item.service_name]) if name in failed]
+            if failed_dependencies:
+                error = "dependency failed: " + ", ".join(failed_dependencies)
+                plans[item.service_name] = item._replace(result=SKIPPED, error=error)
+                failed.add(item.service_name)
+            else:
+                runnable.append(item)
+        if not runnable:
+            continue
+        # each task runs in a copy of the current context, so that the output sizes go to the recorded project action
+        with ThreadPoolExecutor(
+            max_workers=min(settings.APPLY_CONCURRENCY, len(runnable)), thread_name_prefix="apply"
+        ) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, apply_service, services[item.service_name], item)
+                for item in runnable
+            ]
+            for future in futures:
+                result = future.result()
+                plans[result.service_name] = result
+                if result.result == FAILED:
+                    failed.add(result.service_name)
+    return sorted(plans.values(), key=lambda item: (item.level, item.service_name))
+
+
+def apply_service(service: "ComposeService", item: ServicePlan) -> ServicePlan:
+    start = time.perf_counter()
+    try:
+        # pull and up --no-deps, docker compose recreates the containers whose configuration changed
+        service.up()
+        return item._replace(result=DONE, duration=time.perf_counter() - start)
+    except CalledProcessError as error:
+        output = error.output.decode() if isinstance(error.output, bytes) else str(error.output)
+        return item._replace(result=FAILED, duration=time.perf_counter() - start, error=output.strip())
@@ -0,0 +1,71 @@
+import copy
+from functools import wraps
+from threading import Event, Lock
+from typing import Callable, Dict, Hashable
+
+from control_center.apps.delegate.history import state_generation
+
+# Concurrent identical read calls (same function, same arguments) in one process share a single in-flight call:
+# the first caller runs it, the others wait for its result (or its exception) instead of querying docker again.
+# Results are only shared while the call is in flight, nothing is cached afterwards. A call never joins one started
+# before the last action ended (see history.state_generation): the state read after an action includes its changes.
+
+
+class _Call(object):
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    def __init__(self):
+        self._lock = Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._metrics: Dict[str, Dict[str, int]] = {}
+
+    def do(self, name: str, key: Hashable, function: Callable):
+        with self._lock:
+            metrics = self._metrics.setdefault(name, {"calls": 0, "coalesced": 0})
+            call = self._calls.get((name, key))
+            leader = call is None
+            if leader:
+                call = self._calls[(name, key)] = _Call()
+                metrics["calls"] += 1
+            else:
+                metrics["coalesced"] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = function()
+            return call.result
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[(name, key)]
+            call.done.set()
+
+    def metrics(self) -> Dict[str, Dict[str, int]]:
+        # calls actually made and calls that shared an in-flight one, per function
+        with self._lock:
+            return {name: dict(metrics) for name, metrics in self._metrics.items()}
+
+
+single_flight_group = SingleFlight()
+
+
+# decorator for read functions of the delegate module; lists are copied for each caller since they are shared (a
+# shallow copy keeps the attributes of list subclasses, see hosts.HostResults)
+def single_flight(function):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        key = (state_generation(), args, tuple(sorted(kwargs.items())))
+        result = single_flight_group.do(function.__name__, key, lambda: function(*args, **kwargs))
+        return copy.copy(result) if isinstance(result, list) else result
+
+    return wrapper
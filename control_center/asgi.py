@@ -0,0 +1,9 @@
+import os
+
+from django.core.asgi import get_asgi_application
+
+from control_center.startup import prepare
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "control_center.base_settings")
+
+application = prepare(get_asgi_application)
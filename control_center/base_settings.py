@@ -1,18 +1,15 @@
-import fnmatch
 import os
 from pathlib import Path
-from typing import Dict
+from typing import Optional
 
 
-def find_yml_files(path) -> Dict:
-    matches = {}
+def find_yml_file(path) -> Optional[str]:
+    # returns the first compose file found (top-down), without walking the rest of the tree
     for root, _, filenames in os.walk(path, followlinks=True):
-        for _ in set().union(
-            fnmatch.filter(filenames, "docker-compose.yml"), fnmatch.filter(filenames, "docker-compose.yaml")
-        ):
-            key = root.split("/")[-1]
-            matches[key] = os.path.join(os.path.join(os.getcwd(), root), _)
-    return matches
+        for filename in ("docker-compose.yml", "docker-compose.yaml"):
+            if filename in filenames:
+                return os.path.join(os.path.join(os.getcwd(), root), filename)
+    return None
 
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -26,6 +23,13 @@ SESSION_COOKIE_AGE = 2419200  # 2419200 seconds == 4 weeks
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 CSRF_COOKIE_AGE = None
 CSRF_USE_SESSIONS = False
+# Sessions are stored in the database. The SessionTimeout middleware only saves a session again when its expiry would
+# move by more than SESSION_REFRESH_THRESHOLD seconds. To avoid session writes to the database altogether, sessions
+# can be stored in signed cookies (they can't be revoked on the server then) or in a cache shared by all the workers
+# (the default cache is local to each process, CACHES has to be configured)
+SESSION_REFRESH_THRESHOLD = 600
+# SESSION_ENGINE = "django.contrib.sessions.backends.signed_cookies"
+# SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
 
 # Turned off to allow http to work
 SESSION_COOKIE_SECURE = False
@@ -51,7 +55,7 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     # "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.IsAuthenticated"],
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework.authentication.TokenAuthentication",
+        "control_center.libs.authentication.tokens.CachedTokenAuthentication",
         "rest_framework.authentication.SessionAuthentication",
     )
 }
@@ -146,10 +150,32 @@ STATIC_ROOT = "/control-center/config/static/"
 
 # Specify your list of LDAP authentication servers only if you choose to use LDAP authentication
 # LDAP_SERVERS = [{"url": "your.ldap.url", "domain": "YOUR_DOMAIN", "certificate": ""}]
+# (each server can also set its "port", 636 by default)
+
+# LDAP servers are tried concurrently, the first one accepting the credentials wins. Each server has LDAP_TIMEOUT
+# seconds to connect and to answer, and is skipped for LDAP_CIRCUIT_BREAKER_RESET seconds after
+# LDAP_CIRCUIT_BREAKER_FAILURES consecutive connection failures. At most LDAP_POOL_SIZE idle connections are kept open
+# per server, for LDAP_POOL_IDLE_TIME seconds
+LDAP_TIMEOUT = 5
+LDAP_CIRCUIT_BREAKER_FAILURES = 3
+LDAP_CIRCUIT_BREAKER_RESET = 30
+LDAP_POOL_SIZE = 4
+LDAP_POOL_IDLE_TIME = 300
+# Seconds a successful LDAP login is remembered (as a salted hash of the password) so that the next logins of the same
+# user don't reach the servers, 0 to disable (a password changed in the directory is accepted until then)
+LDAP_CREDENTIAL_CACHE_TTL = 0
+
+# API tokens with their user and permissions are cached by each process for TOKEN_CACHE_TTL seconds (0 to disable),
+# at most TOKEN_CACHE_SIZE of them. Changes made by the same process are applied right away, by other processes after
+# TOKEN_CACHE_TTL
+TOKEN_CACHE_TTL = 60
+TOKEN_CACHE_SIZE = 1000
+# Same for the users authenticated by HTTPHeaderAuthenticationMiddleware (header value: user)
+HEADER_AUTHENTICATION_CACHE_TTL = 60
+HEADER_AUTHENTICATION_CACHE_SIZE = 1000
 
 # Control Center specific variables
-compose_files = find_yml_files(os.path.join(BASE_DIR, "compose"))
-YML_PATH = os.getenv("DOCKER_COMPOSE_YML_PATH") or (next(iter(compose_files.values())) if compose_files else None)
+YML_PATH = os.getenv("DOCKER_COMPOSE_YML_PATH") or find_yml_file(os.path.join(BASE_DIR, "compose"))
 
 COMPOSE_PROJECT = Path(YML_PATH).parent.name if YML_PATH else None
 # when set, this will remove the DOCKER_STRIP_CUSTOM_REGISTRY string from container image names
@@ -168,6 +194,71 @@ WINDOWS_HOST = False
 # Extra docker-compose config file (for icons and URLs)
 EXTRA_COMPOSE_CONFIG = os.path.join(Path(YML_PATH).parent, "docker-compose.ini") if YML_PATH else None
 
+# Service logos kept in memory (number of files) and how long browsers may cache them (in seconds)
+LOGO_CACHE_SIZE = 64
+LOGO_CACHE_MAX_AGE = 86400
+
+# Default and maximum number of items per page of the inventory API (/api/inventory/...)
+INVENTORY_PAGE_SIZE = 100
+INVENTORY_MAX_PAGE_SIZE = 1000
+
+# Action history: records are written in batches (at most every interval in seconds), duration statistics cover
+# the last ACTION_HISTORY_STATS_DAYS days
+ACTION_HISTORY_FLUSH_INTERVAL = 1
+ACTION_HISTORY_BATCH_SIZE = 100
+ACTION_HISTORY_STATS_DAYS = 30
+
+# Maximum number of concurrent image removals during a cleanup (dangling images left by the daemon prune)
+IMAGE_CLEANUP_CONCURRENCY = 8
+
+# Maximum number of services brought up at once when applying compose file changes (services of a dependency level)
+APPLY_CONCURRENCY = 4
+
+# Maximum age in seconds of the cached drift report (it is also computed again after any action or compose file edit)
+DRIFT_MAX_AGE = 60
+
+# Disk usage of the docker system page, computed in the background: maximum age of each category in seconds
+DISK_USAGE_MAX_AGE = {"containers": 300, "images": 300, "build-cache": 3600, "volumes": 3600}
+
+# Logs: maximum number of lines requested ("all" included), maximum size in bytes kept (the most recent lines, older
+# ones are replaced by a truncation marker) and number of log requests (followed logs included) each user can have in
+# progress in a process
+LOGS_MAX_LINES = 10000
+LOGS_MAX_BYTES = 5 * 1024 * 1024
+LOGS_MAX_CONCURRENT_PER_USER = 3
+
+# Other docker hosts whose containers are listed with the ones of the local host (the daemon of the environment,
+# named LOCAL_DOCKER_HOST). Each host is a base url or the keyword arguments of docker.DockerClient, for example
+# DOCKER_HOSTS = {"build": "unix:///var/run/docker-build.sock", "web1": {"base_url": "tcp://web1:2376", "tls": True}}
+# The managed project, the docker system page and the drift report only cover the local host
+DOCKER_HOSTS = {}
+LOCAL_DOCKER_HOST = "local"
+# Hosts are listed concurrently: a host answering after DOCKER_HOST_TIMEOUT seconds or failing is left out of the
+# page or API listing, and is skipped for DOCKER_HOST_CIRCUIT_BREAKER_RESET seconds after
+# DOCKER_HOST_CIRCUIT_BREAKER_FAILURES consecutive failures
+DOCKER_HOST_TIMEOUT = 5
+DOCKER_HOST_CIRCUIT_BREAKER_FAILURES = 3
+DOCKER_HOST_CIRCUIT_BREAKER_RESET = 30
+
+# Agent mode: an agent (python manage.py dcc_agent) runs beside a docker daemon and pushes the state of its containers
+# to a central instance, which lists them without querying the daemon.
+# Central instance: accepts the pushed states (from users with the "Can push the state of a docker host" permission),
+# a host whose agent hasn't pushed for AGENT_STALE_AFTER seconds is shown as unavailable (or listed by its daemon when
+# it is also in DOCKER_HOSTS). Pushes are limited to AGENT_MAX_PUSH_BYTES once decompressed
+AGENT_PUSH_ENABLED = False
+AGENT_STALE_AFTER = 60
+AGENT_MAX_PUSH_BYTES = 16 * 1024 * 1024
+# Agent: url of the central instance, API token and name of the host (the host name by default). The events of
+# AGENT_PUSH_INTERVAL seconds are pushed together, a push is sent at least every AGENT_HEARTBEAT_INTERVAL seconds and
+# the full state every AGENT_RESYNC_INTERVAL seconds
+AGENT_CENTRAL_URL = None
+AGENT_TOKEN = None
+AGENT_HOST_NAME = None
+AGENT_PUSH_INTERVAL = 2
+AGENT_HEARTBEAT_INTERVAL = 20
+AGENT_RESYNC_INTERVAL = 600
+AGENT_PUSH_TIMEOUT = 10
+
 # Title for the header and page title
 SITE_TITLE = "Docker Control Center"
 
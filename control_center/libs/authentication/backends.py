@@ -1,14 +1,13 @@
-from _ssl import CERT_REQUIRED, PROTOCOL_TLSv1_2
 from base64 import b64decode
-from logging import exception, getLogger
+from logging import getLogger
 
 from django.conf import settings
 from django.contrib.auth.backends import ModelBackend, RemoteUserBackend
 from django.contrib.auth.models import User
 from django.utils.decorators import method_decorator
 from django.views.decorators.debug import sensitive_post_parameters
-from ldap3 import AUTO_BIND_TLS_BEFORE_BIND, Connection, SIMPLE, Server, Tls
-from ldap3.core.exceptions import LDAPBindError, LDAPExceptionError
+
+from control_center.libs.authentication.ldap_servers import ldap_authenticate
 
 logger = getLogger(__name__)
 
@@ -98,27 +97,18 @@ class LDAPAuthenticationBackend(ModelBackend):
             )
             return None
 
-        for server in settings.LDAP_SERVERS:
-            try:
-                t = Tls(validate=CERT_REQUIRED, version=PROTOCOL_TLSv1_2, ca_certs_file=server["certificate"])
-                s = Server(server["url"], port=636, use_ssl=True, tls=t)
-                c = Connection(
-                    s,
-                    user="{}\\{}".format(server["domain"], username),
-                    password=password,
-                    auto_bind=AUTO_BIND_TLS_BEFORE_BIND,
-                    authentication=SIMPLE,
-                )
-                c.unbind()
-                # At this point the user successfully authenticated to at least one LDAP server.
-                return user
-            except LDAPBindError as e:
-                logger.warning(
-                    f"User {username} attempted to authenticate with LDAP, but entered an incorrect password. The user was denied access."
-                )
-                # When this error is caught it means the username and password were invalid against the LDAP server.
-            except LDAPExceptionError as e:
-                exception(e)
+        # The servers are tried concurrently, the first one accepting the credentials wins.
+        authenticated = ldap_authenticate(username, password)
+        if authenticated:
+            return user
+        if authenticated is False:
+            logger.warning(
+                f"User {username} attempted to authenticate with LDAP, but entered an incorrect password. The user was denied access."
+            )
+        else:
+            logger.error(
+                f"User {username} attempted to authenticate with LDAP, but none of the LDAP servers could be reached. The user was denied access."
+            )
 
         # The user did not successfully authenticate to any of the LDAP servers.
         return None
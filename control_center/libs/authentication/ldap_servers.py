@@ -0,0 +1,171 @@
+import hashlib
+import hmac
+import os
+import time
+from _ssl import CERT_REQUIRED, PROTOCOL_TLSv1_2
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from logging import getLogger
+from threading import Lock
+from typing import Deque, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from ldap3 import NONE, SIMPLE, Connection, Server, Tls
+from ldap3.core.exceptions import LDAPExceptionError
+
+from control_center.libs.circuit_breaker import CircuitBreaker
+
+# LDAP binds of the LDAPAuthenticationBackend. All the servers of LDAP_SERVERS are tried at once and the first one
+# accepting the credentials wins, so that a slow or dead server doesn't hold back the login. Each server keeps a few
+# idle connections (a new bind on an open connection saves the TCP and TLS handshakes), connects and answers within
+# LDAP_TIMEOUT seconds and is skipped by a circuit breaker after repeated connection failures.
+
+logger = getLogger(__name__)
+
+LDAPS_PORT = 636
+# iterations of the salted hash of the cached credentials
+CREDENTIAL_HASH_ITERATIONS = 100000
+
+
+class LDAPServer(object):
+    def __init__(self, url: str, port: int, certificate: Optional[str]):
+        self.name = f"{url}:{port}"
+        tls = Tls(validate=CERT_REQUIRED, version=PROTOCOL_TLSv1_2, ca_certs_file=certificate)
+        # server information (schema...) isn't needed to check credentials, and reading it takes several round trips
+        self.server = Server(
+            url, port=port, use_ssl=True, tls=tls, get_info=NONE, connect_timeout=settings.LDAP_TIMEOUT
+        )
+        self.breaker = CircuitBreaker(settings.LDAP_CIRCUIT_BREAKER_FAILURES, settings.LDAP_CIRCUIT_BREAKER_RESET)
+        self._lock = Lock()
+        # (connection, last use), the most recently used last
+        self._idle: Deque[Tuple[Connection, float]] = deque()
+
+    def bind(self, user: str, password: str) -> bool:
+        # True when the credentials are accepted, False when they are refused, LDAPExceptionError when the server
+        # can't be reached
+        connection = self._take()
+        if connection is not None:
+            try:
+                return self._bind(connection, user, password)
+            except LDAPExceptionError:
+                # the server may have closed the idle connection, try again on a new one
+                pass
+        # ldap3 remembers the addresses that failed, the circuit breaker already decided that this server is tried
+        self.server.reset_availability()
+        connection = Connection(self.server, receive_timeout=settings.LDAP_TIMEOUT)
+        connection.open()
+        return self._bind(connection, user, password)
+
+    def _bind(self, connection: Connection, user: str, password: str) -> bool:
+        try:
+            accepted = connection.rebind(user=user, password=password, authentication=SIMPLE, read_server_info=False)
+        except LDAPExceptionError:
+            close(connection)
+            raise
+        self._release(connection)
+        return bool(accepted)
+
+    def _take(self) -> Optional[Connection]:
+        with self._lock:
+            while self._idle:
+                connection, last_use = self._idle.pop()
+                if time.monotonic() - last_use <= settings.LDAP_POOL_IDLE_TIME and not connection.closed:
+                    return connection
+                close(connection)
+        return None
+
+    def _release(self, connection: Connection):
+        with self._lock:
+            if len(self._idle) < settings.LDAP_POOL_SIZE:
+                self._idle.append((connection, time.monotonic()))
+                return
+        close(connection)
+
+
+def close(connection: Connection):
+    try:
+        connection.unbind()
+    except Exception:
+        pass
+
+
+class CredentialCache(object):
+    # successful logins remembered for LDAP_CREDENTIAL_CACHE_TTL seconds, as a salted hash of the password
+    def __init__(self):
+        self._lock = Lock()
+        # username: (salt, hash, expiry)
+        self._entries: Dict[str, Tuple[bytes, bytes, float]] = {}
+
+    @staticmethod
+    def _hash(password: str, salt: bytes) -> bytes:
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, CREDENTIAL_HASH_ITERATIONS)
+
+    def check(self, username: str, password: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(username)
+        if entry is None or entry[2] < time.monotonic():
+            return False
+        return hmac.compare_digest(self._hash(password, entry[0]), entry[1])
+
+    def add(self, username: str, password: str):
+        salt = os.urandom(16)
+        entry = (salt, self._hash(password, salt), time.monotonic() + settings.LDAP_CREDENTIAL_CACHE_TTL)
+        with self._lock:
+            now = time.monotonic()
+            self._entries = {name: cached for name, cached in self._entries.items() if cached[2] >= now}
+            self._entries[username] = entry
+
+
+credential_cache = CredentialCache()
+
+_servers_lock = Lock()
+_servers: Dict[Tuple[str, int, Optional[str]], LDAPServer] = {}
+
+
+def ldap_servers() -> List[Tuple[Dict, LDAPServer]]:
+    servers = []
+    with _servers_lock:
+        for config in settings.LDAP_SERVERS:
+            key = (config["url"], config.get("port", LDAPS_PORT), config.get("certificate") or None)
+            if key not in _servers:
+                _servers[key] = LDAPServer(*key)
+            servers.append((config, _servers[key]))
+    return servers
+
+
+def bind_server(config: Dict, server: LDAPServer, username: str, password: str) -> bool:
+    try:
+        accepted = server.bind("{}\\{}".format(config["domain"], username), password)
+    except LDAPExceptionError as e:
+        server.breaker.failure()
+        logger.warning(f"LDAP server {server.name} could not be reached: {e}")
+        raise
+    server.breaker.success()
+    return accepted
+
+
+def ldap_authenticate(username: str, password: str) -> Optional[bool]:
+    # True when a server accepted the credentials, False when they were refused, None when no server could be reached
+    if settings.LDAP_CREDENTIAL_CACHE_TTL and credential_cache.check(username, password):
+        return True
+    servers = [(config, server) for config, server in ldap_servers() if server.breaker.allow()]
+    if not servers:
+        return None
+    refused = False
+    executor = ThreadPoolExecutor(max_workers=len(servers), thread_name_prefix="ldap")
+    try:
+        pending = {executor.submit(bind_server, config, server, username, password) for config, server in servers}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    continue
+                if future.result():
+                    if settings.LDAP_CREDENTIAL_CACHE_TTL:
+                        credential_cache.add(username, password)
+                    return True
+                refused = True
+    finally:
+        # the binds still running finish in the background (within LDAP_TIMEOUT)
+        executor.shutdown(wait=False)
+    return False if refused else None
@@ -1,11 +1,80 @@
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.contrib import auth
 from django.contrib.auth.middleware import RemoteUserMiddleware
 from django.http import HttpResponseForbidden
 
+from control_center.libs.authentication.user_cache import UserCache
+from control_center.libs.decorators.view_decorators import is_ajax
+
+SESSION_REFRESHED_AT_KEY = "_session_refreshed_at"
+
+# header value (hashed): user, so that header authenticated requests don't load the session and the user
+header_user_cache = UserCache("HEADER_AUTHENTICATION_CACHE_TTL", "HEADER_AUTHENTICATION_CACHE_SIZE")
+
 
 class HTTPHeaderAuthenticationMiddleware(RemoteUserMiddleware):
     header = "HTTP_" + getattr(settings, "AUTHENTICATION_HEADER", "AUTHORIZATION")
 
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        value = request.META.get(self.header)
+        if not value or not header_user_cache.enabled:
+            return super().__call__(request)
+        key = hashlib.sha256(value.encode()).hexdigest()
+        cached = header_user_cache.get(key)
+        if cached is not None:
+            set_user(request, cached[0])
+            return self.get_response(request)
+        # as RemoteUserMiddleware: the session user if it matches the header, otherwise authenticates and logs in
+        user = request.user
+        if not user.is_authenticated or user.get_username() != self.clean_username(value, request):
+            if user.is_authenticated:
+                self._remove_invalid_user(request)
+            user = auth.authenticate(request, remote_user=value)
+            if user:
+                request.user = user
+                auth.login(request, user)
+        if user:
+            set_user(request, header_user_cache.add(key, user))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        # RemoteUserMiddleware prefixes the header with HTTP_ again when running asynchronously
+        value = request.META.get(self.header)
+        if not value:
+            return await super().__acall__(request)
+        key = hashlib.sha256(value.encode()).hexdigest()
+        cached = header_user_cache.get(key) if header_user_cache.enabled else None
+        if cached is not None:
+            set_user(request, cached[0])
+            return await self.get_response(request)
+        user = await request.auser()
+        username = await sync_to_async(self.clean_username)(value, request) if user.is_authenticated else None
+        if not user.is_authenticated or user.get_username() != username:
+            if user.is_authenticated:
+                await self._aremove_invalid_user(request)
+            user = await auth.aauthenticate(request, remote_user=value)
+            if user:
+                await auth.alogin(request, user)
+        if user:
+            if header_user_cache.enabled:
+                user = await sync_to_async(header_user_cache.add)(key, user)
+            set_user(request, user)
+        return await self.get_response(request)
+
+
+def set_user(request, user):
+    async def auser():
+        return user
+
+    request.user = user
+    request.auser = auser
+
 
 class SessionTimeout:
     def __init__(self, get_response):
@@ -33,9 +102,18 @@ class SessionTimeout:
         # If the request is normal (instead of AJAX) and the user's session has expired
         # then the @login_required decorator will redirect them to the login page.
         if not request.user.is_authenticated:
-            return HttpResponseForbidden() if request.is_ajax() else None
+            return HttpResponseForbidden() if is_ajax(request) else None
 
         # If the view is regularly polled by the webpage to update information then expiry refresh should be disabled.
         refresh_disabled = getattr(view_function, "disable_session_expiry_refresh", False)
         if not refresh_disabled:
-            request.session.modified = True
+            refresh_session_expiry(request.session)
+
+
+def refresh_session_expiry(session):
+    # saving the session moves its expiry, it is only saved when the expiry would move by more than
+    # SESSION_REFRESH_THRESHOLD seconds instead of on every request
+    now = int(time.time())
+    refreshed_at = session.get(SESSION_REFRESHED_AT_KEY)
+    if refreshed_at is None or now - refreshed_at >= settings.SESSION_REFRESH_THRESHOLD:
+        session[SESSION_REFRESHED_AT_KEY] = now
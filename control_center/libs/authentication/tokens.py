@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from control_center.libs.authentication.user_cache import UserCache
+
+# Token authentication of the API with a per process cache of token: (user, token), so that scripts polling the API
+# don't query the database for the token, the user and its permissions on every call (see user_cache).
+token_cache = UserCache("TOKEN_CACHE_TTL", "TOKEN_CACHE_SIZE")
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        if not token_cache.enabled:
+            return super().authenticate_credentials(key)
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        return token_cache.add(key, user, token), token
+
+
+@receiver([post_save, post_delete], sender=Token)
+def token_changed(sender, instance: Token, **kwargs):
+    token_cache.discard(instance.key)
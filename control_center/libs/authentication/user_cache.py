@@ -0,0 +1,96 @@
+import copy
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission, User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+# Per process caches of credential (API token, authentication header): (user with its permissions loaded, value), so
+# that authenticating a request doesn't query the database for the user and its permissions.
+# Entries expire after a TTL, the least recently used are dropped past a maximum size, and they are dropped when the
+# user, its groups or permissions are changed by this process (changes made by other processes are seen once the
+# entry expires).
+
+
+class UserCache(object):
+    def __init__(self, ttl_setting: str, size_setting: str):
+        self.ttl_setting = ttl_setting
+        self.size_setting = size_setting
+        self._lock = Lock()
+        # key: (user, value, expiry)
+        self._entries: "OrderedDict[str, Tuple[User, Any, float]]" = OrderedDict()
+        user_caches.append(self)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(getattr(settings, self.ttl_setting))
+
+    def get(self, key: str) -> Optional[Tuple[User, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        # each request gets its own user object
+        return copy.copy(entry[0]), entry[1]
+
+    def add(self, key: str, user: User, value: Any = None) -> User:
+        # a copy of the request user (or of the lazy object wrapping it) with the permissions of the user and of its
+        # groups loaded once, has_perm then uses them
+        user = copy.copy(user)
+        user.get_all_permissions()
+        with self._lock:
+            self._entries[key] = (user, value, time.monotonic() + getattr(settings, self.ttl_setting))
+            self._entries.move_to_end(key)
+            while len(self._entries) > getattr(settings, self.size_setting):
+                self._entries.popitem(last=False)
+        return copy.copy(user)
+
+    def discard(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def discard_user(self, user_id: int):
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry[0].pk == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_caches: List[UserCache] = []
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance: User, **kwargs):
+    for cache in user_caches:
+        cache.discard_user(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def user_relation_changed(sender, instance, **kwargs):
+    for cache in user_caches:
+        # instance is the group or the permission when the relation is changed from the other side
+        if isinstance(instance, User):
+            cache.discard_user(instance.pk)
+        else:
+            cache.clear()
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver([post_save, post_delete], sender=Group)
+@receiver([post_save, post_delete], sender=Permission)
+def permissions_changed(sender, **kwargs):
+    # superusers have all the permissions, and a group may have many users
+    for cache in user_caches:
+        cache.clear()
@@ -0,0 +1,40 @@
+import time
+from threading import Lock
+
+# Closed, calls go through. After `failures` consecutive failures the breaker opens and calls are refused for `reset`
+# seconds, then a single trial call is let through (half open): a success closes the breaker, a failure opens it again.
+
+
+class CircuitBreaker(object):
+    def __init__(self, failures: int, reset: float):
+        self.failures = failures
+        self.reset = reset
+        self._lock = Lock()
+        self._consecutive_failures = 0
+        self._retry_at = 0.0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._consecutive_failures < self.failures:
+                return True
+            now = time.monotonic()
+            if now < self._retry_at:
+                return False
+            # half open: the calls made while the trial is running wait for another period
+            self._retry_at = now + self.reset
+            return True
+
+    def success(self):
+        with self._lock:
+            self._consecutive_failures = 0
+
+    def failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self.failures:
+                self._retry_at = time.monotonic() + self.reset
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._consecutive_failures >= self.failures and time.monotonic() < self._retry_at
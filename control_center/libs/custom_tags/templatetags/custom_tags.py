@@ -1,4 +1,8 @@
+from django.conf import settings
 from django.template.defaulttags import register
+from django.urls import reverse
+
+from control_center.apps.delegate import hosts
 
 
 @register.filter()
@@ -7,3 +11,22 @@ def get(array, item):
         return array[item]
     except:
         return None
+
+
+# the host column is only shown when several docker hosts are configured or agents push the state of their host
+@register.simple_tag()
+def several_docker_hosts() -> bool:
+    return hosts.several_hosts() or settings.AGENT_PUSH_ENABLED
+
+
+@register.filter()
+def reachable_host(container) -> bool:
+    return hosts.is_reachable(container.host)
+
+
+# url of a container view, the containers of other hosts are addressed by host name and id
+@register.simple_tag()
+def container_url(url_name: str, container) -> str:
+    if container.is_local:
+        return reverse(url_name, args=[container.id])
+    return reverse(url_name, args=[container.host, container.id])
@@ -1,18 +1,134 @@
 # checks permission from function argument (app_label_arg_name)
 # i.e. checks user.has_perm(${app_label}.perm_code)
+from threading import Lock
+from typing import Dict
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
 from django.contrib.auth.models import User
 
 
 def view_has_perm_from_arg(app_label_arg_name: str, perm_code: str, unauthorized_function):
     def decorator(view):
+        if iscoroutinefunction(view):
+
+            async def async_wrapper(request, *args, **kwargs):
+                app_label_arg = kwargs.get(app_label_arg_name)
+                user: User = await request.auser()
+                if await user.ahas_perm(app_label_arg + "." + perm_code):
+                    return await view(request, *args, **kwargs)
+                else:
+                    return unauthorized_function()
+
+            return async_wrapper
+
         def wrapper(request, *args, **kwargs):
             app_label_arg = kwargs.get(app_label_arg_name)
             user: User = request.user
             if user.has_perm(app_label_arg + "." + perm_code):
                 return view(request, *args, **kwargs)
             else:
-                unauthorized_function()
+                return unauthorized_function()
 
         return wrapper
 
     return decorator
+
+
+# replaces HttpRequest.is_ajax(), removed in Django 4
+def is_ajax(request) -> bool:
+    return request.headers.get("x-requested-with") == "XMLHttpRequest"
+
+
+# for views regularly polled by pages or scripts, which shouldn't extend the session (see SessionTimeout)
+# applied last (above api_view and the decorators not using functools.wraps)
+def disable_session_expiry_refresh(view):
+    view.disable_session_expiry_refresh = True
+    return view
+
+
+# number of requests each user can have in progress at once in this process, from a setting
+class PerUserLimit(object):
+    def __init__(self, setting_name: str):
+        self.setting_name = setting_name
+        self._lock = Lock()
+        self._in_progress: Dict[int, int] = {}
+
+    @property
+    def limit(self) -> int:
+        return getattr(settings, self.setting_name)
+
+    def acquire(self, user_id: int) -> bool:
+        with self._lock:
+            if self._in_progress.get(user_id, 0) >= self.limit:
+                return False
+            self._in_progress[user_id] = self._in_progress.get(user_id, 0) + 1
+            return True
+
+    def release(self, user_id: int):
+        with self._lock:
+            self._in_progress[user_id] -= 1
+            if not self._in_progress[user_id]:
+                del self._in_progress[user_id]
+
+
+# rejects the request with rejected_function(limit) when the user has too many requests in progress
+# streaming responses hold their slot until the stream ends
+def view_limit_per_user(limit: PerUserLimit, rejected_function):
+    def decorator(view):
+        if iscoroutinefunction(view):
+
+            async def async_wrapper(request, *args, **kwargs):
+                user: User = await request.auser()
+                if not limit.acquire(user.pk):
+                    return rejected_function(limit)
+                try:
+                    response = await view(request, *args, **kwargs)
+                except BaseException:
+                    limit.release(user.pk)
+                    raise
+                return release_after_response(response, limit, user.pk)
+
+            return async_wrapper
+
+        def wrapper(request, *args, **kwargs):
+            user: User = request.user
+            if not limit.acquire(user.pk):
+                return rejected_function(limit)
+            try:
+                response = view(request, *args, **kwargs)
+            except BaseException:
+                limit.release(user.pk)
+                raise
+            return release_after_response(response, limit, user.pk)
+
+        return wrapper
+
+    return decorator
+
+
+def release_after_response(response, limit: PerUserLimit, user_id: int):
+    if not getattr(response, "streaming", False):
+        limit.release(user_id)
+        return response
+    content = response.streaming_content
+    if response.is_async:
+
+        async def async_content():
+            try:
+                async for part in content:
+                    yield part
+            finally:
+                limit.release(user_id)
+
+        response.streaming_content = async_content()
+    else:
+
+        def sync_content():
+            try:
+                yield from content
+            finally:
+                limit.release(user_id)
+
+        response.streaming_content = sync_content()
+    return response
@@ -0,0 +1,42 @@
+from logging import getLogger
+from time import perf_counter
+from typing import Callable, Dict
+
+logger = getLogger("control_center")
+
+# seconds spent in each startup step of this process, filled by prepare()
+startup_report: Dict[str, float] = {}
+
+
+def prepare(get_application: Callable):
+    """
+    Creates the WSGI/ASGI application and does the work every worker would otherwise pay on its first request:
+    docker login, url configuration import and compose config resolution (subprocesses and permission sync).
+    With gunicorn's preload_app this runs once in the master and the result is shared with the forked workers.
+    """
+    start = perf_counter()
+    application = timed("django setup", get_application)
+    # imported after django setup
+    from django.db import connections
+    from django.urls import get_resolver
+    from control_center.apps.delegate import docker
+
+    timed("url configuration", lambda: get_resolver().url_patterns)
+    for step, warm_up in [("docker login", docker.docker_login), ("compose configuration", docker.compose_config)]:
+        try:
+            timed(step, warm_up)
+        except (Exception, SystemExit):
+            # don't prevent the server from starting, the step is retried on first use
+            logger.exception(f"startup: {step} failed")
+    # workers must not share the database connection opened by the permission sync
+    connections.close_all()
+    startup_report["total"] = perf_counter() - start
+    logger.info("startup: " + ", ".join(f"{step} {duration:.2f}s" for step, duration in startup_report.items()))
+    return application
+
+
+def timed(step: str, function: Callable):
+    start = perf_counter()
+    result = function()
+    startup_report[step] = perf_counter() - start
+    return result
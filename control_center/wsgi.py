@@ -2,6 +2,8 @@ import os
 
 from django.core.wsgi import get_wsgi_application
 
+from control_center.startup import prepare
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "control_center.base_settings")
 
-application = get_wsgi_application()
+application = prepare(get_wsgi_application)
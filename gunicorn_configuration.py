@@ -1,3 +1,5 @@
 bind = "0.0.0.0:8000"
 capture_output = True
 timeout = 240
+# load the application (docker login, compose config, permissions) once in the master before forking workers
+preload_app = True
@@ -6,7 +6,7 @@ setup(
     name="docker_compose_control_center",
     version=VERSION,
     python_requires=">=3.14",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "benchmarks.*"]),
     include_package_data=True,
     url="https://github.com/usnistgov/docker-control-center",
     license="Public domain",
@@ -38,4 +38,8 @@ setup(
         "python-dateutil==2.8.2",
         "djangorestframework==3.16.1",
     ],
+    extras_require={
+        # ASGI deployment: gunicorn --worker-class uvicorn_worker.UvicornWorker control_center.asgi:application
+        "asgi": ["uvicorn==0.38.0", "uvicorn-worker==0.4.0"],
+    },
 )
@@ -14,5 +14,9 @@ django-admin migrate
 # Collect static files
 django-admin collectstatic --no-input --clear
 
-# Run Control Center
-gunicorn --config=/etc/gunicorn_configuration.py control_center.wsgi:application
\ No newline at end of file
+# Run Control Center (set ASGI=true to serve the async views and live log streams)
+if [[ "${ASGI}" == "true" ]]; then
+    gunicorn --config=/etc/gunicorn_configuration.py --worker-class=uvicorn_worker.UvicornWorker control_center.asgi:application
+else
+    gunicorn --config=/etc/gunicorn_configuration.py control_center.wsgi:application
+fi
\ No newline at end of file